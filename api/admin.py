@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Todo, Session, Segment
+from .models import Todo, Session, Segment, DailyRollup, ActiveDay, SegmentRollup, TodoTag, AccountDeletion, SegmentArchive
+from .search import search_todos
 
 @admin.register(Todo)
 class TodoAdmin(admin.ModelAdmin):
@@ -7,6 +8,12 @@ class TodoAdmin(admin.ModelAdmin):
     list_filter = ('priority', 'completed_at')
     search_fields = ('title', 'description')
 
+    def get_search_results(self, request, queryset, search_term):
+        # The text index instead of icontains scans over every todo
+        if not search_term.strip():
+            return queryset, False
+        return search_todos(queryset, search_term), False
+
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
     list_display = ('todo', 'user', 'status', 'created_at')
@@ -16,3 +23,38 @@ class SessionAdmin(admin.ModelAdmin):
 class SegmentAdmin(admin.ModelAdmin):
     list_display = ('session', 'mode', 'reason', 'start_at', 'end_at')
     list_filter = ('mode', 'reason', 'start_at')
+
+@admin.register(DailyRollup)
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'focus_time', 'pause_time', 'break_time', 'segment_count')
+    list_filter = ('day',)
+
+@admin.register(ActiveDay)
+class ActiveDayAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day')
+    list_filter = ('day',)
+
+@admin.register(SegmentRollup)
+class SegmentRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'todo', 'mode', 'reason', 'duration', 'segment_count')
+    list_filter = ('mode', 'reason', 'day')
+
+@admin.register(TodoTag)
+class TodoTagAdmin(admin.ModelAdmin):
+    list_display = ('user', 'name', 'todo')
+    search_fields = ('name',)
+
+@admin.register(AccountDeletion)
+class AccountDeletionAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'requested_at', 'finished_at', 'deleted_rows')
+    list_filter = ('finished_at',)
+    # user_id rather than user: the user row is gone once the deletion finishes
+    fields = readonly_fields = ('user_id', 'requested_at', 'finished_at', 'deleted_rows')
+
+@admin.register(SegmentArchive)
+class SegmentArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'month', 'session_count', 'segment_count', 'updated_at')
+    list_filter = ('month',)
+    # The packed data is only meaningful to api.archive
+    exclude = ('data',)
+    readonly_fields = ('user', 'month', 'session_count', 'segment_count', 'updated_at')
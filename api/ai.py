@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+import httpx
+from django.conf import settings
+from rest_framework import status
+
+
+class AIError(Exception):
+    """A provider call that failed; views return it as ``{"error": message}``."""
+
+    def __init__(self, message, status_code=status.HTTP_502_BAD_GATEWAY):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class ResponseCache:
+    """The ``maxsize`` most recently used answers, each kept for ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = ResponseCache(settings.AI_CACHE_SIZE, settings.AI_CACHE_TTL)
+_in_flight = Counter()
+_in_flight_lock = threading.Lock()
+_client = _client_loop = None
+
+
+def get_client():
+    """
+    The shared AsyncClient, whose connection pool is reused across requests.
+    A client belongs to the event loop it was first used on, so a new one is
+    made when called from another loop (tests, async_to_sync).
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.AI_TIMEOUT_SECONDS, connect=settings.AI_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=settings.AI_MAX_CONNECTIONS),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client():
+    global _client
+    client, _client = _client, None
+    # A client left over from a finished loop cannot be closed from this one
+    if client is not None and _client_loop is asyncio.get_running_loop():
+        await client.aclose()
+
+
+class _UserSlot:
+    """Holds one of the user's AI_USER_CONCURRENCY slots, or fails with 429."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    async def __aenter__(self):
+        with _in_flight_lock:
+            if _in_flight[self.user_id] >= settings.AI_USER_CONCURRENCY:
+                raise AIError("Too many AI requests in progress", status.HTTP_429_TOO_MANY_REQUESTS)
+            _in_flight[self.user_id] += 1
+
+    async def __aexit__(self, *exc_info):
+        with _in_flight_lock:
+            _in_flight[self.user_id] -= 1
+            if not _in_flight[self.user_id]:
+                del _in_flight[self.user_id]
+
+
+def provider_request(profile, messages):
+    """The provider name, URL, headers and JSON body for a chat completion."""
+    if profile.ai_provider == 'groq':
+        if not profile.groq_api_key:
+            raise AIError("Set a Groq API key in your settings", status.HTTP_400_BAD_REQUEST)
+        return 'groq', f"{settings.AI_GROQ_URL.rstrip('/')}/chat/completions", {
+            'Authorization': f'Bearer {profile.groq_api_key}',
+        }, {
+            'model': profile.groq_model, 'messages': messages, 'temperature': 0,
+            'response_format': {'type': 'json_object'},
+        }
+    return 'ollama', f"{profile.ollama_url.rstrip('/')}/api/chat", {}, {
+        'model': profile.ollama_model, 'messages': messages, 'stream': False, 'format': 'json',
+        'options': {'temperature': 0},
+    }
+
+
+def check_ollama_url(url):
+    """
+    Fail unless ``url`` is http(s) and every address its host resolves to is
+    public. Loopback, private and link-local hosts need AI_ALLOW_PRIVATE_OLLAMA,
+    so a user's URL cannot reach the server's own network. Returns the checked
+    address to connect to, or None when private hosts are allowed.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        parts = port = None
+    if parts is None or parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise AIError("The Ollama URL must be an http or https URL", status.HTTP_400_BAD_REQUEST)
+    if settings.AI_ALLOW_PRIVATE_OLLAMA:
+        return None
+    try:
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        raise AIError("The Ollama host could not be resolved", status.HTTP_400_BAD_REQUEST)
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    for address in addresses:
+        address = ipaddress.ip_address(address)
+        address = getattr(address, 'ipv4_mapped', None) or address
+        if not address.is_global or address.is_multicast:
+            raise AIError("The Ollama URL must point to a public address", status.HTTP_400_BAD_REQUEST)
+    return addresses[0]
+
+
+def pin_address(url, address):
+    """
+    ``url`` with its host replaced by the checked ``address``, and the Host
+    header and request extensions that keep the original name for HTTP and
+    TLS. Connecting to the name again would resolve it again, and a host that
+    rebinds could then point somewhere private.
+    """
+    parts = urlsplit(url)
+    host = f'[{address}]' if ':' in address else address
+    netloc = f'{host}:{parts.port}' if parts.port else host
+    return (
+        urlunsplit(parts._replace(netloc=netloc)),
+        {'Host': parts.netloc.rpartition('@')[2]},
+        {'sni_hostname': parts.hostname},
+    )
+
+
+def _content(provider, data):
+    if provider == 'groq':
+        return data['choices'][0]['message']['content']
+    return data['message']['content']
+
+
+async def complete(profile, messages):
+    """
+    Send chat ``messages`` to the profile's provider and return
+    ``(content, cached)``. Identical prompts to the same provider and model
+    are answered from the cache; the API key is not part of the cache key.
+    Answers from a user's own Ollama are only cached for that user.
+    """
+    provider, url, headers, body = provider_request(profile, messages)
+    owner = profile.user_id if provider == 'ollama' else None
+    key = hashlib.sha256(json.dumps([owner, url, body], sort_keys=True).encode()).hexdigest()
+    content = cache.get(key)
+    if content is not None:
+        return content, True
+
+    async with _UserSlot(profile.user_id):
+        extensions = {}
+        if provider == 'ollama':
+            # Checked on every call: the host may resolve elsewhere since it was saved
+            address = await asyncio.to_thread(check_ollama_url, url)
+            if address is not None:
+                url, host, extensions = pin_address(url, address)
+                headers = {**headers, **host}
+        try:
+            response = await get_client().post(url, headers=headers, json=body, extensions=extensions)
+            response.raise_for_status()
+            content = _content(provider, response.json())
+        except httpx.TimeoutException:
+            raise AIError("The AI provider took too long to answer", status.HTTP_504_GATEWAY_TIMEOUT)
+        except httpx.HTTPStatusError as exc:
+            raise AIError(f"The AI provider returned HTTP {exc.response.status_code}")
+        except httpx.HTTPError:
+            raise AIError("The AI provider could not be reached")
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise AIError("The AI provider returned an unexpected response")
+    cache.set(key, content)
+    return content, False
+
+
+def _todo_prompt(todo):
+    lines = [f"Task: {todo.title}"]
+    if todo.description:
+        lines.append(f"Details: {todo.description}")
+    return '\n'.join(lines)
+
+
+async def _complete_json(profile, system, todo):
+    content, cached = await complete(profile, [
+        {'role': 'system', 'content': system},
+        {'role': 'user', 'content': _todo_prompt(todo)},
+    ])
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        data = None
+    if not isinstance(data, dict):
+        raise AIError("The AI provider returned an unexpected response")
+    return data, cached
+
+
+async def breakdown_todo(profile, todo, max_steps=8):
+    """Split ``todo`` into short concrete steps: ``{"steps": [...], "cached": bool}``."""
+    data, cached = await _complete_json(profile, (
+        f"Break the user's task into at most {max_steps} short, concrete steps. "
+        'Answer only with JSON of the form {"steps": ["..."]}.'
+    ), todo)
+    steps = data.get('steps')
+    if not isinstance(steps, list):
+        raise AIError("The AI provider returned an unexpected response")
+    steps = [step.strip() for step in steps if isinstance(step, str) and step.strip()]
+    return {'steps': steps[:max_steps], 'cached': cached}
+
+
+async def estimate_todo(profile, todo):
+    """Estimate the focus time ``todo`` needs: ``{"estimated_minutes": n, "cached": bool}``."""
+    data, cached = await _complete_json(profile, (
+        "Estimate how many minutes of focused work the user's task needs. "
+        'Answer only with JSON of the form {"estimated_minutes": 30}.'
+    ), todo)
+    try:
+        minutes = round(float(data.get('estimated_minutes')))
+    except (TypeError, ValueError, OverflowError):
+        raise AIError("The AI provider returned an unexpected response")
+    # At least a minute and at most a day, whatever the model says
+    return {'estimated_minutes': min(max(minutes, 1), 24 * 60), 'cached': cached}
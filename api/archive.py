@@ -0,0 +1,330 @@
+import json
+import struct
+import uuid
+import zlib
+from collections import defaultdict
+from operator import attrgetter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_user
+from .models import Segment, SegmentArchive, Session
+from .utils import backdate
+
+# Values of one segment as packed, in this order
+ARCHIVE_FIELDS = ('id', 'session_id', 'mode', 'reason', 'start_at', 'end_at', 'created_at')
+MODES = tuple(mode for mode, _ in Segment.MODE_CHOICES)
+MAGIC = b'SEGA'
+VERSION = 1
+# Magic, version, session count, segment count
+HEADER = struct.Struct('<4sBII')
+
+
+def month_of(moment):
+    """The first day of ``moment``'s UTC month; archives are keyed by it."""
+    return moment.astimezone(dt_timezone.utc).date().replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def month_bounds(month):
+    return month_start(month), month_start(add_months(month, 1))
+
+
+def archive_cutoff(months, now=None):
+    """Start of the UTC month ``months`` before the current one: older sessions are archived."""
+    return month_start(add_months(month_of(now or timezone.now()), -months))
+
+
+def _micros(delta):
+    return delta // timedelta(microseconds=1)
+
+
+def encode_segments(month, rows):
+    """
+    Pack ``rows`` of closed segments (ARCHIVE_FIELDS tuples) into an archive
+    blob: a header, the session ids and reasons the columns index into, then
+    one little-endian column per field. Times are microsecond offsets, the
+    start from the month and the end and creation from the start, so the
+    round trip is exact. The whole is zlib-compressed.
+    """
+    base = month_start(month)
+    sessions = list(dict.fromkeys(row[1] for row in rows))
+    reasons = list(dict.fromkeys(row[3] for row in rows))
+    session_index = {session_id: index for index, session_id in enumerate(sessions)}
+    reason_index = {reason: index for index, reason in enumerate(reasons)}
+    reason_table = json.dumps(reasons).encode()
+    count = len(rows)
+    return zlib.compress(b''.join([
+        HEADER.pack(MAGIC, VERSION, len(sessions), count),
+        b''.join(session_id.bytes for session_id in sessions),
+        struct.pack('<I', len(reason_table)),
+        reason_table,
+        struct.pack(f'<{count}I', *(session_index[row[1]] for row in rows)),
+        struct.pack(f'<{count}B', *(MODES.index(row[2]) for row in rows)),
+        struct.pack(f'<{count}B', *(reason_index[row[3]] for row in rows)),
+        struct.pack(f'<{count}q', *(_micros(row[4] - base) for row in rows)),
+        struct.pack(f'<{count}q', *(_micros(row[5] - row[4]) for row in rows)),
+        struct.pack(f'<{count}q', *(_micros(row[6] - row[4]) for row in rows)),
+        b''.join(row[0].bytes for row in rows),
+    ]))
+
+
+class _Reader:
+    def __init__(self, blob):
+        self.blob = blob
+        self.offset = 0
+
+    def take(self, size):
+        chunk = self.blob[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.blob, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def uuids(self, count):
+        return [uuid.UUID(bytes=self.take(16)) for _ in range(count)]
+
+
+def decode_segments(month, data):
+    """The ARCHIVE_FIELDS tuples packed by encode_segments, in their original order."""
+    reader = _Reader(zlib.decompress(data))
+    magic, version, session_count, count = reader.unpack(HEADER.format)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} segment archive")
+    sessions = reader.uuids(session_count)
+    reasons = json.loads(reader.take(reader.unpack('<I')[0]))
+    session_column = reader.unpack(f'<{count}I')
+    mode_column = reader.unpack(f'<{count}B')
+    reason_column = reader.unpack(f'<{count}B')
+    start_column = reader.unpack(f'<{count}q')
+    duration_column = reader.unpack(f'<{count}q')
+    created_column = reader.unpack(f'<{count}q')
+    ids = reader.uuids(count)
+
+    base = month_start(month)
+    rows = []
+    for index in range(count):
+        start_at = base + timedelta(microseconds=start_column[index])
+        rows.append((
+            ids[index],
+            sessions[session_column[index]],
+            MODES[mode_column[index]],
+            reasons[reason_column[index]],
+            start_at,
+            start_at + timedelta(microseconds=duration_column[index]),
+            start_at + timedelta(microseconds=created_column[index]),
+        ))
+    return rows
+
+
+def _ordered(segments, newest_first=False):
+    # By (start_at, id), or ('-start_at', 'id') like the range history
+    segments = sorted(segments, key=attrgetter('id'))
+    segments.sort(key=attrgetter('start_at'), reverse=newest_first)
+    return segments
+
+
+def _segment(row, session=None):
+    segment = Segment(
+        id=row[0], session_id=row[1], mode=row[2], reason=row[3],
+        start_at=row[4], end_at=row[5], created_at=row[6],
+    )
+    if session is not None:
+        segment.session = session
+    return segment
+
+
+def _archive_data(user, month):
+    return SegmentArchive.objects.filter(user=user, month=month).values_list('data', flat=True).first()
+
+
+def iter_archived_segments(user, sessions=None, start_at=None, end_at=None, newest_first=False):
+    """
+    The user's archived segments as unsaved Segment instances with their
+    session attached, ordered by (start_at, id) like the live history, or by
+    ('-start_at', 'id') with ``newest_first``. ``sessions`` limits them to a
+    Session queryset (and sets what is loaded with each session, e.g. its
+    todo); ``start_at``/``end_at`` to segments starting in [start_at, end_at).
+    Archives are decoded a month at a time, as the iteration reaches them.
+    """
+    months = SegmentArchive.objects.filter(user=user).order_by('month')
+    # A session's segments start in its month or, running past midnight, the next
+    if start_at is not None:
+        months = months.filter(month__gte=add_months(month_of(start_at), -1))
+    if end_at is not None:
+        months = months.filter(month__lte=month_of(end_at))
+    if sessions is None:
+        sessions = Session.objects.filter(user=user)
+
+    months = list(months.values_list('month', flat=True))
+    if newest_first:
+        months.reverse()
+    pending = []
+    for month in months:
+        first, last = month_bounds(month)
+        # Archives still to come hold nothing starting before this month or,
+        # newest first, from two months after it
+        boundary = month_start(add_months(month, 2)) if newest_first else first
+        ready = [segment for segment in pending if (segment.start_at >= boundary) == newest_first]
+        pending = [segment for segment in pending if (segment.start_at >= boundary) != newest_first]
+        yield from _ordered(ready, newest_first)
+
+        data = _archive_data(user, month)
+        if data is None:
+            # Restored since the months were listed
+            continue
+        # Segments of sessions deleted since (with their todo) are skipped
+        month_sessions = sessions.filter(archived=True, created_at__gte=first, created_at__lt=last).in_bulk()
+        for row in decode_segments(month, data):
+            session = month_sessions.get(row[1])
+            if session is None:
+                continue
+            if (start_at is not None and row[4] < start_at) or (end_at is not None and row[4] >= end_at):
+                continue
+            pending.append(_segment(row, session))
+    yield from _ordered(pending, newest_first)
+
+
+def attach_archived_segments(user, sessions):
+    """
+    Give the archived ones among ``sessions`` their segments from the
+    archive as if prefetched, so SessionSerializer renders them like live
+    sessions. Returns ``sessions``.
+    """
+    archived = {session.id: session for session in sessions if session.archived}
+    segments = defaultdict(list)
+    for month in {month_of(session.created_at) for session in archived.values()}:
+        data = _archive_data(user, month)
+        for row in decode_segments(month, data) if data is not None else ():
+            if row[1] in archived:
+                segments[row[1]].append(_segment(row, archived[row[1]]))
+
+    for session_id, session in archived.items():
+        queryset = session.segments.all()
+        queryset._result_cache = segments[session_id]
+        queryset._prefetch_done = True
+        session.__dict__.setdefault('_prefetched_objects_cache', {})['segments'] = queryset
+    return sessions
+
+
+def _lock_user(user):
+    # The lock services.lock_user_sessions starts with, so no start,
+    # transition or import interleaves
+    User.objects.select_for_update().only('id').get(pk=user.pk)
+
+
+def archive_month(user, month, before=None):
+    """
+    Pack the segments of the user's ended sessions created in ``month`` (and
+    before ``before``) into the month's archive, merging with what it holds,
+    and delete them from the segment table. The sessions stay, flagged
+    ``archived`` with their exact totals. Returns ``(sessions, segments)``
+    archived. Rollups and streak days already count the segments.
+    """
+    first, last = month_bounds(month)
+    if before is not None:
+        last = min(last, before)
+    with transaction.atomic():
+        _lock_user(user)
+        sessions = Session.objects.filter(
+            user=user, status='ended', archived=False, created_at__gte=first, created_at__lt=last
+        ).exclude(segments__end_at__isnull=True)
+        session_ids = list(sessions.values_list('id', flat=True))
+        if not session_ids:
+            return 0, 0
+        segments = Segment.objects.filter(session_id__in=session_ids)
+        new_rows = list(segments.values_list(*ARCHIVE_FIELDS))
+
+        archive = SegmentArchive.objects.select_for_update().filter(user=user, month=month).first()
+        rows = decode_segments(month, archive.data) if archive else []
+        if rows:
+            # Drop segments of sessions deleted since they were archived
+            kept = set(Session.objects.filter(user=user, archived=True, id__in={row[1] for row in rows}).values_list('id', flat=True))
+            rows = [row for row in rows if row[1] in kept]
+        rows = sorted(rows + new_rows, key=lambda row: (row[4], row[0]))
+
+        totals = {session_id: [timedelta(0), timedelta(0)] for session_id in session_ids}
+        for row in new_rows:
+            # Pause includes break, as in Session.objects.with_totals()
+            totals[row[1]][0 if row[2] == 'focus' else 1] += row[5] - row[4]
+
+        archive = archive or SegmentArchive(user=user, month=month)
+        archive.data = encode_segments(month, rows)
+        archive.session_count = len({row[1] for row in rows})
+        archive.segment_count = len(rows)
+        archive.save()
+        segments.delete()
+        Session.objects.bulk_update(
+            [
+                Session(id=session_id, archived=True, archived_focus=focus, archived_pause=pause, current_segment=None)
+                for session_id, (focus, pause) in totals.items()
+            ],
+            ['archived', 'archived_focus', 'archived_pause', 'current_segment'],
+            batch_size=500
+        )
+    invalidate_user(user.id)
+    return len(session_ids), len(new_rows)
+
+
+def archive_user(user, before):
+    """
+    Archive the user's ended sessions created before ``before``, a month at
+    a time. Only past months are archived, however late ``before`` is.
+    """
+    before = min(before, archive_cutoff(0))
+    candidates = Session.objects.filter(user=user, status='ended', archived=False, created_at__lt=before)
+    archived = {'months': 0, 'sessions': 0, 'segments': 0}
+    for start in candidates.datetimes('created_at', 'month', tzinfo=dt_timezone.utc):
+        sessions, segments = archive_month(user, start.date(), before)
+        if sessions:
+            archived['months'] += 1
+            archived['sessions'] += sessions
+            archived['segments'] += segments
+    return archived
+
+
+def restore_month(user, month):
+    """
+    Put the segments of the user's ``month`` archive back into the segment
+    table and delete the archive. Returns the number of segments restored.
+    """
+    first, last = month_bounds(month)
+    with transaction.atomic():
+        _lock_user(user)
+        archive = SegmentArchive.objects.select_for_update().filter(user=user, month=month).first()
+        if archive is None:
+            return 0
+        sessions = Session.objects.filter(user=user, archived=True, created_at__gte=first, created_at__lt=last)
+        kept = set(sessions.values_list('id', flat=True))
+        rows = [row for row in decode_segments(month, archive.data) if row[1] in kept]
+        Segment.objects.bulk_create([_segment(row) for row in rows], batch_size=1000)
+        # created_at is auto_now_add, so bulk_create stamped the rows with now
+        backdate(Segment, 'created_at', {row[0]: row[6] for row in rows})
+        sessions.update(archived=False, archived_focus=None, archived_pause=None)
+        archive.delete()
+    invalidate_user(user.id)
+    return len(rows)
+
+
+def restore_user(user, months=None):
+    """Restore the user's archives, or only those of ``months``. Returns ``(months, segments)`` restored."""
+    archives = SegmentArchive.objects.filter(user=user).order_by('month')
+    if months is not None:
+        archives = archives.filter(month__in=months)
+    restored = {'months': 0, 'segments': 0}
+    for month in list(archives.values_list('month', flat=True)):
+        restored['months'] += 1
+        restored['segments'] += restore_month(user, month)
+    return restored
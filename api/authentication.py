@@ -0,0 +1,83 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# The User fields the views and permission checks read; never the password hash
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _user_key(user_id):
+    return f'api:auth-user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop the cached user once the current transaction commits; called when a user is saved or deleted."""
+    # Dropping before the commit would let a concurrent request cache the old row
+    transaction.on_commit(lambda: cache.delete(_user_key(user_id)))
+
+
+def _cache_entry(user):
+    values = {name: getattr(user, name) for name in CACHED_USER_FIELDS}
+    revoke = get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+    return values, revoke
+
+
+def _cached_user(values):
+    # Built like a ``.only()`` row: other fields load on access and save() leaves them alone
+    User = get_user_model()
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db('default', names, [values[name] for name in names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the authenticated user in the cache for
+    ``AUTH_USER_CACHE_TIMEOUT`` seconds, saving the User query on each request.
+    Only ``CACHED_USER_FIELDS`` are stored, so the shared cache never holds
+    the password hash; the rest of the user loads from the database if read.
+    Saving or deleting a user drops the entry, so deactivation and password
+    changes apply on the next request. Changes that skip signals, such as
+    ``QuerySet.update()``, apply once the entry expires.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        entry = cache.get(_user_key(user_id)) if user_id is not None else None
+        if entry is None:
+            # Only users that pass the inactive and revoked checks are cached
+            user = super().get_user(validated_token)
+            cache.set(_user_key(user_id), _cache_entry(user), settings.AUTH_USER_CACHE_TIMEOUT)
+            return user
+
+        # The revoke claim belongs to this token, not to the cached user
+        values, revoke = entry
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != revoke:
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return _cached_user(values)
+
+
+async def authenticate_async(request):
+    """
+    Resolve the JWT user for plain async Django views, which DRF's
+    authentication classes do not cover. Accepts the usual Bearer header
+    or a ``token`` query parameter, since EventSource cannot set headers.
+    Returns None when the token is missing or invalid.
+    """
+    auth = CachedJWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else request.GET.get('token', '').encode() or None
+    if not raw_token:
+        return None
+    try:
+        validated = auth.get_validated_token(raw_token)
+        return await sync_to_async(auth.get_user)(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return None
@@ -0,0 +1,76 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _version_key(user_id):
+    return f'api:version:{user_id}'
+
+
+def get_version(user_id):
+    # A fresh version is time-based so an evicted counter never reuses old keys
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        cache.add(_version_key(user_id), version, None)
+    return version
+
+
+def invalidate_user(user_id):
+    """Make every cached response for ``user_id`` stale once the current transaction commits."""
+    # Bumping before the commit would let a concurrent read cache the old rows
+    # under the new version, and nothing would bump it again
+    transaction.on_commit(lambda: cache.set(_version_key(user_id), time.time_ns(), None))
+
+
+def _cache_entry(request, name, params, version):
+    # The cache key and response headers, and whether the client's copy is current
+    fingerprint = f"{name}:{version}:{urlencode(sorted(params.items()))}"
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()
+    headers = {'ETag': f'"{digest}"', 'Cache-Control': 'private, no-cache'}
+    if_none_match = request.headers.get('If-None-Match', '')
+    not_modified = headers['ETag'] in [tag.strip() for tag in if_none_match.split(',')]
+    return f'api:{name}:{request.user.id}:{digest}', headers, not_modified
+
+
+def cached_response(request, name, params, build):
+    """
+    Serve ``build()`` from the per-user cache with an ETag. The tag is derived
+    from the user's data version and ``params`` alone, so a matching
+    If-None-Match is answered with a 304 without building or fetching the body.
+    """
+    key, headers, not_modified = _cache_entry(request, name, params, get_version(request.user.id))
+    if not_modified:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.API_CACHE_TIMEOUT)
+    return Response(data, headers=headers)
+
+
+async def aget_version(user_id):
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        await cache.aadd(_version_key(user_id), version, None)
+    return version
+
+
+async def acached_response(request, name, params, build):
+    """cached_response for async views, where ``build`` is a coroutine function."""
+    key, headers, not_modified = _cache_entry(request, name, params, await aget_version(request.user.id))
+    if not_modified:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, settings.API_CACHE_TIMEOUT)
+    return Response(data, headers=headers)
@@ -0,0 +1,97 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from .cache import invalidate_user
+from .models import Segment, Session
+from .rollups import apply_segments
+from .streaks import refresh_active_days
+
+BATCH_SIZE = 500
+
+
+def compaction_gap(seconds=None):
+    return timedelta(seconds=settings.SEGMENT_COMPACTION_GAP_SECONDS if seconds is None else seconds)
+
+
+def _continues(previous, seg):
+    # Back to back in the same mode and reason: the merged segment sums to exactly the same time
+    return previous.mode == seg.mode and previous.reason == seg.reason and previous.end_at == seg.start_at
+
+
+def plan_compaction(segments, gap):
+    """
+    Compact one session's closed, start-ordered segments in memory: a segment
+    that continues the previous one (see _continues) is merged into it, which
+    changes no total. With a positive ``gap``, a segment shorter than it
+    between two of the same mode is also absorbed with the one after it,
+    moving its time to their mode. Survivors get the end of what they took
+    in, so the session covers exactly the same time. Returns the segments to
+    delete.
+    """
+    kept, removed = [], []
+    for seg in segments:
+        previous = kept[-1] if kept else None
+        if previous and _continues(previous, seg):
+            previous.end_at = seg.end_at
+            removed.append(seg)
+        elif (
+            len(kept) > 1 and kept[-2].mode == seg.mode
+            and kept[-2].end_at == previous.start_at and previous.end_at == seg.start_at
+            and previous.end_at - previous.start_at < gap
+        ):
+            removed.append(kept.pop())
+            kept[-1].end_at = seg.end_at
+            removed.append(seg)
+        else:
+            kept.append(seg)
+    return removed
+
+
+def compact_sessions(user, sessions, gap=None):
+    """
+    Compact the segments of the user's ended ``sessions`` in place, keeping
+    the rollups, streak days and sessions' running totals in step. Run it in
+    a transaction holding the user's session lock. Returns the number of
+    segment rows removed.
+    """
+    gap = compaction_gap(gap)
+    by_session = defaultdict(list)
+    segments = Segment.objects.filter(session__in=[session.id for session in sessions], end_at__isnull=False)
+    for seg in segments.order_by('start_at', 'id'):
+        by_session[seg.session_id].append(seg)
+
+    old_rows, new_rows, changed, removed, compacted = [], [], [], [], []
+    for session in sessions:
+        segments = by_session[session.id]
+        originals = [(session.todo_id, seg.mode, seg.reason, seg.start_at, seg.end_at) for seg in segments]
+        dropped = plan_compaction(segments, gap)
+        if not dropped:
+            continue
+        dropped_ids = {seg.id for seg in dropped}
+        kept = [seg for seg in segments if seg.id not in dropped_ids]
+        old_rows += originals
+        kept_rows = [(session.todo_id, seg.mode, seg.reason, seg.start_at, seg.end_at) for seg in kept]
+        new_rows += kept_rows
+        changed += [seg for seg, row in zip(segments, originals) if seg.id not in dropped_ids and seg.end_at != row[4]]
+        removed += dropped
+
+        # Move the running totals by what absorbing changed; merges change nothing
+        for rows, sign in ((originals, -1), (kept_rows, 1)):
+            for _, mode, _, start_at, end_at in rows:
+                field = 'focus_time' if mode == 'focus' else 'pause_time'
+                setattr(session, field, getattr(session, field) + sign * (end_at - start_at))
+        compacted.append(session)
+
+    if not removed:
+        return 0
+    for offset in range(0, len(removed), BATCH_SIZE):
+        Segment.objects.filter(id__in=[seg.id for seg in removed[offset:offset + BATCH_SIZE]]).delete()
+    Segment.objects.bulk_update(changed, ['end_at'], batch_size=BATCH_SIZE)
+    Session.objects.bulk_update(compacted, ['focus_time', 'pause_time'], batch_size=BATCH_SIZE)
+
+    # Only absorbed segments change the seconds; merges change segment counts
+    apply_segments(user, old_rows, sign=-1)
+    apply_segments(user, new_rows)
+    refresh_active_days(user, [seg.start_at for seg in removed if seg.mode == 'focus'])
+    invalidate_user(user.id)
+    return len(removed)
@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .models import (
+    AccountDeletion, ActiveDay, DailyRollup, Profile, Segment, SegmentArchive, SegmentRollup, Session, Todo,
+    TodoTag,
+)
+
+BATCH_SIZE = 2000
+
+# Every model holding rows of a user, with the lookup to the user. Children
+# come first so each batch commits with its foreign keys satisfied.
+USER_ROWS = (
+    (Segment, 'session__user'),
+    (SegmentArchive, 'user'),
+    (Session, 'user'),
+    (TodoTag, 'user'),
+    (SegmentRollup, 'user'),
+    (Todo, 'user'),
+    (DailyRollup, 'user'),
+    (ActiveDay, 'user'),
+    (Profile, 'user'),
+)
+
+
+def request_deletion(user):
+    """
+    Queue ``user`` for deletion and deactivate the account, which ends its
+    access on the next request. The rows are removed by process_deletion.
+    """
+    with transaction.atomic():
+        deletion = AccountDeletion.objects.get_or_create(user=user)[0]
+        if user.is_active:
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+    return deletion
+
+
+def pending_deletions():
+    return AccountDeletion.objects.filter(finished_at__isnull=True).order_by('requested_at')
+
+
+def delete_batch(deletion, model, lookup, batch_size=BATCH_SIZE):
+    """
+    Delete up to ``batch_size`` of the user's ``model`` rows in one
+    transaction, skipping the collector and signals, and count them in
+    ``deleted_rows``. Returns the number deleted, 0 once none are left.
+    """
+    with transaction.atomic():
+        pks = list(
+            model.objects.filter(**{lookup: deletion.user_id}).values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return 0
+        deleted = model.objects.filter(pk__in=pks)._raw_delete(model.objects.db)
+        name = model._meta.model_name
+        deletion.deleted_rows[name] = deletion.deleted_rows.get(name, 0) + deleted
+        deletion.save(update_fields=['deleted_rows'])
+    return deleted
+
+
+def process_deletion(deletion, batch_size=BATCH_SIZE, progress=None):
+    """
+    Remove everything of the deletion's user a batch at a time, then the user
+    itself. Safe to rerun after an interruption: finished batches are
+    committed and the rest are found again. ``progress(deletion, model_name,
+    deleted)`` is called after each batch.
+    """
+    for model, lookup in USER_ROWS:
+        while deleted := delete_batch(deletion, model, lookup, batch_size):
+            if progress:
+                progress(deletion, model._meta.model_name, deleted)
+
+    with transaction.atomic():
+        # Only rows the batches do not cover are left for the collector
+        User.objects.filter(pk=deletion.user_id).delete()
+        deletion.finished_at = timezone.now()
+        deletion.save(update_fields=['finished_at'])
+    return deletion
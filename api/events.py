@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker:
+    """
+    Fan session events out to subscribers connected to this process.
+
+    Subscribers are asyncio queues owned by the event loop serving the stream;
+    publishers may run on any thread (sync views run in a worker thread under
+    ASGI). With several worker processes, swap in a broker backed by an
+    external pub/sub via ``EVENTS_BROKER``; it needs the same two methods.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        return _Subscription(self, user_id)
+
+    def publish(self, user_id, event):
+        with self.lock:
+            targets = list(self.subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                pass
+
+    def _add(self, user_id, entry):
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(entry)
+
+    def _remove(self, user_id, entry):
+        with self.lock:
+            entries = self.subscribers.get(user_id)
+            if entries:
+                entries.discard(entry)
+                if not entries:
+                    del self.subscribers[user_id]
+
+
+def _offer(queue, event):
+    # A client that stops reading loses its oldest events rather than growing memory
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class _Subscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+
+    async def __aenter__(self):
+        self.queue = asyncio.Queue(maxsize=self.broker.queue_size)
+        self.entry = (asyncio.get_running_loop(), self.queue)
+        self.broker._add(self.user_id, self.entry)
+        return self.queue
+
+    async def __aexit__(self, *exc_info):
+        self.broker._remove(self.user_id, self.entry)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def _segment_payload(segment):
+    if segment is None:
+        return None
+    return {
+        'id': str(segment.id),
+        'mode': segment.mode,
+        'reason': segment.reason,
+        'start_at': segment.start_at.isoformat(),
+    }
+
+
+def publish_session_event(user_id, event_type, session, segment=None):
+    """Publish a session state change once the surrounding transaction commits."""
+    event = {
+        'type': event_type,
+        'session_id': str(session.id),
+        'todo_id': str(session.todo_id),
+        'status': session.status,
+        'segment': _segment_payload(segment),
+        'at': timezone.now().isoformat(),
+    }
+
+    def send():
+        try:
+            get_broker().publish(user_id, event)
+        except Exception:
+            # Live updates are best effort; polling still works
+            logger.exception("Could not publish %s for user %s", event_type, user_id)
+
+    transaction.on_commit(send)
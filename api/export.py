@@ -0,0 +1,103 @@
+import csv
+import heapq
+import itertools
+import json
+from asgiref.sync import sync_to_async
+from .archive import iter_archived_segments
+from .models import Segment, Session
+
+EXPORT_FIELDS = {
+    # Output column: values() lookup
+    'segment_id': 'id',
+    'session_id': 'session_id',
+    'todo_id': 'session__todo_id',
+    'todo_title': 'session__todo__title',
+    'tags': 'session__todo__tags',
+    'session_status': 'session__status',
+    'session_started_at': 'session__created_at',
+    'session_ended_at': 'session__ended_at',
+    'mode': 'mode',
+    'reason': 'reason',
+    'start_at': 'start_at',
+    'end_at': 'end_at',
+}
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 2000
+LINES_PER_WRITE = 500
+
+
+def _archived_values(user, start_at, end_at):
+    # The EXPORT_FIELDS values of archived segments, in the same order
+    sessions = Session.objects.filter(user=user).select_related('todo')
+    for seg in iter_archived_segments(user, sessions, start_at, end_at):
+        session = seg.session
+        yield (
+            seg.id, session.id, session.todo_id, session.todo.title, session.todo.tags, session.status,
+            session.created_at, session.ended_at, seg.mode, seg.reason, seg.start_at, seg.end_at,
+        )
+
+
+def export_rows(user, start_at=None, end_at=None):
+    """
+    Every segment of ``user`` as a flat dict joined with its session and todo,
+    oldest first, optionally limited to segments starting in [start_at, end_at).
+    Rows are fetched in chunks, and archives decoded a month at a time, so
+    memory does not grow with the history.
+    """
+    segments = Segment.objects.filter(session__user=user)
+    if start_at is not None:
+        segments = segments.filter(start_at__gte=start_at)
+    if end_at is not None:
+        segments = segments.filter(start_at__lt=end_at)
+    values = segments.order_by('start_at', 'id').values_list(*EXPORT_FIELDS.values())
+    rows = heapq.merge(
+        values.iterator(chunk_size=CHUNK_SIZE), _archived_values(user, start_at, end_at),
+        key=lambda row: (row[-2], row[0])
+    )
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row))
+        for field in ('segment_id', 'session_id', 'todo_id'):
+            record[field] = str(record[field])
+        for field in ('session_started_at', 'session_ended_at', 'start_at', 'end_at'):
+            record[field] = record[field].isoformat() if record[field] else None
+        start, end = row[-2], row[-1]
+        record['duration_seconds'] = int((end - start).total_seconds()) if end else None
+        yield record
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _lines(records, fmt):
+    if fmt == 'ndjson':
+        for record in records:
+            yield json.dumps(record) + '\n'
+        return
+    writer = csv.writer(_Echo())
+    yield writer.writerow([*EXPORT_FIELDS, 'duration_seconds'])
+    for record in records:
+        record['tags'] = ';'.join(record['tags'] or [])
+        yield writer.writerow(record.values())
+
+
+def export_chunks(records, fmt):
+    """Render ``records`` as NDJSON or CSV text, a few hundred lines per chunk."""
+    lines = _lines(records, fmt)
+    while chunk := ''.join(itertools.islice(lines, LINES_PER_WRITE)):
+        yield chunk
+
+
+async def aiter_chunks(chunks):
+    """
+    Serve a sync chunk iterator from an ASGI worker without buffering it:
+    each chunk is pulled on the shared sync thread, which keeps the
+    database cursor on one connection.
+    """
+    next_chunk = sync_to_async(lambda: next(chunks, None), thread_sensitive=True)
+    while (chunk := await next_chunk()) is not None:
+        yield chunk
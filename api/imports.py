@@ -0,0 +1,163 @@
+import csv
+import itertools
+import json
+from django.db import transaction
+from .cache import invalidate_user
+from .models import Todo, Session, Segment
+from .rollups import apply_segments
+from .serializers import ImportRowSerializer
+from .streaks import mark_active
+from .tags import sync_todo_tags, tag_names
+from .utils import backdate
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+VALIDATE_CHUNK = 1000
+BATCH_SIZE = 1000
+MAX_ERRORS = 100
+
+
+class HistoryImportError(Exception):
+    """An import file with invalid rows; nothing from it was written."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid row(s)")
+        self.errors = errors
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line, row)`` from an NDJSON or CSV text stream, in the layout
+    history/export/ writes. Empty CSV cells are dropped and CSV tags are split
+    on ``;``. A row that cannot be parsed is yielded as None.
+    """
+    if fmt == 'ndjson':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+        return
+
+    # Line 1 is the header
+    for line, row in enumerate(csv.DictReader(stream), 2):
+        row = {key: value for key, value in row.items() if key and value not in ('', None)}
+        if 'tags' in row:
+            row['tags'] = [tag for tag in row['tags'].split(';') if tag]
+        yield line, row
+
+
+class _ImportPlan:
+    """Validated rows grouped into unsaved todos, sessions and segments."""
+
+    def __init__(self, user):
+        self.user = user
+        self.todos = {}
+        self.sessions = {}
+
+    def add(self, line, row):
+        todo_key = row.get('todo_id') or row['todo_title']
+        todo = self.todos.get(todo_key)
+        if todo is None:
+            todo = self.todos[todo_key] = Todo(
+                user=self.user,
+                title=row['todo_title'],
+                tags=tag_names(row.get('tags', [])),
+                priority=row.get('priority', 'med'),
+                estimated_minutes=row.get('estimated_minutes'),
+                completed_at=row.get('completed_at'),
+            )
+        if 'mode' not in row:
+            return None
+
+        # A segment without a session_id is a session of its own
+        session_key = row.get('session_id') or f'line:{line}'
+        entry = self.sessions.setdefault(session_key, {'todo': todo, 'segments': []})
+        if entry['todo'] is not todo:
+            return "session_id is already used with another todo"
+        entry['segments'].append((line, Segment(
+            mode=row['mode'], reason=row.get('reason'), start_at=row['start_at'], end_at=row['end_at'],
+        )))
+        return None
+
+    def overlap_errors(self):
+        errors = []
+        for entry in self.sessions.values():
+            entry['segments'].sort(key=lambda item: item[1].start_at)
+            for (_, previous), (line, segment) in zip(entry['segments'], entry['segments'][1:]):
+                if segment.start_at < previous.end_at:
+                    errors.append({'line': line, 'errors': ["Segment overlaps another segment of its session"]})
+        return errors
+
+    def save(self):
+        sessions, segments, todo_created, session_created = [], [], {}, {}
+        for entry in self.sessions.values():
+            rows = [segment for _, segment in entry['segments']]
+            session = Session(
+                user=self.user, todo=entry['todo'], status='ended', ended_at=max(seg.end_at for seg in rows),
+            )
+            for seg in rows:
+                seg.session = session
+                if seg.mode == 'focus':
+                    session.focus_time += seg.end_at - seg.start_at
+                else:
+                    session.pause_time += seg.end_at - seg.start_at
+            sessions.append(session)
+            segments.extend(rows)
+            session_created[session.pk] = rows[0].start_at
+            todo = entry['todo']
+            todo_created[todo.pk] = min(todo_created.get(todo.pk, rows[0].start_at), rows[0].start_at)
+
+        with transaction.atomic():
+            Todo.objects.bulk_create(self.todos.values(), batch_size=BATCH_SIZE)
+            sync_todo_tags(self.todos.values())
+            Session.objects.bulk_create(sessions, batch_size=BATCH_SIZE)
+            Segment.objects.bulk_create(segments, batch_size=BATCH_SIZE)
+            backdate(Todo, 'created_at', todo_created)
+            backdate(Session, 'created_at', session_created)
+            # Add just the imported segments, as the session services do, rather than rebuilding
+            apply_segments(
+                self.user,
+                [(seg.session.todo_id, seg.mode, seg.reason, seg.start_at, seg.end_at) for seg in segments]
+            )
+            mark_active(self.user, *[seg.start_at for seg in segments if seg.mode == 'focus'])
+            # Bulk writes skip the signals that would do this
+            invalidate_user(self.user.id)
+        return {'todos': len(self.todos), 'sessions': len(sessions), 'segments': len(segments)}
+
+
+def import_history(user, rows):
+    """
+    Create todos and ended sessions for ``user`` from ``(line, row)`` pairs,
+    as yielded by read_rows. Rows are validated a chunk at a time; if any is
+    invalid nothing is written and HistoryImportError lists the first
+    MAX_ERRORS problems by line. ``todo_id`` and ``session_id`` only group
+    rows within the file. Returns the number of rows created per model.
+    """
+    plan = _ImportPlan(user)
+    errors = []
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, VALIDATE_CHUNK)):
+        parsed = [(line, row) for line, row in chunk if row is not None]
+        errors.extend({'line': line, 'errors': ["Row could not be parsed"]} for line, row in chunk if row is None)
+        serializer = ImportRowSerializer(data=[row for _, row in parsed], many=True)
+        if not serializer.is_valid():
+            errors.extend(
+                {'line': line, 'errors': row_errors}
+                for (line, _), row_errors in zip(parsed, serializer.errors) if row_errors
+            )
+        elif not errors:
+            for (line, _), row in zip(parsed, serializer.validated_data):
+                error = plan.add(line, row)
+                if error:
+                    errors.append({'line': line, 'errors': [error]})
+        if len(errors) >= MAX_ERRORS:
+            break
+
+    if not errors:
+        errors = plan.overlap_errors()
+    if errors:
+        raise HistoryImportError(sorted(errors, key=lambda error: error['line'])[:MAX_ERRORS])
+    return plan.save()
@@ -0,0 +1,60 @@
+from datetime import datetime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.archive import archive_cutoff, archive_user, restore_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Pack the segments of ended sessions older than --months into per-user monthly "
+        "archives, or put them back with --restore. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=settings.SEGMENT_ARCHIVE_MONTHS,
+            help="Archive sessions created before the start of the UTC month this many months back",
+        )
+        parser.add_argument('--restore', action='store_true', help="Unpack archives back into the segment table")
+        parser.add_argument('--month', help="With --restore, only this UTC month (YYYY-MM)")
+        parser.add_argument('--user', type=int, help="Only process the user with this id")
+
+    def handle(self, *args, **options):
+        if options['months'] < 0:
+            raise CommandError("--months must not be negative")
+        months = None
+        if options['month']:
+            if not options['restore']:
+                raise CommandError("--month only applies with --restore")
+            try:
+                months = [datetime.strptime(options['month'], '%Y-%m').date()]
+            except ValueError:
+                raise CommandError("--month must be YYYY-MM")
+
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+        if options['restore']:
+            users = users.filter(segment_archives__isnull=False).distinct()
+        else:
+            before = archive_cutoff(options['months'])
+            users = users.filter(sessions__status='ended', sessions__archived=False, sessions__created_at__lt=before).distinct()
+
+        total = 0
+        for user in users.iterator():
+            if options['restore']:
+                restored = restore_user(user, months)
+                total += restored['segments']
+                self.stdout.write(f"user {user.id}: restored {restored['segments']} segment(s) from {restored['months']} month(s)")
+            else:
+                archived = archive_user(user, before)
+                total += archived['segments']
+                self.stdout.write(
+                    f"user {user.id}: archived {archived['sessions']} session(s), "
+                    f"{archived['segments']} segment(s) into {archived['months']} month(s)"
+                )
+        if options['restore']:
+            self.stdout.write(self.style.SUCCESS(f"Restored {total} segment(s)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {total} segment(s) of sessions before {before:%Y-%m}"))
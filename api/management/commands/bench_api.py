@@ -0,0 +1,148 @@
+import itertools
+import json
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from api.authentication import CachedJWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.models import Profile, Session, Todo
+from api.services import start_session
+from api.synthetic import generate_history
+from api.utils import user_timezone
+
+AUTHENTICATION = {
+    'cached': CachedJWTAuthentication,
+    'jwt': JWTAuthentication,
+}
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank, so every reported value is one that was actually measured
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API hot paths against synthetic histories of several sizes, "
+        "in a throwaway test database, and print per-endpoint timings as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='30,365,1095', help="Comma-separated days of history per synthetic user")
+        parser.add_argument('--sessions-per-day', type=int, default=4, help="Average sessions per generated day")
+        parser.add_argument('--repeat', type=int, default=30, help="Requests per endpoint and size")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cold', action='store_true', help="Clear the cache (responses and users) before every request")
+        parser.add_argument(
+            '--auth', choices=list(AUTHENTICATION), default='cached',
+            help="Authentication class for every view: the cached user lookup or plain simplejwt",
+        )
+
+    def measure(self, request):
+        timings, queries = [], []
+        for _ in range(self.repeat):
+            if self.cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+            queries.append(len(ctx.captured_queries))
+        timings.sort()
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p90_ms': round(percentile(timings, 0.9), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(queries),
+            'bytes': len(response.content),
+        }
+
+    def run_size(self, days, options):
+        user = User.objects.create_user(f'bench-{days}', password='bench-pass')
+        Profile.objects.create(user=user)
+        started = time.perf_counter()
+        rows = generate_history(user, days, options['sessions_per_day'], seed=options['seed'])
+        seed_seconds = time.perf_counter() - started
+
+        session = start_session(user, Todo.objects.filter(user=user).order_by('-created_at').first())
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        today = timezone.localdate(timezone=user_timezone(user))
+        # The latest settled day with history, so the daily view has work to do
+        last_day = timezone.localdate(
+            Session.objects.filter(user=user, status='ended').latest('created_at').created_at,
+            timezone=user_timezone(user),
+        )
+        modes = itertools.cycle(['pause', 'focus'])
+        endpoints = {
+            'todos': lambda: client.get('/api/todos/'),
+            'sessions_active': lambda: client.get('/api/sessions/active/'),
+            'session_transition': lambda: client.post(
+                f'/api/sessions/{session.id}/transition/', {'mode': next(modes)}, format='json'
+            ),
+            'history_daily': lambda: client.get('/api/history/daily/', {'date': str(last_day)}),
+            'history_range': lambda: client.get('/api/history/range/', {
+                'start': str(today - timedelta(days=29)), 'end': str(today),
+            }),
+            'profile': lambda: client.get('/api/auth/profile/'),
+        }
+        return {
+            'days': days,
+            'rows': rows,
+            'seed_seconds': round(seed_seconds, 2),
+            'endpoints': {name: self.measure(request) for name, request in endpoints.items()},
+        }
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        if any(size < 1 for size in sizes):
+            raise CommandError("--sizes must be positive")
+        self.repeat = max(1, options['repeat'])
+        self.cold = options['cold']
+
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        # Never touch real data: build and drop a test database around the run
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Views that do not set their own authentication_classes read it from APIView
+        authentication_classes = APIView.authentication_classes
+        APIView.authentication_classes = [AUTHENTICATION[options['auth']]]
+        try:
+            results = [self.run_size(days, options) for days in sizes]
+        finally:
+            APIView.authentication_classes = authentication_classes
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(json.dumps({
+            'commit': commit,
+            'database': connection.vendor,
+            'repeat': self.repeat,
+            'cold_cache': self.cold,
+            'auth': options['auth'],
+            'sizes': results,
+        }, indent=2))
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from urllib.parse import quote
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.management.commands.bench_api import percentile
+from api.models import Profile, Session, Todo
+from api.services import start_session
+from api.synthetic import generate_history
+from api.utils import user_timezone
+
+# One worker process each: the sync WSGI setup and the ASGI one from the Procfile
+SERVERS = {
+    'wsgi': ['core.wsgi', '--worker-class', 'sync'],
+    'asgi': ['core.asgi', '--worker-class', 'uvicorn_worker.UvicornWorker'],
+}
+
+# Gunicorn config for --query-latency-ms: every query first waits as if the
+# database were across a network, the case the async views are for
+QUERY_LATENCY_CONFIG = """
+import time
+from django.db.backends import utils
+
+def post_worker_init(worker):
+    execute = utils.CursorWrapper._execute_with_wrappers
+
+    def delayed(self, *args, **kwargs):
+        time.sleep({seconds})
+        return execute(self, *args, **kwargs)
+
+    utils.CursorWrapper._execute_with_wrappers = delayed
+"""
+
+
+def database_url(settings_dict):
+    """A DATABASE_URL for the server processes pointing at ``settings_dict``'s database."""
+    engine, name = settings_dict['ENGINE'], settings_dict['NAME']
+    if engine == 'django.db.backends.sqlite3':
+        return f'sqlite:///{name}'
+    if engine == 'django.db.backends.postgresql':
+        credentials = quote(settings_dict['USER'] or '', safe='')
+        if settings_dict['PASSWORD']:
+            credentials += ':' + quote(settings_dict['PASSWORD'], safe='')
+        host = settings_dict['HOST'] or 'localhost'
+        port = f":{settings_dict['PORT']}" if settings_dict['PORT'] else ''
+        return f"postgres://{credentials}@{host}{port}/{name}"
+    raise CommandError(f"No DATABASE_URL form for {engine}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of one WSGI and one ASGI worker process on the "
+        "async read endpoints, against a throwaway test database. Prints JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='wsgi,asgi', help="Comma-separated: wsgi, asgi")
+        parser.add_argument('--days', type=int, default=90, help="Days of synthetic history for the benchmark user")
+        parser.add_argument('--concurrency', type=int, default=32, help="Requests kept in flight")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and server")
+        parser.add_argument('--wsgi-threads', type=int, default=1, help="Threads of the WSGI worker")
+        parser.add_argument(
+            '--query-latency-ms', type=float, default=0,
+            help="Delay added to every query in the servers, to model a remote database",
+        )
+        parser.add_argument('--port', type=int, default=8765)
+
+    async def load(self, url, headers, concurrency, total):
+        latencies, failures = [], 0
+        pending = iter(range(total))
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(headers=headers, timeout=120, limits=limits) as client:
+            async def worker():
+                nonlocal failures
+                for _ in pending:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(url)
+                        failures += response.status_code >= 400
+                    except httpx.TransportError:
+                        failures += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'requests_per_second': round(total / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'errors': failures,
+        }
+
+    def serve(self, name, env, log, config):
+        command = [
+            sys.executable, '-m', 'gunicorn', *SERVERS[name], '--workers', '1',
+            '--bind', f'127.0.0.1:{self.port}', '--log-level', 'warning', '--config', config,
+        ]
+        if name == 'wsgi':
+            command += ['--threads', str(self.wsgi_threads)]
+        server = subprocess.Popen(command, env=env, stdout=log, stderr=log, cwd=settings.BASE_DIR)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"The {name} server exited; see {log.name}")
+            try:
+                httpx.get(f'http://127.0.0.1:{self.port}/api/sessions/active/', timeout=1)
+                return server
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"The {name} server did not start; see {log.name}")
+
+    def handle(self, *args, **options):
+        servers = [name for name in options['servers'].split(',') if name]
+        if not servers or set(servers) - set(SERVERS):
+            raise CommandError(f"--servers takes a comma-separated list of {', '.join(SERVERS)}")
+        if min(options['days'], options['concurrency'], options['requests'], options['wsgi_threads']) < 1:
+            raise CommandError("--days, --concurrency, --requests and --wsgi-threads must be positive")
+        self.port = options['port']
+        self.wsgi_threads = options['wsgi_threads']
+
+        # The servers are separate processes, so the database must be a real file or server
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = User.objects.create_user('bench-concurrency', password='bench-pass')
+            Profile.objects.create(user=user)
+            generate_history(user, options['days'])
+            start_session(user, Todo.objects.filter(user=user).order_by('-created_at').first())
+            today = timezone.localdate(timezone=user_timezone(user))
+            last_day = timezone.localdate(
+                Session.objects.filter(user=user, status='ended').latest('created_at').created_at,
+                timezone=user_timezone(user),
+            )
+            endpoints = {
+                'sessions_active': '/api/sessions/active/',
+                'profile': '/api/auth/profile/',
+                'history_daily': f'/api/history/daily/?date={last_day}',
+                'history_range': f'/api/history/range/?start={today - timedelta(days=29)}&end={today}&page_size=50',
+            }
+            headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+            env = {
+                **os.environ,
+                'DATABASE_URL': database_url(connection.settings_dict),
+                'DEBUG': 'False',
+                'REQUEST_PROFILING': 'False',
+            }
+            connection.close()
+
+            with tempfile.NamedTemporaryFile('w', prefix='bench-gunicorn-', suffix='.py', delete=False) as config:
+                if options['query_latency_ms']:
+                    config.write(QUERY_LATENCY_CONFIG.format(seconds=options['query_latency_ms'] / 1000))
+            results = {}
+            for name in servers:
+                with tempfile.NamedTemporaryFile('w+', prefix=f'bench-{name}-', suffix='.log', delete=False) as log:
+                    server = self.serve(name, env, log, config.name)
+                    try:
+                        results[name] = {}
+                        for endpoint, path in endpoints.items():
+                            url = f'http://127.0.0.1:{self.port}{path}'
+                            # Warm the worker's connections and caches first
+                            asyncio.run(self.load(url, headers, options['concurrency'], options['concurrency']))
+                            results[name][endpoint] = asyncio.run(
+                                self.load(url, headers, options['concurrency'], options['requests'])
+                            )
+                    finally:
+                        server.terminate()
+                        server.wait(30)
+                os.unlink(log.name)
+            os.unlink(config.name)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(json.dumps({
+            'database': connection.vendor,
+            'days': options['days'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'wsgi_threads': self.wsgi_threads,
+            'query_latency_ms': options['query_latency_ms'],
+            'servers': results,
+        }, indent=2))
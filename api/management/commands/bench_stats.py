@@ -0,0 +1,62 @@
+import json
+import statistics
+import time
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.stats import BREAKDOWNS, BUCKETS, raw_stats, rollup_stats
+from api.utils import user_timezone
+
+
+class Command(BaseCommand):
+    help = "Time history stats read from rollups against aggregating the raw segments, as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True, help="User whose history is measured")
+        parser.add_argument('--days', type=int, default=365, help="Length of the measured range ending today")
+        parser.add_argument('--bucket', choices=BUCKETS, default='week')
+        parser.add_argument('--by', choices=list(BREAKDOWNS))
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, fn):
+        timings = []
+        for _ in range(self.repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                result = fn()
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return result, {
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0], 3),
+            'queries': len(ctx.captured_queries),
+        }
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+        self.repeat = max(1, options['repeat'])
+        tz = user_timezone(user)
+        end = timezone.localdate(timezone=tz)
+        start = end - timedelta(days=options['days'] - 1)
+        bucket, by = options['bucket'], options['by']
+
+        rollup, rollup_timing = self.measure(lambda: rollup_stats(user, start, end, bucket, by))
+        raw, raw_timing = self.measure(lambda: raw_stats(user, start, end, tz, bucket, by))
+
+        self.stdout.write(json.dumps({
+            'user': user.id,
+            'start': str(start),
+            'end': str(end),
+            'bucket': bucket,
+            'by': by,
+            'rollup': rollup_timing,
+            'raw': raw_timing,
+            'speedup': round(raw_timing['median_ms'] / rollup_timing['median_ms'], 2) if rollup_timing['median_ms'] else None,
+            'totals_match': rollup['totals'] == raw['totals'],
+        }, indent=2))
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from api.compaction import BATCH_SIZE, compact_sessions
+from api.models import Session
+from api.services import lock_user_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the segments of ended sessions as stopping a session does: merge back-to-back "
+        "segments of one mode and reason, which changes no total, and with a --gap absorb shorter "
+        "ones between two of the same mode. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only process the user with this id")
+        parser.add_argument(
+            '--gap', type=float,
+            help="Also absorb segments shorter than this many seconds (default SEGMENT_COMPACTION_GAP_SECONDS, 0: off)",
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Sessions compacted per transaction")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options['gap'] is not None and options['gap'] < 0:
+            raise CommandError("--gap must not be negative")
+
+        users = User.objects.filter(sessions__status='ended').distinct().order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        total = 0
+        for user in users.iterator():
+            # Only sessions with something to merge; archived ones have no segment rows
+            session_ids = list(
+                Session.objects.filter(user=user, status='ended').annotate(segment_count=Count('segments'))
+                .filter(segment_count__gt=1).order_by('created_at').values_list('id', flat=True)
+            )
+            removed = 0
+            for offset in range(0, len(session_ids), options['batch_size']):
+                with transaction.atomic():
+                    lock_user_sessions(user)
+                    sessions = list(Session.objects.filter(id__in=session_ids[offset:offset + options['batch_size']]))
+                    removed += compact_sessions(user, sessions, options['gap'])
+            total += removed
+            self.stdout.write(f"user {user.id}: removed {removed} segment row(s) from {len(session_ids)} session(s) checked")
+        self.stdout.write(self.style.SUCCESS(f"Removed {total} segment row(s)"))
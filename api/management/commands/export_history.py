@@ -0,0 +1,45 @@
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.export import EXPORT_FORMATS, export_chunks, export_rows
+from api.utils import day_bounds, user_timezone
+
+
+class Command(BaseCommand):
+    help = "Stream a user's segment history as NDJSON or CSV, the same rows as history/export/."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True, help="User whose history is exported")
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--start', help="First local day (YYYY-MM-DD) to include")
+        parser.add_argument('--end', help="Last local day (YYYY-MM-DD) to include")
+        parser.add_argument('--output', help="Write to this file instead of stdout")
+
+    def parse_day(self, value, option):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"--{option} must be YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+
+        tz = user_timezone(user)
+        start_at = end_at = None
+        if options['start']:
+            day = self.parse_day(options['start'], 'start')
+            start_at = day_bounds(day, day, tz)[0]
+        if options['end']:
+            day = self.parse_day(options['end'], 'end')
+            end_at = day_bounds(day, day, tz)[1]
+
+        chunks = export_chunks(export_rows(user, start_at, end_at), options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
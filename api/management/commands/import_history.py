@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.imports import IMPORT_FORMATS, HistoryImportError, import_history, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import todos and past sessions for a user from an NDJSON or CSV file in the history/export/ layout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--user', type=int, required=True, help="User who receives the imported history")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file extension")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError(f"Cannot tell the format of {options['path']}; pass --format")
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                created = import_history(user, read_rows(stream, fmt))
+        except OSError as e:
+            raise CommandError(str(e))
+        except HistoryImportError as e:
+            for error in e.errors:
+                self.stderr.write(f"line {error['line']}: {error['errors']}")
+            raise CommandError(f"Import failed, nothing was written: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created['todos']} todo(s), {created['sessions']} session(s), {created['segments']} segment(s)"
+        ))
@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.deletion import BATCH_SIZE, pending_deletions, process_deletion
+
+
+class Command(BaseCommand):
+    help = "Drain the account deletion queue, removing each account's rows in batches. Safe to rerun."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only process the pending deletion of this user id")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows deleted per transaction")
+        parser.add_argument(
+            '--interval', type=int,
+            help="Keep running, draining the queue again every this many seconds (the Procfile worker)"
+        )
+
+    def progress(self, deletion, model_name, deleted):
+        if self.verbosity > 1:
+            self.stdout.write(
+                f"user {deletion.user_id}: {model_name} -{deleted} "
+                f"({deletion.deleted_rows[model_name]} so far)"
+            )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options['interval'] is not None and options['interval'] < 1:
+            raise CommandError("--interval must be positive")
+        self.verbosity = options['verbosity']
+        while True:
+            self.drain(options)
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
+
+    def drain(self, options):
+        deletions = pending_deletions()
+        if options['user']:
+            deletions = deletions.filter(user_id=options['user'])
+
+        processed = 0
+        for deletion in list(deletions):
+            process_deletion(deletion, options['batch_size'], self.progress)
+            processed += 1
+            counts = ', '.join(f"{count} {name}" for name, count in deletion.deleted_rows.items()) or "no rows"
+            self.stdout.write(f"user {deletion.user_id}: deleted {counts}")
+        # A quiet worker only reports passes that did something
+        if processed or options['interval'] is None:
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} account deletion(s)"))
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.rollups import compute_rollups, stored_rollups, rebuild_rollups
+from api.streaks import compute_active_days, stored_active_days, rebuild_active_days
+
+
+class Command(BaseCommand):
+    help = "Backfill the per-day focus rollups and streak days from segment history, or verify them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only process the user with this id")
+        parser.add_argument('--check', action='store_true', help="Compare rollups with raw segments without writing")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        mismatched = 0
+        for user in users.iterator():
+            if options['check']:
+                expected, expected_detail = compute_rollups(user)
+                stored, stored_detail = stored_rollups(user)
+                if expected != stored:
+                    mismatched += 1
+                    days = sorted(set(expected) ^ set(stored) | {
+                        day for day in set(expected) & set(stored) if expected[day] != stored[day]
+                    })
+                    self.stdout.write(f"user {user.id}: {len(days)} day(s) differ, first {days[0]}")
+                elif expected_detail != stored_detail:
+                    mismatched += 1
+                    self.stdout.write(f"user {user.id}: per-todo rollups differ")
+                elif compute_active_days(user) != stored_active_days(user):
+                    mismatched += 1
+                    self.stdout.write(f"user {user.id}: streak days differ")
+            else:
+                days = rebuild_rollups(user)
+                active = rebuild_active_days(user)
+                self.stdout.write(f"user {user.id}: rebuilt {days} day(s), {active} active day(s)")
+
+        if mismatched:
+            raise CommandError(f"{mismatched} user(s) have stale rollups; run without --check to rebuild")
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS("All rollups match segment history"))
@@ -0,0 +1,245 @@
+import contextvars
+import cProfile
+import json
+import logging
+import random
+import re
+import time
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from rest_framework import serializers
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+logger = logging.getLogger('api.requests')
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Timings collected for one request; also the execute wrapper that counts its queries."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+
+def _count_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def _watch_connections(**kwargs):
+    # request_started runs on the thread that serves the request's sync code,
+    # the view under WSGI and sync views and async ORM calls under ASGI, so the
+    # wrapper is on every connection the request can query through
+    for conn in connections.all():
+        if _count_query not in conn.execute_wrappers:
+            conn.execute_wrappers.append(_count_query)
+
+
+def _timed_data(prop):
+    def data(self):
+        profile = _current.get()
+        # Nested serializers build their output inside the outer .data
+        if profile is None or profile.serializing:
+            return prop.fget(self)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            profile.serializing = False
+            profile.serialize += time.perf_counter() - started
+    data.timed = True
+    return property(data)
+
+
+def _time_serializers():
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'timed', False):
+            cls.data = _timed_data(cls.data)
+
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in request instrumentation, enabled by ``REQUEST_PROFILING``.
+
+    Every request is measured: SQL query count and time, serializer ``.data``
+    time, response rendering and size. A ``REQUEST_PROFILING_SAMPLE_RATE``
+    share of requests, plus every request slower than
+    ``REQUEST_PROFILING_SLOW_MS``, gets a ``Server-Timing`` header and a JSON
+    log line on ``api.requests``. Sampled requests whose path matches a
+    ``REQUEST_PROFILING_CAPTURE`` pattern also run under cProfile (or
+    pyinstrument) and the profile is written to ``REQUEST_PROFILING_DIR``.
+
+    Under ASGI every request takes the async path. The request's profile
+    travels in a context variable into the threads its sync views and async
+    ORM calls run on, so queries and serializers are measured the same way.
+    Capture only runs for sync requests, as cProfile sees a single thread, and
+    streamed bodies have no size up front.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.slow_ms = settings.REQUEST_PROFILING_SLOW_MS
+        self.capture = [re.compile(pattern) for pattern in settings.REQUEST_PROFILING_CAPTURE]
+        self.engine = settings.REQUEST_PROFILING_ENGINE
+        if self.engine not in ('cprofile', 'pyinstrument'):
+            raise ImproperlyConfigured("REQUEST_PROFILING_ENGINE must be 'cprofile' or 'pyinstrument'")
+        if self.capture and self.engine == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise ImproperlyConfigured("REQUEST_PROFILING_ENGINE 'pyinstrument' needs the pyinstrument package")
+        _time_serializers()
+        request_started.connect(_watch_connections, dispatch_uid='api.middleware.watch_connections')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = RequestProfile()
+        sampled = random.random() < self.sample_rate
+        token = _current.set(profile)
+        try:
+            if sampled and any(pattern.search(request.path) for pattern in self.capture):
+                response = self.profiled(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.report(request, response, profile, sampled)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.report(request, response, profile, random.random() < self.sample_rate)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called last, right before DRF renders the response
+        profile = _current.get()
+        if profile is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                profile.render += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def profiled(self, request):
+        directory = Path(settings.REQUEST_PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{time.perf_counter_ns() % 10**6:06d}-{request.method}-{slug}"
+
+        if self.engine == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return self.get_response(request)
+            finally:
+                profiler.stop()
+                (directory / f'{name}.html').write_text(profiler.output_html())
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self.get_response, request)
+        finally:
+            profiler.dump_stats(directory / f'{name}.prof')
+
+    def report(self, request, response, profile, sampled):
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        slow = total_ms >= self.slow_ms
+        if not (sampled or slow):
+            return
+
+        size = None if response.streaming else len(response.content)
+        timings = [
+            ('db', profile.db * 1000, f'{profile.queries} queries'),
+            ('serialize', profile.serialize * 1000, None),
+            ('render', profile.render * 1000, None),
+            ('total', total_ms, f'{size} bytes' if size is not None else None),
+        ]
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name};dur={duration:.1f}' + (f';desc="{desc}"' if desc else '')
+            for name, duration, desc in timings
+        )
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user': getattr(getattr(request, 'user', None), 'id', None),
+            'queries': profile.queries,
+            'db_ms': round(profile.db * 1000, 2),
+            'serialize_ms': round(profile.serialize * 1000, 2),
+            'render_ms': round(profile.render * 1000, 2),
+            'total_ms': round(total_ms, 2),
+            'bytes': size,
+            'slow': slow,
+        }))
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that stays async under ASGI. The stock middleware is sync only,
+    which makes Django run everything below it, async views included, on the
+    one sync thread of the worker: a slow async view would hold up the others.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Same lookup as WhiteNoiseMiddleware.__call__; files are indexed at startup
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
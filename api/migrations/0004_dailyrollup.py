@@ -0,0 +1,53 @@
+# Generated by Django 5.2.11 on 2026-10-17 00:34
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from django.db import migrations, models
+
+MODE_FIELDS = {'focus': 'focus_seconds', 'pause': 'pause_seconds', 'break': 'break_seconds'}
+
+
+def backfill_daily_rollups(apps, schema_editor):
+    # Profiles have no timezone yet, so days are UTC dates
+    Segment = apps.get_model('api', 'Segment')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+
+    totals = defaultdict(lambda: {'focus_seconds': 0, 'pause_seconds': 0, 'break_seconds': 0, 'segment_count': 0})
+    rows = Segment.objects.filter(end_at__isnull=False).values_list('session__user_id', 'mode', 'start_at', 'end_at')
+    for user_id, mode, start_at, end_at in rows.iterator(chunk_size=2000):
+        bucket = totals[(user_id, start_at.date())]
+        bucket[MODE_FIELDS[mode]] += int((end_at - start_at).total_seconds())
+        bucket['segment_count'] += 1
+
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(user_id=user_id, day=day, **values) for (user_id, day), values in totals.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_profile_ai_provider_profile_groq_api_key_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('focus_seconds', models.PositiveBigIntegerField(default=0)),
+                ('pause_seconds', models.PositiveBigIntegerField(default=0)),
+                ('break_seconds', models.PositiveBigIntegerField(default=0)),
+                ('segment_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.11 on 2026-10-17 00:34
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from django.db import migrations, models
+
+MODE_FIELDS = {'focus': 'focus_seconds', 'pause': 'pause_seconds', 'break': 'break_seconds'}
+
+
+def backfill_days(apps, schema_editor):
+    # Every profile starts out on UTC, so local days are UTC dates here
+    Segment = apps.get_model('api', 'Segment')
+    ActiveDay = apps.get_model('api', 'ActiveDay')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+
+    active = set()
+    totals = defaultdict(lambda: {'focus_seconds': 0, 'pause_seconds': 0, 'break_seconds': 0, 'segment_count': 0})
+    rows = Segment.objects.values_list('session__user_id', 'mode', 'start_at', 'end_at')
+    for user_id, mode, start_at, end_at in rows.iterator(chunk_size=2000):
+        key = (user_id, start_at.date())
+        if mode == 'focus':
+            active.add(key)
+        if end_at is not None:
+            bucket = totals[key]
+            bucket[MODE_FIELDS[mode]] += int((end_at - start_at).total_seconds())
+            bucket['segment_count'] += 1
+
+    ActiveDay.objects.bulk_create(
+        [ActiveDay(user_id=user_id, day=day) for user_id, day in active],
+        batch_size=1000
+    )
+    DailyRollup.objects.all().delete()
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(user_id=user_id, day=day, **values) for (user_id, day), values in totals.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_dailyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ActiveDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='active_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_active_day')],
+            },
+        ),
+        migrations.RunPython(backfill_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.11 on 2026-10-17 00:37
+
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+MODE_FIELDS = {'focus': 'focus_seconds', 'pause': 'pause_seconds', 'break': 'break_seconds'}
+
+
+def end_duplicate_active_sessions(apps, schema_editor):
+    # Keep each user's newest active session and end the older ones where the
+    # newer one started, so the unique constraint below can be created
+    Session = apps.get_model('api', 'Session')
+    Segment = apps.get_model('api', 'Segment')
+    Profile = apps.get_model('api', 'Profile')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+
+    duplicated = Session.objects.filter(status='active').values('user_id').annotate(n=Count('id')).filter(n__gt=1)
+    for row in duplicated:
+        user_id = row['user_id']
+        profile = Profile.objects.filter(user_id=user_id).first()
+        tz = ZoneInfo(profile.timezone if profile else 'UTC')
+        active = list(Session.objects.filter(user_id=user_id, status='active').order_by('-created_at'))
+        for newer, session in zip(active, active[1:]):
+            for seg in Segment.objects.filter(session=session, end_at__isnull=True):
+                seg.end_at = max(newer.created_at, seg.start_at)
+                seg.save(update_fields=['end_at'])
+                rollup, _ = DailyRollup.objects.get_or_create(user_id=user_id, day=seg.start_at.astimezone(tz).date())
+                field = MODE_FIELDS[seg.mode]
+                DailyRollup.objects.filter(pk=rollup.pk).update(**{
+                    field: F(field) + int((seg.end_at - seg.start_at).total_seconds()),
+                    'segment_count': F('segment_count') + 1,
+                })
+            session.status = 'ended'
+            session.ended_at = newer.created_at
+            session.save(update_fields=['status', 'ended_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_profile_timezone_activeday'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='segment',
+            index=models.Index(condition=models.Q(('end_at__isnull', True)), fields=['session'], name='segment_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='segment',
+            index=models.Index(fields=['session', 'start_at'], name='segment_session_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['user', 'created_at'], name='session_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='todo_user_created_idx'),
+        ),
+        migrations.RunPython(end_duplicate_active_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='session',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('user',), name='one_active_session_per_user'),
+        ),
+    ]
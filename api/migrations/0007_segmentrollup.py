@@ -0,0 +1,62 @@
+# Generated by Django 5.2.11 on 2026-10-17 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from zoneinfo import ZoneInfo
+from django.db import migrations, models
+
+
+def backfill_segment_rollups(apps, schema_editor):
+    Segment = apps.get_model('api', 'Segment')
+    Profile = apps.get_model('api', 'Profile')
+    SegmentRollup = apps.get_model('api', 'SegmentRollup')
+
+    zones = {user_id: ZoneInfo(name) for user_id, name in Profile.objects.values_list('user_id', 'timezone')}
+    utc = ZoneInfo('UTC')
+    totals = defaultdict(lambda: [0, 0])
+    rows = Segment.objects.filter(end_at__isnull=False).values_list(
+        'session__user_id', 'session__todo_id', 'mode', 'reason', 'start_at', 'end_at'
+    )
+    for user_id, todo_id, mode, reason, start_at, end_at in rows.iterator(chunk_size=2000):
+        day = start_at.astimezone(zones.get(user_id, utc)).date()
+        bucket = totals[(user_id, day, todo_id, mode, reason or '')]
+        bucket[0] += int((end_at - start_at).total_seconds())
+        bucket[1] += 1
+
+    SegmentRollup.objects.bulk_create(
+        [
+            SegmentRollup(user_id=user_id, day=day, todo_id=todo_id, mode=mode, reason=reason,
+                          seconds=seconds, segment_count=count)
+            for (user_id, day, todo_id, mode, reason), (seconds, count) in totals.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mode', models.CharField(choices=[('focus', 'Focus'), ('pause', 'Pause'), ('break', 'Break')], max_length=10)),
+                ('reason', models.CharField(blank=True, default='', max_length=10)),
+                ('seconds', models.PositiveBigIntegerField(default=0)),
+                ('segment_count', models.PositiveIntegerField(default=0)),
+                ('todo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.todo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segment_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'todo', 'mode', 'reason'), name='unique_segment_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_segment_rollups, migrations.RunPython.noop),
+    ]
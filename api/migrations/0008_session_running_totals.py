@@ -0,0 +1,54 @@
+# Generated by Django 5.2.11 on 2026-10-17 00:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_running_totals(apps, schema_editor):
+    Session = apps.get_model('api', 'Session')
+    Segment = apps.get_model('api', 'Segment')
+
+    totals = {}
+    rows = Segment.objects.values_list('session_id', 'id', 'mode', 'start_at', 'end_at').order_by('session_id', 'start_at')
+    for session_id, segment_id, mode, start_at, end_at in rows.iterator(chunk_size=2000):
+        entry = totals.setdefault(session_id, {'focus_seconds': 0, 'pause_seconds': 0, 'current_segment_id': None})
+        if end_at is None:
+            entry['current_segment_id'] = segment_id
+        else:
+            field = 'focus_seconds' if mode == 'focus' else 'pause_seconds'
+            entry[field] += int((end_at - start_at).total_seconds())
+
+    sessions = []
+    for session in Session.objects.filter(id__in=list(totals)).iterator(chunk_size=1000):
+        entry = totals[session.id]
+        session.focus_seconds = entry['focus_seconds']
+        session.pause_seconds = entry['pause_seconds']
+        session.current_segment_id = entry['current_segment_id'] if session.status == 'active' else None
+        sessions.append(session)
+    Session.objects.bulk_update(sessions, ['focus_seconds', 'pause_seconds', 'current_segment_id'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_segmentrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='current_segment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.segment'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='focus_seconds',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='pause_seconds',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.11 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_session_running_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='segment',
+            name='client_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='segment',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_key__isnull', False)), fields=('session', 'client_key'), name='unique_segment_client_key'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.11 on 2026-10-17 01:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_todo_tags(apps, schema_editor):
+    Todo = apps.get_model('api', 'Todo')
+    TodoTag = apps.get_model('api', 'TodoTag')
+
+    # Same normalization as api.tags.tag_names
+    rows = []
+    for todo_id, user_id, tags in Todo.objects.values_list('id', 'user_id', 'tags').iterator(chunk_size=2000):
+        names = {tag.strip() for tag in tags or [] if isinstance(tag, str) and tag.strip()}
+        rows.extend(TodoTag(todo_id=todo_id, user_id=user_id, name=name[:64]) for name in names)
+    TodoTag.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_segment_client_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('todo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_rows', to='api.todo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='todo_tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'name', 'todo'], name='todo_tag_user_name_idx')],
+                'constraints': [models.UniqueConstraint(fields=('todo', 'name'), name='unique_todo_tag')],
+            },
+        ),
+        migrations.RunPython(backfill_todo_tags, migrations.RunPython.noop),
+    ]
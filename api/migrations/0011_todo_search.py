@@ -0,0 +1,93 @@
+# Generated by Django 5.2.11 on 2026-10-17 01:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE api_todo ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX todo_search_idx ON api_todo USING GIN (search_vector)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS todo_search_idx",
+    "ALTER TABLE api_todo DROP COLUMN IF EXISTS search_vector",
+]
+
+# The UUID primary key has no stable rowid to link on, so todo_id is an
+# indexed FTS column and the triggers find a todo's entry with a MATCH on it
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE api_todo_fts USING fts5(
+        todo_id, user_id UNINDEXED, title, description,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    # Title hits outweigh description hits; the id columns never score
+    "INSERT INTO api_todo_fts (api_todo_fts, rank) VALUES ('rank', 'bm25(0, 0, 10.0, 4.0)')",
+    """
+    CREATE TRIGGER api_todo_fts_insert AFTER INSERT ON api_todo BEGIN
+        INSERT INTO api_todo_fts (todo_id, user_id, title, description)
+        VALUES (new.id, new.user_id, new.title, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER api_todo_fts_update AFTER UPDATE OF title, description ON api_todo BEGIN
+        UPDATE api_todo_fts SET title = new.title, description = coalesce(new.description, '')
+        WHERE api_todo_fts MATCH 'todo_id:' || old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_todo_fts_delete AFTER DELETE ON api_todo BEGIN
+        DELETE FROM api_todo_fts WHERE api_todo_fts MATCH 'todo_id:' || old.id;
+    END
+    """,
+    """
+    INSERT INTO api_todo_fts (todo_id, user_id, title, description)
+    SELECT id, user_id, title, coalesce(description, '') FROM api_todo
+    """,
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS api_todo_fts_insert",
+    "DROP TRIGGER IF EXISTS api_todo_fts_update",
+    "DROP TRIGGER IF EXISTS api_todo_fts_delete",
+    "DROP TABLE IF EXISTS api_todo_fts",
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {'postgresql': postgres, 'sqlite': sqlite}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_todotag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoSearchEntry',
+            fields=[
+                ('todo', models.OneToOneField(db_column='todo_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='api.todo')),
+                ('user_id', models.BigIntegerField()),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+            ],
+            options={
+                'db_table': 'api_todo_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_REVERSE, SQLITE_REVERSE),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.11 on 2026-10-17 02:07
+
+import datetime
+from collections import defaultdict
+from zoneinfo import ZoneInfo
+from django.db import migrations, models
+from api.archive import decode_segments
+
+MODE_FIELDS = {'focus': 'focus_time', 'pause': 'pause_time', 'break': 'break_time'}
+
+
+def backfill_exact_durations(apps, schema_editor):
+    # The old columns held per-segment whole seconds, so sum the segments again
+    Segment = apps.get_model('api', 'Segment')
+    SegmentArchive = apps.get_model('api', 'SegmentArchive')
+    Profile = apps.get_model('api', 'Profile')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+
+    zones = {user_id: ZoneInfo(name) for user_id, name in Profile.objects.values_list('user_id', 'timezone')}
+    utc = ZoneInfo('UTC')
+    totals = defaultdict(lambda: {field: datetime.timedelta(0) for field in MODE_FIELDS.values()})
+
+    def add(user_id, mode, start_at, end_at):
+        day = start_at.astimezone(zones.get(user_id, utc)).date()
+        totals[(user_id, day)][MODE_FIELDS[mode]] += end_at - start_at
+
+    rows = Segment.objects.filter(end_at__isnull=False).values_list('session__user_id', 'mode', 'start_at', 'end_at')
+    for user_id, mode, start_at, end_at in rows.iterator(chunk_size=2000):
+        add(user_id, mode, start_at, end_at)
+    for archive in SegmentArchive.objects.iterator(chunk_size=100):
+        for _, _, mode, _, start_at, end_at, _ in decode_segments(archive.month, bytes(archive.data)):
+            add(archive.user_id, mode, start_at, end_at)
+
+    rollups = []
+    for rollup in DailyRollup.objects.iterator(chunk_size=1000):
+        values = totals.get((rollup.user_id, rollup.day))
+        if values:
+            for field, value in values.items():
+                setattr(rollup, field, value)
+            rollups.append(rollup)
+    DailyRollup.objects.bulk_update(rollups, list(MODE_FIELDS.values()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_segment_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='break_time',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='focus_time',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='pause_time',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.RunPython(backfill_exact_durations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='dailyrollup',
+            name='break_seconds',
+        ),
+        migrations.RemoveField(
+            model_name='dailyrollup',
+            name='focus_seconds',
+        ),
+        migrations.RemoveField(
+            model_name='dailyrollup',
+            name='pause_seconds',
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.11 on 2026-10-17 02:09
+
+import datetime
+from collections import defaultdict
+from zoneinfo import ZoneInfo
+from django.db import migrations, models
+from api.archive import decode_segments
+
+
+def backfill_exact_durations(apps, schema_editor):
+    # The old column held per-segment whole seconds, so sum the segments again
+    Segment = apps.get_model('api', 'Segment')
+    SegmentArchive = apps.get_model('api', 'SegmentArchive')
+    Session = apps.get_model('api', 'Session')
+    Profile = apps.get_model('api', 'Profile')
+    SegmentRollup = apps.get_model('api', 'SegmentRollup')
+
+    zones = {user_id: ZoneInfo(name) for user_id, name in Profile.objects.values_list('user_id', 'timezone')}
+    utc = ZoneInfo('UTC')
+    totals = defaultdict(datetime.timedelta)
+
+    def add(user_id, todo_id, mode, reason, start_at, end_at):
+        day = start_at.astimezone(zones.get(user_id, utc)).date()
+        totals[(user_id, day, todo_id, mode, reason or '')] += end_at - start_at
+
+    rows = Segment.objects.filter(end_at__isnull=False).values_list(
+        'session__user_id', 'session__todo_id', 'mode', 'reason', 'start_at', 'end_at'
+    )
+    for row in rows.iterator(chunk_size=2000):
+        add(*row)
+    todos = dict(Session.objects.filter(archived=True).values_list('id', 'todo_id'))
+    for archive in SegmentArchive.objects.iterator(chunk_size=100):
+        for _, session_id, mode, reason, start_at, end_at, _ in decode_segments(archive.month, bytes(archive.data)):
+            add(archive.user_id, todos[session_id], mode, reason, start_at, end_at)
+
+    rollups = []
+    for rollup in SegmentRollup.objects.iterator(chunk_size=1000):
+        duration = totals.get((rollup.user_id, rollup.day, rollup.todo_id, rollup.mode, rollup.reason))
+        if duration is not None:
+            rollup.duration = duration
+            rollups.append(rollup)
+    SegmentRollup.objects.bulk_update(rollups, ['duration'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_dailyrollup_exact_durations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='segmentrollup',
+            name='duration',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.RunPython(backfill_exact_durations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='segmentrollup',
+            name='seconds',
+        ),
+    ]
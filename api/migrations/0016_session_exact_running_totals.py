@@ -0,0 +1,56 @@
+# Generated by Django 5.2.11 on 2026-10-17 02:12
+
+import datetime
+from django.db import migrations, models
+
+
+def backfill_running_totals(apps, schema_editor):
+    # The old columns held per-segment whole seconds; archived sessions kept exact totals
+    Session = apps.get_model('api', 'Session')
+    Segment = apps.get_model('api', 'Segment')
+
+    totals = {}
+    rows = Segment.objects.filter(end_at__isnull=False).values_list('session_id', 'mode', 'start_at', 'end_at')
+    for session_id, mode, start_at, end_at in rows.iterator(chunk_size=2000):
+        entry = totals.setdefault(session_id, {'focus_time': datetime.timedelta(0), 'pause_time': datetime.timedelta(0)})
+        entry['focus_time' if mode == 'focus' else 'pause_time'] += end_at - start_at
+
+    sessions = []
+    for session in Session.objects.filter(archived=True).iterator(chunk_size=1000):
+        session.focus_time = session.archived_focus or datetime.timedelta(0)
+        session.pause_time = session.archived_pause or datetime.timedelta(0)
+        sessions.append(session)
+    for session in Session.objects.filter(id__in=list(totals)).iterator(chunk_size=1000):
+        session.focus_time = totals[session.id]['focus_time']
+        session.pause_time = totals[session.id]['pause_time']
+        sessions.append(session)
+    Session.objects.bulk_update(sessions, ['focus_time', 'pause_time'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_segmentrollup_exact_durations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='focus_time',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='pause_time',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='session',
+            name='focus_seconds',
+        ),
+        migrations.RemoveField(
+            model_name='session',
+            name='pause_seconds',
+        ),
+    ]
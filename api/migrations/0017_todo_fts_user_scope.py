@@ -0,0 +1,46 @@
+# Generated by Django 5.2.11 on 2026-10-17 03:02
+
+from django.db import migrations
+
+# 0011 left user_id UNINDEXED, so a MATCH ran over every user's todos and
+# the user filter applied afterwards. Indexing it lets search_todos put the
+# user in the MATCH itself. The triggers on api_todo name the columns, not
+# the table definition, so they carry over unchanged.
+def rebuild_fts(user_column):
+    return [
+        "DROP TABLE api_todo_fts",
+        f"""
+        CREATE VIRTUAL TABLE api_todo_fts USING fts5(
+            todo_id, {user_column}, title, description,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+        """,
+        # Title hits outweigh description hits; the id columns never score
+        "INSERT INTO api_todo_fts (api_todo_fts, rank) VALUES ('rank', 'bm25(0, 0, 10.0, 4.0)')",
+        """
+        INSERT INTO api_todo_fts (todo_id, user_id, title, description)
+        SELECT id, user_id, title, coalesce(description, '') FROM api_todo
+        """,
+    ]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_session_exact_running_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_sqlite(rebuild_fts('user_id')),
+            run_on_sqlite(rebuild_fts('user_id UNINDEXED')),
+        ),
+    ]
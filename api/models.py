@@ -1,6 +1,43 @@
 import uuid
+from datetime import timedelta
 from django.db import models
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+def segment_duration(prefix='', now=None):
+    # Open segments run until ``now`` so totals include the live segment
+    end_at = F(f'{prefix}end_at')
+    if now is not None:
+        end_at = Coalesce(end_at, Value(now, output_field=DateTimeField()))
+    return ExpressionWrapper(end_at - F(f'{prefix}start_at'), output_field=DurationField())
+
+
+class TodoQuerySet(models.QuerySet):
+    def with_focus_totals(self):
+        # Closed focus time only; the frontend adds the live timer itself.
+        # Archived sessions join no segment rows, so each adds its kept total once.
+        zero = Value(timedelta(0), output_field=DurationField())
+        return self.annotate(
+            past_focus=Coalesce(Sum(
+                segment_duration('sessions__segments__'),
+                filter=Q(sessions__segments__mode='focus', sessions__segments__end_at__isnull=False)
+            ), zero) + Coalesce(Sum('sessions__archived_focus'), zero)
+        )
+
+
+class SessionQuerySet(models.QuerySet):
+    def with_totals(self, now=None):
+        # Archived sessions have no segment rows left; their totals were kept
+        now = now or timezone.now()
+        duration = segment_duration('segments__', now)
+        return self.annotate(
+            total_focus=Coalesce(Sum(duration, filter=Q(segments__mode='focus')), F('archived_focus')),
+            total_pause=Coalesce(Sum(duration, filter=Q(segments__mode__in=['pause', 'break'])), F('archived_pause')),
+        )
+
 
 class Todo(models.Model):
     PRIORITY_CHOICES = [
@@ -20,6 +57,14 @@ class Todo(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(blank=True, null=True)
 
+    objects = TodoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Todo list and its keyset pagination
+            models.Index(fields=['user', '-created_at', 'id'], name='todo_user_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -36,6 +81,36 @@ class Session(models.Model):
     ended_at = models.DateTimeField(blank=True, null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
 
+    # Denormalized for cheap polling: the open segment and the exact time of
+    # closed segments so far (pause includes break). A cache, so no DB
+    # constraint that would stop segments from being fast-deleted.
+    current_segment = models.ForeignKey(
+        'Segment', on_delete=models.DO_NOTHING, db_constraint=False,
+        blank=True, null=True, related_name='+'
+    )
+    focus_time = models.DurationField(default=timedelta(0))
+    pause_time = models.DurationField(default=timedelta(0))
+    # Set while the session's segments are packed into a SegmentArchive (see
+    # api.archive), with the exact totals the segments would sum to
+    archived = models.BooleanField(default=False)
+    archived_focus = models.DurationField(blank=True, null=True)
+    archived_pause = models.DurationField(blank=True, null=True)
+
+    objects = SessionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also serves as the index for the per-user active session lookup
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=Q(status='active'),
+                name='one_active_session_per_user'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='session_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"Session for {self.todo.title} ({self.status})"
 
@@ -58,8 +133,25 @@ class Segment(models.Model):
     start_at = models.DateTimeField()
     end_at = models.DateTimeField(blank=True, null=True)
     reason = models.CharField(max_length=10, choices=REASON_CHOICES, blank=True, null=True)
+    # Idempotency key from batched client transitions
+    client_key = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['session', 'client_key'],
+                condition=Q(client_key__isnull=False),
+                name='unique_segment_client_key'
+            ),
+        ]
+        indexes = [
+            # Open segments closed by transition/stop
+            models.Index(fields=['session'], condition=Q(end_at__isnull=True), name='segment_open_idx'),
+            # Per-session time ranges for history; reached through the session's user
+            models.Index(fields=['session', 'start_at'], name='segment_session_start_idx'),
+        ]
+
     def __str__(self):
         return f"{self.mode} segment for session {self.session_id}"
 
@@ -72,9 +164,132 @@ class Profile(models.Model):
     ollama_model = models.CharField(max_length=255, default="qwen2.5-coder:1.5b")
     groq_api_key = models.CharField(max_length=255, blank=True, null=True)
     groq_model = models.CharField(max_length=255, default="llama-3.3-70b-versatile")
+    timezone = models.CharField(max_length=64, default='UTC')
     
     # Generic settings blob for future-proofing
     settings_json = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Profile for {self.user.username}"
+
+class DailyRollup(models.Model):
+    # Per-user, per-day totals of closed segments, maintained as segments close.
+    # Exact durations: whole seconds are only taken of the sums that are shown
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    focus_time = models.DurationField(default=timedelta(0))
+    pause_time = models.DurationField(default=timedelta(0))
+    break_time = models.DurationField(default=timedelta(0))
+    segment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"Rollup for {self.user_id} on {self.day}"
+
+class ActiveDay(models.Model):
+    # One row per user per local day with at least one focus segment, used for streaks
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='active_days')
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_active_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} active on {self.day}"
+
+class SegmentRollup(models.Model):
+    # Closed segment time per user, local day, todo, mode and reason; backs history stats
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='segment_rollups')
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='rollups')
+    day = models.DateField()
+    mode = models.CharField(max_length=10, choices=Segment.MODE_CHOICES)
+    reason = models.CharField(max_length=10, blank=True, default='')
+    duration = models.DurationField(default=timedelta(0))
+    segment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Leads with (user, day) so it also serves the stats range scans
+            models.UniqueConstraint(fields=['user', 'day', 'todo', 'mode', 'reason'], name='unique_segment_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.mode} rollup for {self.todo_id} on {self.day}"
+
+class TodoTag(models.Model):
+    # One row per tag in Todo.tags, kept in sync on save, so tag filters and
+    # per-tag totals are index lookups rather than JSON scans
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todo_tags')
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='tag_rows')
+    name = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['todo', 'name'], name='unique_todo_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'name', 'todo'], name='todo_tag_user_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} on {self.todo_id}"
+
+class AccountDeletion(models.Model):
+    # Queue for api.deletion: accounts marked inactive whose rows are still
+    # being removed in batches. Outlives the user as a record of the deletion,
+    # hence no DB constraint on user.
+    user = models.OneToOneField(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='deletion'
+    )
+    requested_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Rows removed so far, by model name
+    deleted_rows = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['requested_at'], condition=Q(finished_at__isnull=True), name='account_deletion_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deletion of user {self.user_id}"
+
+class SegmentArchive(models.Model):
+    # The segments of a user's archived sessions created in one UTC month,
+    # packed column by column by api.archive; live history reads merge them back
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='segment_archives')
+    month = models.DateField()
+    session_count = models.PositiveIntegerField(default=0)
+    segment_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_segment_archive'),
+        ]
+
+    def __str__(self):
+        return f"Archive of {self.user_id} for {self.month:%Y-%m}"
+
+class TodoSearchEntry(models.Model):
+    # The SQLite FTS5 table behind todo search, maintained by triggers from
+    # migration 0011; mapped only so queries can join it. Postgres searches a
+    # generated tsvector column on api_todo instead and has no such table.
+    todo = models.OneToOneField(
+        Todo, on_delete=models.DO_NOTHING, db_constraint=False,
+        primary_key=True, db_column='todo_id', related_name='search_entry'
+    )
+    user_id = models.BigIntegerField()
+    title = models.TextField()
+    description = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'api_todo_fts'
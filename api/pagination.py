@@ -0,0 +1,145 @@
+import base64
+import json
+from operator import attrgetter
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (timestamp, id) key, e.g. ('-created_at', 'id').
+
+    Each page continues strictly after the last row of the previous one, so
+    the cost of a page does not depend on how deep the client has scrolled.
+    Pagination is opt-in: requests without ``cursor`` or ``page_size`` get the
+    plain list older clients expect.
+    """
+    ordering = ('-created_at', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request)
+        if page is None:
+            return None
+        return self.set_page(list(page))
+
+    def page_queryset(self, queryset, request):
+        # The rows of the requested page plus one, to tell whether more follow
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.cursor = self.decode_cursor(cursor, queryset.model) if cursor else None
+        if self.cursor:
+            queryset = queryset.filter(self.after(self.cursor))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def after(self, values):
+        # (-a, b) > (x, y)  <=>  a < x OR (a = x AND b > y)
+        (first, second), (first_value, second_value) = self.ordering, values
+        first_lookup = 'lt' if first.startswith('-') else 'gt'
+        second_lookup = 'lt' if second.startswith('-') else 'gt'
+        first, second = first.lstrip('-'), second.lstrip('-')
+        return Q(**{f'{first}__{first_lookup}': first_value}) | Q(
+            **{first: first_value, f'{second}__{second_lookup}': second_value}
+        )
+
+    def follows(self, obj):
+        """Whether ``obj`` is past the requested cursor, as the after() filter decides in SQL."""
+        if not self.cursor:
+            return True
+        for field, value in zip(self.ordering, self.cursor):
+            own = getattr(obj, field.lstrip('-'))
+            if own != value:
+                return own < value if field.startswith('-') else own > value
+        return False
+
+    def sort(self, rows):
+        """Order rows merged from outside the queryset like order_by(*self.ordering)."""
+        for field in reversed(self.ordering):
+            rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+        return rows
+
+    def encode_cursor(self, obj):
+        values = [str(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return [
+                self.decode_value(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, values, strict=True)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound("Invalid cursor")
+
+    def decode_value(self, model, field, value):
+        return model._meta.get_field(field).to_python(value)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CreatedKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', 'id')
+
+
+class StartKeysetPagination(KeysetPagination):
+    ordering = ('-start_at', 'id')
+
+
+class RankKeysetPagination(KeysetPagination):
+    """Search results, best ``search_rank`` first. Always paginated: there are no older clients to keep."""
+    ordering = ('-search_rank', 'id')
+
+    def is_requested(self, request):
+        return True
+
+    def decode_value(self, model, field, value):
+        if field == 'search_rank':
+            return float(value)
+        return super().decode_value(model, field, value)
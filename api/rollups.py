@@ -0,0 +1,151 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .archive import iter_archived_segments
+from .models import Segment, DailyRollup, SegmentRollup
+from .utils import user_timezone
+from .cache import invalidate_user
+
+MODE_FIELDS = {
+    'focus': 'focus_time',
+    'pause': 'pause_time',
+    'break': 'break_time',
+}
+
+
+def _empty_bucket():
+    return {'focus_time': timedelta(0), 'pause_time': timedelta(0), 'break_time': timedelta(0), 'segment_count': 0}
+
+
+def _empty_detail():
+    return {'duration': timedelta(0), 'segment_count': 0}
+
+
+class RollupTotals:
+    """Per-day and per-(day, todo, mode, reason) totals for a set of closed segments."""
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.daily = defaultdict(_empty_bucket)
+        self.detail = defaultdict(_empty_detail)
+
+    def add(self, todo_id, mode, reason, start_at, end_at):
+        # Segments count towards the user's local day they started on
+        day = timezone.localdate(start_at, timezone=self.tz)
+        bucket = self.daily[day]
+        bucket[MODE_FIELDS[mode]] += end_at - start_at
+        bucket['segment_count'] += 1
+        detail = self.detail[(day, todo_id, mode, reason or '')]
+        detail['duration'] += end_at - start_at
+        detail['segment_count'] += 1
+
+
+def _upsert(model, lookup, values):
+    increments = {field: F(field) + amount for field, amount in values.items()}
+    rows = model.objects.filter(**lookup)
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **values)
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(**increments)
+
+
+def apply_segments(user, rows, sign=1):
+    """
+    Add (or with ``sign=-1`` remove) closed segments in the user's rollups.
+    ``rows`` are ``(todo_id, mode, reason, start_at, end_at)`` tuples.
+    """
+    totals = RollupTotals(user_timezone(user))
+    for row in rows:
+        totals.add(*row)
+
+    for day, values in totals.daily.items():
+        _upsert(DailyRollup, {'user': user, 'day': day}, {k: sign * v for k, v in values.items()})
+    for (day, todo_id, mode, reason), values in totals.detail.items():
+        _upsert(
+            SegmentRollup,
+            {'user': user, 'day': day, 'todo_id': todo_id, 'mode': mode, 'reason': reason},
+            {k: sign * v for k, v in values.items()}
+        )
+    if sign < 0:
+        # Rebuilt rollups have no rows for empty buckets, so neither should these
+        days = list(totals.daily)
+        DailyRollup.objects.filter(user=user, day__in=days, segment_count=0).delete()
+        SegmentRollup.objects.filter(user=user, day__in=days, segment_count=0).delete()
+
+
+def record_closed_segments(user, todo_id, segments, end_at):
+    """Add segments of one of ``todo_id``'s sessions that were just closed at ``end_at``."""
+    for seg in segments:
+        seg.end_at = end_at
+    apply_segments(user, [(todo_id, seg.mode, seg.reason, seg.start_at, end_at) for seg in segments])
+
+
+def closed_segment_rows(segments):
+    return segments.filter(end_at__isnull=False).values_list(
+        'session__todo_id', 'mode', 'reason', 'start_at', 'end_at'
+    )
+
+
+def archived_segment_rows(user, sessions=None):
+    """closed_segment_rows for the user's archived segments, optionally of a Session queryset."""
+    for seg in iter_archived_segments(user, sessions):
+        yield seg.session.todo_id, seg.mode, seg.reason, seg.start_at, seg.end_at
+
+
+def compute_rollups(user):
+    """Recompute both rollup tables' contents from the raw segment history, archives included."""
+    totals = RollupTotals(user_timezone(user))
+    for row in closed_segment_rows(Segment.objects.filter(session__user=user)).iterator(chunk_size=2000):
+        totals.add(*row)
+    for row in archived_segment_rows(user):
+        totals.add(*row)
+    return dict(totals.daily), dict(totals.detail)
+
+
+def stored_rollups(user):
+    daily = DailyRollup.objects.filter(user=user).values(
+        'day', 'focus_time', 'pause_time', 'break_time', 'segment_count'
+    )
+    detail = SegmentRollup.objects.filter(user=user).values(
+        'day', 'todo_id', 'mode', 'reason', 'duration', 'segment_count'
+    )
+    return (
+        {row.pop('day'): row for row in daily},
+        {(row.pop('day'), row.pop('todo_id'), row.pop('mode'), row.pop('reason')): row for row in detail},
+    )
+
+
+def rebuild_rollups(user):
+    daily, detail = compute_rollups(user)
+    with transaction.atomic():
+        DailyRollup.objects.filter(user=user).delete()
+        SegmentRollup.objects.filter(user=user).delete()
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(user=user, day=day, **values) for day, values in daily.items()],
+            batch_size=1000
+        )
+        SegmentRollup.objects.bulk_create(
+            [
+                SegmentRollup(user=user, day=day, todo_id=todo_id, mode=mode, reason=reason, **values)
+                for (day, todo_id, mode, reason), values in detail.items()
+            ],
+            batch_size=1000
+        )
+    invalidate_user(user.id)
+    return len(daily)
+
+
+def total_focus_seconds(user):
+    total = DailyRollup.objects.filter(user=user).aggregate(total=Sum('focus_time'))['total']
+    return total.total_seconds() if total else 0
+
+
+async def atotal_focus_seconds(user):
+    total = (await DailyRollup.objects.filter(user=user).aaggregate(total=Sum('focus_time')))['total']
+    return total.total_seconds() if total else 0
@@ -0,0 +1,55 @@
+import re
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+TSQUERY = "websearch_to_tsquery('english', %s)"
+
+
+def fts_query(text, user_id=None):
+    """
+    An FTS5 query for the words of ``text``: all must appear in the title or
+    description, the last one as a prefix so results follow the user's typing.
+    Quoting every word keeps FTS5 operators in user input literal. With
+    ``user_id`` only that user's entries match.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    query = '{title description} : (' + ' '.join(terms) + ')'
+    return f'user_id : "{user_id}" AND {query}' if user_id is not None else query
+
+
+def search_todos(queryset, text, user=None):
+    """
+    Limit a Todo queryset to matches for ``text``, annotated with a
+    ``search_rank`` where higher is better. Postgres uses the generated
+    ``search_vector`` column and its GIN index, SQLite the FTS5 table; both
+    come from migration 0011. Pass ``user`` when the queryset is one user's
+    todos, so the FTS5 lookup only reads that user's entries (migration 0017).
+    Other backends fall back to substring matching.
+    """
+    if connection.vendor == 'postgresql':
+        return queryset.filter(
+            RawSQL(f'"api_todo"."search_vector" @@ {TSQUERY}', [text], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank_cd("api_todo"."search_vector", {TSQUERY})', [text], output_field=FloatField())
+        )
+
+    if connection.vendor == 'sqlite':
+        query = fts_query(text, user.id if user is not None else None)
+        if query is None:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+        # Joins the FTS table, which the MATCH and bm25() below refer to by name
+        return queryset.filter(search_entry__isnull=False).filter(
+            RawSQL('"api_todo_fts" MATCH %s', [query], output_field=BooleanField())
+        ).annotate(
+            # rank is bm25 with the column weights set in the migration; lower is better
+            search_rank=RawSQL('-"api_todo_fts"."rank"', [], output_field=FloatField())
+        )
+
+    return queryset.filter(Q(title__icontains=text) | Q(description__icontains=text)).annotate(
+        search_rank=Case(When(title__icontains=text, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+    )
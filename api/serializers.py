@@ -1,66 +1,56 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .ai import AIError, check_ollama_url
 from .models import Todo, Session, Segment, Profile
+from .rollups import total_focus_seconds
+from .streaks import current_streak, longest_streak
+from .tags import tag_names
+from .utils import get_zone
 from django.utils import timezone
 
 class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = Profile
-        fields = ('zen_mode_audio_enabled', 'ai_enabled', 'ai_provider', 'ollama_url', 'ollama_model', 'groq_api_key', 'groq_model', 'settings_json')
+        fields = ('zen_mode_audio_enabled', 'ai_enabled', 'ai_provider', 'ollama_url', 'ollama_model', 'groq_api_key', 'groq_model', 'timezone', 'settings_json')
+
+    def validate_timezone(self, value):
+        if get_zone(value) is None:
+            raise serializers.ValidationError("Unknown timezone")
+        return value
+
+    def validate_ollama_url(self, value):
+        try:
+            check_ollama_url(value)
+        except AIError as exc:
+            raise serializers.ValidationError(exc.message)
+        return value
 
 class UserSerializer(serializers.ModelSerializer):
     current_streak = serializers.SerializerMethodField()
+    longest_streak = serializers.SerializerMethodField()
     total_focus_minutes = serializers.SerializerMethodField()
     profile = ProfileSerializer(read_only=True)
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'current_streak', 'total_focus_minutes', 'profile')
+        fields = ('id', 'username', 'email', 'current_streak', 'longest_streak', 'total_focus_minutes', 'profile')
 
+    # Async views compute these ahead into ``profile_stats``, since a
+    # serializer cannot query from the event loop; otherwise each is a query
     def get_current_streak(self, obj):
-        from datetime import date, timedelta
-        # Get all dates with at least one focus segment
-        segments = Segment.objects.filter(
-            session__user=obj, 
-            mode='focus'
-        ).values_list('start_at', flat=True)
-        
-        # Convert timestamps to distinct dates
-        active_dates = set(dt.date() for dt in segments)
-        
-        if not active_dates:
-            return 0
-            
-        today = timezone.now().date()
-        streak = 0
-        
-        # Check if user focused today or yesterday to keep streak alive
-        if today in active_dates:
-            streak = 1
-            check_date = today - timedelta(days=1)
-        elif (today - timedelta(days=1)) in active_dates:
-            streak = 0 # Will verify yesterday in loop or just start checking from yesterday
-            check_date = today - timedelta(days=1)
-        else:
-            return 0
-
-        while check_date in active_dates:
-            streak += 1
-            check_date -= timedelta(days=1)
-            
-        return streak
+        if hasattr(obj, 'profile_stats'):
+            return obj.profile_stats['current_streak']
+        return current_streak(obj)
+
+    def get_longest_streak(self, obj):
+        if hasattr(obj, 'profile_stats'):
+            return obj.profile_stats['longest_streak']
+        return longest_streak(obj)
 
     def get_total_focus_minutes(self, obj):
-        segments = Segment.objects.filter(
-            session__user=obj, 
-            mode='focus', 
-            end_at__isnull=False
-        )
-        total_seconds = 0
-        for seg in segments:
-            total_seconds += (seg.end_at - seg.start_at).total_seconds()
-        
-        return int(total_seconds / 60)
+        if hasattr(obj, 'profile_stats'):
+            return int(obj.profile_stats['total_focus_seconds'] / 60)
+        return int(total_focus_seconds(obj) / 60)
 
 class SegmentSerializer(serializers.ModelSerializer):
     segment_duration_seconds = serializers.SerializerMethodField()
@@ -82,7 +72,19 @@ class SegmentSerializer(serializers.ModelSerializer):
         return 0
 
     def get_session_todo_id(self, obj):
-        return obj.session.todo.id if obj.session and obj.session.todo else None
+        # todo_id is on the session row, so this never needs the Todo itself
+        return obj.session.todo_id if obj.session else None
+
+def _seconds(duration):
+    return int(duration.total_seconds()) if duration else 0
+
+def _live_seconds(segments, modes):
+    total = 0
+    now = timezone.now()
+    for seg in segments:
+        if seg.mode in modes and seg.start_at:
+            total += ((seg.end_at or now) - seg.start_at).total_seconds()
+    return int(total)
 
 class SessionSerializer(serializers.ModelSerializer):
     segments = SegmentSerializer(many=True, read_only=True)
@@ -97,26 +99,18 @@ class SessionSerializer(serializers.ModelSerializer):
             'session_total_pause_seconds'
         )
 
+    # Querysets built with Session.objects.with_totals() carry the sums already;
+    # otherwise fall back to the (possibly prefetched) segments
     def get_session_total_focus_seconds(self, obj):
-        segments = obj.segments.filter(mode='focus')
-        total = 0
-        for seg in segments:
-            if seg.start_at and seg.end_at:
-                total += (seg.end_at - seg.start_at).total_seconds()
-            elif seg.start_at and not seg.end_at:
-                total += (timezone.now() - seg.start_at).total_seconds()
-        return int(total)
+        if hasattr(obj, 'total_focus'):
+            return _seconds(obj.total_focus)
+        return _live_seconds(obj.segments.all(), ('focus',))
 
     def get_session_total_pause_seconds(self, obj):
         # pause + break
-        segments = obj.segments.filter(mode__in=['pause', 'break'])
-        total = 0
-        for seg in segments:
-            if seg.start_at and seg.end_at:
-                total += (seg.end_at - seg.start_at).total_seconds()
-            elif seg.start_at and not seg.end_at:
-                total += (timezone.now() - seg.start_at).total_seconds()
-        return int(total)
+        if hasattr(obj, 'total_pause'):
+            return _seconds(obj.total_pause)
+        return _live_seconds(obj.segments.all(), ('pause', 'break'))
 
 class TodoSerializer(serializers.ModelSerializer):
     sessions = SessionSerializer(many=True, read_only=True)
@@ -131,12 +125,76 @@ class TodoSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('user',)
 
+    def validate_tags(self, value):
+        if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+            raise serializers.ValidationError("tags must be a list of strings")
+        if any(len(tag.strip()) > 64 for tag in value):
+            raise serializers.ValidationError("Tags are limited to 64 characters")
+        return tag_names(value)
+
     def get_past_focus_seconds(self, obj):
         # Calculate sum of all closed focus segments across all sessions
         # Open segments (current focus) are excluded so frontend can add live timer
+        if hasattr(obj, 'past_focus'):
+            return _seconds(obj.past_focus)
         total = 0
         for session in obj.sessions.all():
             for seg in session.segments.all():
                 if seg.mode == 'focus' and seg.end_at and seg.start_at:
                     total += (seg.end_at - seg.start_at).total_seconds()
         return int(total)
+
+class TodoSummarySerializer(serializers.ModelSerializer):
+    # List representation without the nested session tree; sessions are
+    # loaded per todo from todos/<id>/sessions/
+    past_focus_seconds = serializers.SerializerMethodField()
+    session_count = serializers.IntegerField(read_only=True)
+    last_session_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Todo
+        fields = (
+            'id', 'user', 'title', 'description', 'priority',
+            'estimated_minutes', 'tags', 'created_at', 'updated_at',
+            'completed_at', 'past_focus_seconds', 'session_count', 'last_session_at'
+        )
+        read_only_fields = fields
+
+    def get_past_focus_seconds(self, obj):
+        return _seconds(obj.past_focus)
+
+class TransitionEventSerializer(serializers.Serializer):
+    mode = serializers.ChoiceField(choices=Segment.MODE_CHOICES)
+    reason = serializers.ChoiceField(choices=Segment.REASON_CHOICES, default='manual')
+    at = serializers.DateTimeField()
+    key = serializers.CharField(max_length=64, required=False)
+
+class TransitionBatchSerializer(serializers.Serializer):
+    transitions = TransitionEventSerializer(many=True, allow_empty=False, max_length=500)
+
+class ImportRowSerializer(serializers.Serializer):
+    """One row of an import file: a todo, optionally with one closed segment of a session."""
+
+    # Grouping keys within the file; imported rows always get new ids
+    todo_id = serializers.CharField(max_length=64, required=False)
+    todo_title = serializers.CharField(max_length=255)
+    tags = serializers.ListField(child=serializers.CharField(max_length=64), required=False, max_length=20)
+    priority = serializers.ChoiceField(choices=Todo.PRIORITY_CHOICES, required=False)
+    estimated_minutes = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+    completed_at = serializers.DateTimeField(required=False, allow_null=True)
+    session_id = serializers.CharField(max_length=64, required=False)
+    mode = serializers.ChoiceField(choices=Segment.MODE_CHOICES, required=False)
+    reason = serializers.ChoiceField(choices=Segment.REASON_CHOICES, required=False, allow_null=True)
+    start_at = serializers.DateTimeField(required=False)
+    end_at = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'mode' not in attrs:
+            return attrs
+        if 'start_at' not in attrs or 'end_at' not in attrs:
+            raise serializers.ValidationError("Segments need both start_at and end_at")
+        if attrs['end_at'] < attrs['start_at']:
+            raise serializers.ValidationError("end_at must not be before start_at")
+        if attrs['end_at'] > timezone.now():
+            raise serializers.ValidationError("Segments cannot end in the future")
+        return attrs
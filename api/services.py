@@ -0,0 +1,188 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from .compaction import compact_sessions
+from .models import Session, Segment
+from .rollups import apply_segments, record_closed_segments
+from .streaks import mark_active
+from .events import publish_session_event
+
+
+class SessionError(Exception):
+    """A session state change that cannot be applied; views return it as ``{"error": message}``."""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.errors = errors
+
+
+def lock_user_sessions(user, session_id=None):
+    """
+    Serialize state changes for ``user`` within the current transaction and
+    return their active session (or None), re-read under the lock. Pass
+    ``session_id`` to require that specific session to still be active.
+
+    The user row is locked first so that starts, which have no session to
+    lock yet, queue behind transitions too. SQLite ignores FOR UPDATE; there
+    the IMMEDIATE transaction mode in settings takes the write lock up front.
+    """
+    User.objects.select_for_update().only('id').get(pk=user.pk)
+    sessions = Session.objects.select_for_update().filter(user=user, status='active')
+    if session_id is not None:
+        session = sessions.filter(id=session_id).first()
+        if session is None:
+            raise SessionError("Active session not found", status.HTTP_404_NOT_FOUND)
+        return session
+    return sessions.first()
+
+
+def start_session(user, todo, now=None):
+    try:
+        # one_active_session_per_user still backs up the lock if a write slips past it
+        with transaction.atomic():
+            # Constraint: Only 1 active session per user
+            if lock_user_sessions(user) is not None:
+                raise SessionError("Another session is already active")
+            now = now or timezone.now()
+            session = Session.objects.create(user=user, todo=todo, created_at=now, status='active')
+
+            # Create first focus segment
+            segment = Segment.objects.create(session=session, mode='focus', start_at=now)
+            session.current_segment = segment
+            session.save(update_fields=['current_segment'])
+            mark_active(user, now)
+    except IntegrityError:
+        raise SessionError("Another session is already active")
+    publish_session_event(user.id, 'session.started', session, segment)
+    return session
+
+
+def close_open_segments(user, session, now):
+    """
+    Close the session's open segments at ``now``, folding them into the
+    rollups and the session's running totals. Returns the closed segments.
+    """
+    open_segments = Segment.objects.filter(session=session, end_at__isnull=True)
+    closing = list(open_segments)
+    if not closing:
+        return closing
+
+    open_segments.update(end_at=now)
+    record_closed_segments(user, session.todo_id, closing, now)
+    for seg in closing:
+        if seg.mode == 'focus':
+            session.focus_time += now - seg.start_at
+        else:
+            session.pause_time += now - seg.start_at
+    return closing
+
+
+def transition_session(user, session, mode, reason='manual', now=None):
+    if mode not in ['focus', 'pause', 'break']:
+        raise SessionError("Invalid mode")
+
+    with transaction.atomic():
+        session = lock_user_sessions(user, session.id)
+        # Taken after the lock so a queued request never starts before the one it waited on
+        now = now or timezone.now()
+        if not close_open_segments(user, session, now):
+            raise SessionError("No open segment found to transition from")
+
+        # Create new segment
+        segment = Segment.objects.create(session=session, mode=mode, start_at=now, reason=reason)
+        session.current_segment = segment
+        session.save(update_fields=['current_segment', 'focus_time', 'pause_time'])
+        if mode == 'focus':
+            mark_active(user, now)
+    publish_session_event(user.id, 'session.transition', session, segment)
+    return segment
+
+
+def stop_session(user, session, now=None):
+    with transaction.atomic():
+        session = lock_user_sessions(user, session.id)
+        now = now or timezone.now()
+        close_open_segments(user, session, now)
+        # Fold idle/hidden flapping into the segments around it
+        compact_sessions(user, [session])
+
+        # End session
+        session.status = 'ended'
+        session.ended_at = now
+        session.current_segment = None
+        session.save()
+    publish_session_event(user.id, 'session.stopped', session)
+    return session
+
+
+def apply_transitions(user, session, events, now=None):
+    """
+    Replay an ordered batch of client transitions (``mode``, ``reason``,
+    ``at``, optional ``key``) onto the session in one transaction. Events whose
+    key was already applied are skipped, so a retried batch is harmless.
+    Returns ``(new_segments, duplicate_keys)``; raises SessionError with
+    per-event ``errors`` if the batch does not fit the session's timeline.
+    """
+    with transaction.atomic():
+        session = lock_user_sessions(user, session.id)
+        now = now or timezone.now()
+        keys = [event['key'] for event in events if event.get('key')]
+        seen = set(Segment.objects.filter(session=session, client_key__in=keys).values_list('client_key', flat=True))
+        duplicates = [key for key in keys if key in seen]
+        events = [event for event in events if event.get('key') not in seen]
+        if not events:
+            return [], duplicates
+
+        open_segments = list(Segment.objects.filter(session=session, end_at__isnull=True).order_by('start_at'))
+        if not open_segments:
+            raise SessionError("No open segment found to transition from")
+
+        errors = []
+        previous_at = open_segments[-1].start_at
+        batch_keys = set()
+        for index, event in enumerate(events):
+            # Client clocks may run slightly ahead; nothing may start after the server's now
+            event['at'] = min(event['at'], now)
+            if event['at'] < previous_at:
+                errors.append({'index': index, 'error': "Transitions must be in order and after the open segment started"})
+            if event.get('key'):
+                if event['key'] in batch_keys:
+                    errors.append({'index': index, 'error': "Duplicate key in batch"})
+                batch_keys.add(event['key'])
+            previous_at = max(previous_at, event['at'])
+        if errors:
+            raise SessionError("Invalid transitions", errors=errors)
+
+        # Each event closes the segment before it; the last one stays open
+        first_at = events[0]['at']
+        for seg in open_segments:
+            seg.end_at = first_at
+        new_segments = [
+            Segment(
+                session=session,
+                mode=event['mode'],
+                reason=event.get('reason', 'manual'),
+                start_at=event['at'],
+                end_at=events[index + 1]['at'] if index + 1 < len(events) else None,
+                client_key=event.get('key'),
+            )
+            for index, event in enumerate(events)
+        ]
+        closed = open_segments + new_segments[:-1]
+
+        Segment.objects.bulk_update(open_segments, ['end_at'])
+        Segment.objects.bulk_create(new_segments)
+        apply_segments(user, [(session.todo_id, seg.mode, seg.reason, seg.start_at, seg.end_at) for seg in closed])
+        for seg in closed:
+            if seg.mode == 'focus':
+                session.focus_time += seg.end_at - seg.start_at
+            else:
+                session.pause_time += seg.end_at - seg.start_at
+        session.current_segment = new_segments[-1]
+        session.save(update_fields=['current_segment', 'focus_time', 'pause_time'])
+        mark_active(user, *[seg.start_at for seg in new_segments if seg.mode == 'focus'])
+    publish_session_event(user.id, 'session.transition', session, new_segments[-1])
+    return new_segments, duplicates
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import forget_user
+from .cache import invalidate_user
+from .models import Todo, Session, Segment, Profile
+from .tags import sync_todo_tags
+
+# Only post_save for sessions and segments: a post_delete receiver on them
+# would stop Django from fast-deleting them when a todo or user is removed.
+
+
+@receiver(post_save, sender=Segment)
+def segment_saved(sender, instance, **kwargs):
+    invalidate_user(instance.session.user_id)
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+@receiver(post_save, sender=Profile)
+def user_data_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Todo)
+def todo_tags_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'tags' in update_fields:
+        sync_todo_tags([instance])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+    forget_user(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    forget_user(instance.id)
@@ -0,0 +1,101 @@
+from datetime import timedelta
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Trunc, TruncMonth, TruncWeek
+from .models import Todo, TodoTag, Segment, SegmentRollup, segment_duration
+from .tags import filter_by_tags
+from .utils import day_bounds
+
+BUCKETS = ('day', 'week', 'month')
+# Breakdown name -> the rollup column it groups on; tags are resolved from todos
+BREAKDOWNS = {'todo': 'todo', 'tag': 'todo', 'reason': 'reason'}
+
+
+def _totals():
+    zero = timedelta(0)
+    return {'focus_seconds': zero, 'pause_seconds': zero, 'break_seconds': zero, 'segment_count': 0}
+
+
+def _to_seconds(entry):
+    # Durations are summed exactly and only the sums cut to whole seconds
+    for field in ('focus_seconds', 'pause_seconds', 'break_seconds'):
+        entry[field] = int(entry[field].total_seconds())
+    return entry
+
+
+def _group(by):
+    return ['bucket', 'mode'] + ([BREAKDOWNS[by]] if by else [])
+
+
+def _breakdown_keys(by, rows):
+    """Return a function mapping a row's breakdown value to the (key, label) pairs it counts towards."""
+    if by == 'reason':
+        return lambda value: [(value or None, value or None)]
+    todo_ids = {row['todo'] for row in rows}
+    if by == 'todo':
+        titles = dict(Todo.objects.filter(id__in=todo_ids).values_list('id', 'title'))
+        return lambda value: [(value, titles[value])]
+    # A todo's time counts towards each of its tags
+    tags = {}
+    for todo_id, name in TodoTag.objects.filter(todo_id__in=todo_ids).values_list('todo_id', 'name'):
+        tags.setdefault(todo_id, []).append((name, name))
+    return lambda value: tags.get(value) or [(None, None)]
+
+
+def assemble(rows, by):
+    """Turn (bucket, mode[, breakdown]) aggregate rows into the stats response body."""
+    rows = list(rows)
+    keys_for = _breakdown_keys(by, rows) if by else None
+    totals = _totals()
+    buckets = {}
+    for row in rows:
+        field = f"{row['mode']}_seconds"
+        bucket = buckets.setdefault(row['bucket'], {'bucket': row['bucket'], **_totals(), 'breakdown': {}})
+        targets = [totals, bucket]
+        if by:
+            for key, label in keys_for(row[BREAKDOWNS[by]]):
+                targets.append(bucket['breakdown'].setdefault(key, {'key': key, 'label': label, **_totals()}))
+        for target in targets:
+            target[field] += row['duration']
+            target['segment_count'] += row['segment_count']
+
+    for bucket in buckets.values():
+        breakdown = sorted(bucket['breakdown'].values(), key=lambda entry: -entry['focus_seconds'])
+        bucket['breakdown'] = [_to_seconds(entry) for entry in breakdown] if by else None
+        _to_seconds(bucket)
+    return {'totals': _to_seconds(totals), 'buckets': list(buckets.values())}
+
+
+def rollup_stats(user, start, end, bucket='day', by=None, tags=()):
+    """Stats for the local days ``start``..``end`` read from SegmentRollup, limited to todos with all ``tags``."""
+    rows = filter_by_tags(SegmentRollup.objects.filter(user=user, day__gte=start, day__lte=end), user, tags, 'todo__')
+    if bucket == 'week':
+        rows = rows.annotate(bucket=TruncWeek('day'))
+    elif bucket == 'month':
+        rows = rows.annotate(bucket=TruncMonth('day'))
+    else:
+        rows = rows.annotate(bucket=F('day'))
+    rows = rows.values(*_group(by)).annotate(
+        duration=Sum('duration'),
+        segment_count=Sum('segment_count'),
+    ).order_by('bucket')
+    return assemble(rows, by)
+
+
+def raw_stats(user, start, end, tz, bucket='day', by=None, tags=()):
+    """The same stats aggregated from raw segments; the baseline the rollups replace."""
+    range_start, range_end = day_bounds(start, end, tz)
+    segments = Segment.objects.filter(
+        session__user=user,
+        end_at__isnull=False,
+        start_at__gte=range_start,
+        start_at__lt=range_end
+    )
+    segments = filter_by_tags(segments, user, tags, 'session__todo__').annotate(
+        bucket=Trunc('start_at', bucket, output_field=DateField(), tzinfo=tz),
+        todo=F('session__todo'),
+    )
+    rows = segments.values(*_group(by)).annotate(
+        duration=Sum(segment_duration()),
+        segment_count=Count('id'),
+    ).order_by('bucket')
+    return assemble(rows, by)
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .archive import iter_archived_segments
+from .models import Segment, ActiveDay
+from .utils import day_bounds, user_timezone
+
+
+def mark_active(user, *start_ats):
+    """Record the user's local days of newly started focus segments."""
+    tz = user_timezone(user)
+    days = {timezone.localdate(start_at, timezone=tz) for start_at in start_ats}
+    ActiveDay.objects.bulk_create([ActiveDay(user=user, day=day) for day in days], ignore_conflicts=True)
+
+
+def refresh_active_days(user, start_ats):
+    """Drop the local days of ``start_ats`` that no longer have any focus segment."""
+    tz = user_timezone(user)
+    for day in {timezone.localdate(start_at, timezone=tz) for start_at in start_ats}:
+        day_start, day_end = day_bounds(day, day, tz)
+        still_active = Segment.objects.filter(
+            session__user=user,
+            mode='focus',
+            start_at__gte=day_start,
+            start_at__lt=day_end
+        ).exists() or any(
+            seg.mode == 'focus' for seg in iter_archived_segments(user, start_at=day_start, end_at=day_end)
+        )
+        if not still_active:
+            ActiveDay.objects.filter(user=user, day=day).delete()
+
+
+def compute_active_days(user):
+    tz = user_timezone(user)
+    starts = Segment.objects.filter(session__user=user, mode='focus').values_list('start_at', flat=True)
+    days = {timezone.localdate(start_at, timezone=tz) for start_at in starts.iterator(chunk_size=2000)}
+    days.update(
+        timezone.localdate(seg.start_at, timezone=tz) for seg in iter_archived_segments(user) if seg.mode == 'focus'
+    )
+    return days
+
+
+def stored_active_days(user):
+    return set(ActiveDay.objects.filter(user=user).values_list('day', flat=True))
+
+
+def rebuild_active_days(user):
+    days = compute_active_days(user)
+    with transaction.atomic():
+        ActiveDay.objects.filter(user=user).delete()
+        ActiveDay.objects.bulk_create([ActiveDay(user=user, day=day) for day in days], batch_size=1000)
+    return len(days)
+
+
+def _current_run(days, today):
+    # Walk back from the most recent active day; a streak stays alive until
+    # the user misses a full day, so it may end yesterday
+    streak = 0
+    expected = None
+    for day in days:
+        if expected is None:
+            if day < today - timedelta(days=1):
+                return 0
+            expected = day
+        if day != expected:
+            break
+        streak += 1
+        expected = day - timedelta(days=1)
+    return streak
+
+
+def _longest_run(days):
+    longest = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    return longest
+
+
+def current_streak(user):
+    today = timezone.localdate(timezone=user_timezone(user))
+    days = ActiveDay.objects.filter(user=user, day__lte=today).order_by('-day').values_list('day', flat=True)
+    return _current_run(days.iterator(chunk_size=64), today)
+
+
+def longest_streak(user):
+    days = ActiveDay.objects.filter(user=user).order_by('day').values_list('day', flat=True)
+    return _longest_run(days.iterator(chunk_size=2000))
+
+
+async def astreaks(user, tz):
+    """``(current_streak, longest_streak)`` from one async query, for async views."""
+    days = ActiveDay.objects.filter(user=user).order_by('day').values_list('day', flat=True)
+    days = [day async for day in days.aiterator(chunk_size=2000)]
+    today = timezone.localdate(timezone=tz)
+    return _current_run(reversed([day for day in days if day <= today]), today), _longest_run(days)
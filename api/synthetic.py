@@ -0,0 +1,95 @@
+import random
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import Todo, Session, Segment
+from .rollups import rebuild_rollups
+from .streaks import rebuild_active_days
+from .tags import sync_todo_tags
+from .utils import backdate, user_timezone
+
+TAGS = ['work', 'study', 'reading', 'writing', 'admin', 'health', 'side-project']
+REASONS = ['idle', 'hidden', 'manual', 'alert']
+
+
+def _session_segments(rng, start):
+    """Alternating focus and pause/break segments for one session, starting at ``start``."""
+    segments = []
+    for index in range(rng.randint(1, 4) * 2 - 1):
+        if index % 2 == 0:
+            mode, reason, minutes = 'focus', rng.choice([None, 'manual']), rng.randint(10, 50)
+        else:
+            mode = rng.choice(['pause', 'pause', 'break'])
+            reason, minutes = rng.choice(REASONS), rng.randint(1, 15)
+        end = start + timedelta(minutes=minutes, seconds=rng.randint(0, 59))
+        segments.append((mode, reason, start, end))
+        start = end
+    return segments
+
+
+def generate_history(user, days, sessions_per_day=4, todos_per_week=10, seed=0, now=None):
+    """
+    Bulk-create ``days`` of ended sessions for ``user``, ending today in their
+    timezone, then rebuild their rollups and streak days. Todos are created a
+    week at a time and sessions pick from the current week's todos. The same
+    ``seed`` always yields the same history shape. Returns row counts.
+    """
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    tz = user_timezone(user)
+    first_day = timezone.localdate(now, timezone=tz) - timedelta(days=days - 1)
+
+    todos, todo_created, sessions, session_segments = [], {}, [], []
+    week_todos = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        day_start = timezone.make_aware(datetime.combine(day, time(7)), tz)
+        if offset % 7 == 0:
+            week_todos = [
+                Todo(
+                    user=user,
+                    title=f"Task {len(todos) + i + 1}",
+                    priority=rng.choice(['low', 'med', 'high']),
+                    estimated_minutes=rng.choice([None, 25, 50, 90]),
+                    tags=rng.sample(TAGS, rng.randint(0, 2)),
+                    completed_at=day_start + timedelta(days=7) if day_start + timedelta(days=7) < now else None,
+                )
+                for i in range(todos_per_week)
+            ]
+            todos.extend(week_todos)
+            todo_created.update({todo.pk: day_start for todo in week_todos})
+
+        start = day_start
+        for _ in range(rng.randint(0, sessions_per_day * 2)):
+            start += timedelta(minutes=rng.randint(5, 90))
+            segments = _session_segments(rng, start)
+            end = segments[-1][3]
+            if end > now:
+                break
+            session = Session(user=user, todo=rng.choice(week_todos), status='ended', ended_at=end)
+            for mode, _, seg_start, seg_end in segments:
+                if mode == 'focus':
+                    session.focus_time += seg_end - seg_start
+                else:
+                    session.pause_time += seg_end - seg_start
+            sessions.append(session)
+            session_segments.append(segments)
+            start = end
+
+    with transaction.atomic():
+        Todo.objects.bulk_create(todos, batch_size=1000)
+        sync_todo_tags(todos)
+        Session.objects.bulk_create(sessions, batch_size=1000)
+        segments = [
+            Segment(session=session, mode=mode, reason=reason, start_at=seg_start, end_at=seg_end)
+            for session, rows in zip(sessions, session_segments)
+            for mode, reason, seg_start, seg_end in rows
+        ]
+        Segment.objects.bulk_create(segments, batch_size=1000)
+        backdate(Todo, 'created_at', todo_created)
+        backdate(Session, 'created_at', {
+            session.pk: rows[0][2] for session, rows in zip(sessions, session_segments)
+        })
+    rebuild_rollups(user)
+    rebuild_active_days(user)
+    return {'todos': len(todos), 'sessions': len(sessions), 'segments': len(segments)}
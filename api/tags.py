@@ -0,0 +1,58 @@
+from datetime import timedelta
+from django.db.models import Count, Q, Sum
+from .models import TodoTag
+
+
+def tag_names(tags):
+    """The distinct, stripped tag names in a ``Todo.tags`` value, in order."""
+    names = []
+    for tag in tags or []:
+        if isinstance(tag, str) and tag.strip() and tag.strip()[:64] not in names:
+            names.append(tag.strip()[:64])
+    return names
+
+
+def sync_todo_tags(todos):
+    """Make the TodoTag rows of ``todos`` match their ``tags`` lists."""
+    todos = list(todos)
+    if not todos:
+        return
+    wanted = {(todo.pk, name): todo for todo in todos for name in tag_names(todo.tags)}
+    stale = []
+    for tag_id, todo_id, name in TodoTag.objects.filter(todo__in=todos).values_list('id', 'todo_id', 'name'):
+        if wanted.pop((todo_id, name), None) is None:
+            stale.append(tag_id)
+    if stale:
+        TodoTag.objects.filter(id__in=stale).delete()
+    TodoTag.objects.bulk_create(
+        [TodoTag(user_id=todo.user_id, todo=todo, name=name) for (_, name), todo in wanted.items()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def filter_by_tags(queryset, user, tags, prefix=''):
+    """
+    Keep rows whose todo has every tag in ``tags``; ``prefix`` is the path to
+    the todo. Matching on the user too lets the join use todo_tag_user_name_idx.
+    """
+    for tag in tags:
+        queryset = queryset.filter(**{f'{prefix}tag_rows__user': user, f'{prefix}tag_rows__name': tag})
+    return queryset
+
+
+def tag_totals(user, start=None, end=None):
+    """Per tag: how many todos carry it and their closed focus seconds on local days ``start``..``end``."""
+    rollups = Q(todo__rollups__mode='focus')
+    if start is not None:
+        rollups &= Q(todo__rollups__day__gte=start)
+    if end is not None:
+        rollups &= Q(todo__rollups__day__lte=end)
+    rows = TodoTag.objects.filter(user=user).values('name').annotate(
+        todo_count=Count('todo', distinct=True),
+        focus_time=Sum('todo__rollups__duration', filter=rollups, default=timedelta(0)),
+    ).order_by('-focus_time', 'name')
+    return [
+        {'name': row['name'], 'todo_count': row['todo_count'], 'focus_seconds': int(row['focus_time'].total_seconds())}
+        for row in rows
+    ]
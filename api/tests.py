@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import ai
+from .events import get_broker
+from .models import (
+    Todo, Session, Segment, Profile, DailyRollup, TodoTag, AccountDeletion, SegmentRollup, TodoSearchEntry, SegmentArchive,
+)
+from .archive import archive_cutoff
+from .deletion import process_deletion, request_deletion
+from .rollups import stored_rollups, total_focus_seconds
+from .stats import raw_stats, rollup_stats
+from .streaks import compute_active_days, current_streak, longest_streak, stored_active_days
+from .search import fts_query
+from .synthetic import generate_history
+from .tags import filter_by_tags
+from .services import SessionError, start_session, stop_session, transition_session
 
-# Create your tests here.
+
+def create_history(user, todos, sessions_per_todo=2):
+    """Bulk-create todos, each with ended sessions of focus/pause/focus segments."""
+    now = timezone.now()
+    todo_rows = Todo.objects.bulk_create([Todo(user=user, title=f"Todo {i}") for i in range(todos)])
+    session_rows = Session.objects.bulk_create([
+        Session(user=user, todo=todo, status='ended', ended_at=now)
+        for todo in todo_rows for _ in range(sessions_per_todo)
+    ])
+    segment_rows = []
+    for session in session_rows:
+        start = now - timedelta(hours=1)
+        for mode, minutes in (('focus', 25), ('pause', 5), ('focus', 20)):
+            end = start + timedelta(minutes=minutes)
+            segment_rows.append(Segment(session=session, mode=mode, start_at=start, end_at=end))
+            start = end
+    Segment.objects.bulk_create(segment_rows)
+    return todo_rows
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret-pass')
+        Profile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class TodoListQueryTests(APITestCase):
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/todos/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_is_independent_of_todo_count(self):
+        create_history(self.user, 1)
+        single, data = self.count_list_queries()
+        self.assertEqual(len(data), 1)
+
+        create_history(self.user, 499)
+        many, data = self.count_list_queries()
+        self.assertEqual(len(data), 500)
+        self.assertEqual(single, many)
+
+    def test_totals_match_segments(self):
+        create_history(self.user, 1)
+        todo = self.count_list_queries()[1][0]
+        self.assertEqual(todo['past_focus_seconds'], 2 * 45 * 60)
+        session = todo['sessions'][0]
+        self.assertEqual(session['session_total_focus_seconds'], 45 * 60)
+        self.assertEqual(session['session_total_pause_seconds'], 5 * 60)
+        self.assertEqual([seg['mode'] for seg in session['segments']], ['focus', 'pause', 'focus'])
+        self.assertEqual(session['segments'][0]['session_todo_id'], todo['id'])
+
+
+class PaginationTests(APITestCase):
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.json()['results']]
+            if not response.json()['next']:
+                return seen
+            response = self.client.get(response.json()['next'])
+
+    def test_todo_pages_cover_every_todo_once(self):
+        todos = create_history(self.user, 7)
+        # Identical timestamps must still page deterministically via the id tiebreak
+        Todo.objects.filter(id__in=[t.id for t in todos[:4]]).update(created_at=timezone.now())
+        seen = self.walk('/api/todos/', {'page_size': 3})
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(set(seen), {str(t.id) for t in todos})
+        self.assertEqual(seen, [row['id'] for row in self.client.get('/api/todos/').json()])
+
+    def test_segment_pages_and_summary_view(self):
+        create_history(self.user, 2)
+        self.assertEqual(len(self.walk('/api/history/range/', {'page_size': 4})), 12)
+
+        response = self.client.get('/api/todos/', {'view': 'summary', 'page_size': 10})
+        todo = response.json()['results'][0]
+        self.assertNotIn('sessions', todo)
+        self.assertEqual(todo['session_count'], 2)
+        self.assertEqual(todo['past_focus_seconds'], 2 * 45 * 60)
+
+        sessions = self.client.get(f"/api/todos/{todo['id']}/sessions/").json()
+        self.assertEqual(len(sessions), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/todos/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class IndexUsageTests(APITestCase):
+    """The hot filters must be answered from the indexes declared in models.Meta."""
+
+    def setUp(self):
+        super().setUp()
+        create_history(self.user, 20)
+        self.session = Session.objects.first()
+        Segment.objects.create(session=self.session, mode='focus', start_at=timezone.now())
+        self.active = Session.objects.create(user=self.user, todo=self.session.todo)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would otherwise always be sequentially scanned
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_active_session_lookup(self):
+        self.assertUsesIndex(Session.objects.filter(user=self.user, status='active'), 'one_active_session_per_user')
+
+    def test_open_segment_lookup(self):
+        self.assertUsesIndex(Segment.objects.filter(session=self.session, end_at__isnull=True), 'segment_open_idx')
+
+    def test_history_ranges(self):
+        now = timezone.now()
+        sessions = Session.objects.filter(user=self.user, created_at__gte=now - timedelta(days=1), created_at__lt=now)
+        self.assertUsesIndex(sessions, 'session_user_created_idx')
+        segments = Segment.objects.filter(
+            session__user=self.user,
+            start_at__gte=now - timedelta(days=1),
+            start_at__lt=now
+        ).order_by('-start_at')
+        self.assertUsesIndex(segments, 'segment_session_start_idx')
+
+    def test_todo_list_order(self):
+        self.assertUsesIndex(Todo.objects.filter(user=self.user).order_by('-created_at', 'id')[:50], 'todo_user_created_idx')
+
+    def test_tag_filter(self):
+        self.assertUsesIndex(
+            filter_by_tags(Todo.objects.filter(user=self.user), self.user, ['work']), 'todo_tag_user_name_idx'
+        )
+
+    def test_single_active_session_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Session.objects.create(user=self.user, todo=self.session.todo)
+        response = self.client.post('/api/sessions/start/', {'todo_id': str(self.session.todo_id)}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class LocalDayHistoryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.profile.timezone = 'Asia/Tokyo'
+        self.user.profile.save()
+        todo = Todo.objects.create(user=self.user, title="Late night")
+        # 20:00 UTC on Jan 1st is 05:00 on Jan 2nd in Tokyo
+        start = datetime(2026, 1, 1, 20, 0, tzinfo=dt_timezone.utc)
+        self.session = Session.objects.create(user=self.user, todo=todo, status='ended', ended_at=start)
+        Session.objects.filter(pk=self.session.pk).update(created_at=start)
+        Segment.objects.create(session=self.session, mode='focus', start_at=start, end_at=start + timedelta(minutes=30))
+
+    def daily(self, date, **params):
+        return self.client.get('/api/history/daily/', {'date': date, **params}).json()
+
+    def test_daily_uses_profile_timezone(self):
+        self.assertEqual(len(self.daily('2026-01-02')['results']), 1)
+        self.assertEqual(self.daily('2026-01-02')['timezone'], 'Asia/Tokyo')
+        self.assertEqual(len(self.daily('2026-01-01')['results']), 0)
+
+    def test_tz_parameter_overrides_profile(self):
+        self.assertEqual(len(self.daily('2026-01-01', tz='UTC')['results']), 1)
+        response = self.client.get('/api/history/daily/', {'date': '2026-01-01', 'tz': 'Nowhere/Special'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_range_bounds_are_local_and_inclusive(self):
+        def count(**params):
+            return len(self.client.get('/api/history/range/', params).json())
+        self.assertEqual(count(start='2026-01-02', end='2026-01-02'), 1)
+        self.assertEqual(count(start='2026-01-01', end='2026-01-01'), 0)
+        self.assertEqual(count(start='2026-01-01', end='2026-01-01', tz='UTC'), 1)
+        self.assertEqual(self.client.get('/api/history/range/', {'start': '01/02/2026'}).status_code, 400)
+
+    def test_grouped_by_todo(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.daily('2026-01-02', group='todo')
+        # One aggregate for the totals, one for the timeline, one for the day's
+        # archived sessions, and the active session check that decides whether
+        # the day can be cached
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertEqual(data['totals'], {'focus_seconds': 1800, 'pause_seconds': 0, 'break_seconds': 0})
+        self.assertEqual(data['todos'][0]['title'], "Late night")
+        self.assertEqual(data['todos'][0]['session_count'], 1)
+        self.assertEqual(len(data['timeline']), 1)
+        self.assertEqual(data['timeline'][0]['session_id'], str(self.session.id))
+
+
+class RollupTests(APITestCase):
+    def run_session(self):
+        todo = self.client.post('/api/todos/', {'title': "Write report", 'tags': ['work']}, format='json').json()
+        session = self.client.post('/api/sessions/start/', {'todo_id': todo['id']}, format='json').json()
+        for mode, reason in (('pause', 'idle'), ('focus', 'manual')):
+            self.client.post(f"/api/sessions/{session['id']}/transition/", {'mode': mode, 'reason': reason}, format='json')
+        self.client.post(f"/api/sessions/{session['id']}/stop/")
+        return todo
+
+    def test_rollups_follow_session_lifecycle(self):
+        todo = self.run_session()
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+        stats = self.client.get('/api/history/stats/', {'bucket': 'month', 'by': 'reason'}).json()
+        self.assertEqual(stats['totals']['segment_count'], 3)
+        self.assertEqual({entry['key'] for entry in stats['buckets'][0]['breakdown']}, {None, 'idle', 'manual'})
+        stats = self.client.get('/api/history/stats/', {'by': 'tag'}).json()
+        self.assertEqual([entry['key'] for entry in stats['buckets'][0]['breakdown']], ['work'])
+
+        self.client.delete(f"/api/todos/{todo['id']}/")
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+        self.assertEqual(self.client.get('/api/history/stats/').json()['buckets'], [])
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['current_streak'], 0)
+
+    def test_rollups_after_transition_and_stop(self):
+        todo = Todo.objects.create(user=self.user, title="Deep work")
+        start = datetime(2026, 3, 10, 9, tzinfo=dt_timezone.utc)
+        session = start_session(self.user, todo, now=start)
+        transition_session(self.user, session, 'pause', now=start + timedelta(minutes=10))
+        rollup = DailyRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.focus_time, rollup.pause_time), (timedelta(minutes=10), timedelta()))
+        self.assertEqual(rollup.segment_count, 1)
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['total_focus_minutes'], 10)
+
+        stop_session(self.user, session, now=start + timedelta(minutes=15))
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.focus_time, rollup.pause_time), (timedelta(minutes=10), timedelta(minutes=5)))
+        self.assertEqual(rollup.segment_count, 2)
+        self.assertEqual(
+            sorted(SegmentRollup.objects.filter(user=self.user).values_list('mode', 'duration', 'segment_count')),
+            [('focus', timedelta(minutes=10), 1), ('pause', timedelta(minutes=5), 1)],
+        )
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+    def test_check_reports_corrupted_rollups(self):
+        create_history(self.user, 2)
+        call_command('rebuild_rollups', stdout=StringIO())
+        day = DailyRollup.objects.filter(user=self.user).order_by('day').first().day
+        DailyRollup.objects.filter(user=self.user, day=day).update(focus_time=F('focus_time') + timedelta(seconds=1))
+
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 user(s) have stale rollups"):
+            call_command('rebuild_rollups', check=True, stdout=out)
+        self.assertIn(f"user {self.user.id}: 1 day(s) differ, first {day}", out.getvalue())
+        call_command('rebuild_rollups', stdout=StringIO())
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+    def test_short_segments_add_up_exactly(self):
+        todo = Todo.objects.create(user=self.user, title="Flapping")
+        start = datetime(2026, 3, 10, 9, tzinfo=dt_timezone.utc)
+        session = start_session(self.user, todo, now=start)
+        # 101 focus segments of 59.9s: 6049.9s, which whole seconds per segment made 5959s
+        for n in range(101):
+            at = start + n * timedelta(seconds=60)
+            transition_session(self.user, session, 'pause', 'idle', now=at + timedelta(seconds=59.9))
+            if n < 100:
+                transition_session(self.user, session, 'focus', now=at + timedelta(seconds=60))
+        stop_session(self.user, session, now=start + timedelta(hours=2))
+        session.refresh_from_db()
+        self.assertEqual(session.focus_time, timedelta(seconds=6049.9))
+        self.assertEqual(DailyRollup.objects.get(user=self.user).focus_time, timedelta(seconds=6049.9))
+        focus = SegmentRollup.objects.filter(user=self.user, mode='focus').aggregate(total=Sum('duration'))['total']
+        self.assertEqual(focus, timedelta(seconds=6049.9))
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['total_focus_minutes'], 100)
+        day = date(2026, 3, 10)
+        stats = rollup_stats(self.user, day, day, by='reason')
+        self.assertEqual(stats['totals']['focus_seconds'], 6049)
+        self.assertEqual(stats, raw_stats(self.user, day, day, dt_timezone.utc, by='reason'))
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+    def test_migrations_backfill_exact_durations(self):
+        create_history(self.user, 3)
+        Segment.objects.update(end_at=F('end_at') + timedelta(microseconds=500000))
+        call_command('rebuild_rollups', stdout=StringIO())
+        expected = stored_rollups(self.user)
+        DailyRollup.objects.update(focus_time=timedelta(0), pause_time=timedelta(0))
+        SegmentRollup.objects.update(duration=timedelta(0))
+        for name in ('0014_dailyrollup_exact_durations', '0015_segmentrollup_exact_durations'):
+            import_module(f'api.migrations.{name}').backfill_exact_durations(django_apps, None)
+        self.assertEqual(stored_rollups(self.user), expected)
+
+        Session.objects.update(focus_time=timedelta(0), pause_time=timedelta(0))
+        import_module('api.migrations.0016_session_exact_running_totals').backfill_running_totals(django_apps, None)
+        totals = set(Session.objects.values_list('focus_time', 'pause_time'))
+        self.assertEqual(totals, {(timedelta(minutes=45, seconds=1), timedelta(minutes=5, seconds=0.5))})
+
+    def test_stats_match_raw_segments(self):
+        create_history(self.user, 3)
+        call_command('rebuild_rollups', stdout=StringIO())
+        stats = self.client.get('/api/history/stats/', {'bucket': 'week'}).json()
+        self.assertEqual(stats['totals']['focus_seconds'], 3 * 2 * 45 * 60)
+        self.assertEqual(stats['totals']['pause_seconds'], 3 * 2 * 5 * 60)
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['total_focus_minutes'], 3 * 2 * 45)
+        self.assertEqual(self.client.get('/api/history/stats/', {'by': 'label'}).status_code, 400)
+
+
+class StreakTests(APITestCase):
+    now = datetime(2026, 3, 10, 12, tzinfo=dt_timezone.utc)
+
+    def focus_at(self, start):
+        session = start_session(self.user, Todo.objects.create(user=self.user, title="Focus"), now=start)
+        stop_session(self.user, session, now=start + timedelta(minutes=30))
+
+    def streaks(self, now):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            return current_streak(self.user), longest_streak(self.user)
+
+    def test_streak_ending_yesterday_is_current(self):
+        for days_ago in (3, 2, 1):
+            self.focus_at(self.now - timedelta(days=days_ago))
+        self.assertEqual(self.streaks(self.now), (3, 3))
+        # Missing a whole day ends it
+        self.assertEqual(self.streaks(self.now + timedelta(days=1)), (0, 3))
+
+    def test_gap_day_breaks_the_streak(self):
+        # Nothing three days ago
+        for days_ago in (7, 6, 5, 4, 2, 1):
+            self.focus_at(self.now - timedelta(days=days_ago))
+        self.assertEqual(self.streaks(self.now), (2, 4))
+
+    def test_days_are_local_to_the_profile_timezone(self):
+        self.user.profile.timezone = 'Asia/Tokyo'
+        self.user.profile.save()
+        # Both on March 10 in UTC, but 10:00 on March 10 and 01:00 on March 11 in Tokyo
+        self.focus_at(datetime(2026, 3, 10, 1, tzinfo=dt_timezone.utc))
+        self.focus_at(datetime(2026, 3, 10, 16, tzinfo=dt_timezone.utc))
+        self.assertEqual(stored_active_days(self.user), {date(2026, 3, 10), date(2026, 3, 11)})
+        self.assertEqual(self.streaks(datetime(2026, 3, 10, 17, tzinfo=dt_timezone.utc)), (2, 2))
+        self.assertEqual(compute_active_days(self.user), stored_active_days(self.user))
+
+
+class SessionConcurrencyTests(TransactionTestCase):
+    def worker(self, todo, step):
+        try:
+            active = Session.objects.filter(user=self.user, status='active').first()
+            if active is None:
+                start_session(self.user, todo)
+            elif step % 5 == 4:
+                stop_session(self.user, active)
+            else:
+                transition_session(self.user, active, ('pause', 'focus', 'break')[step % 3])
+        except SessionError:
+            # Losing a race is expected; corrupting state is not
+            pass
+        finally:
+            connection.close()
+
+    def test_concurrent_state_changes_keep_invariants(self):
+        self.user = User.objects.create_user('alice', password='secret-pass')
+        Profile.objects.create(user=self.user)
+        todos = [Todo.objects.create(user=self.user, title=f"Task {i}") for i in range(2)]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda step: self.worker(todos[step % 2], step), range(120)))
+
+        self.assertLessEqual(Session.objects.filter(user=self.user, status='active').count(), 1)
+        for session in Session.objects.filter(user=self.user).prefetch_related('segments'):
+            segments = sorted(session.segments.all(), key=lambda seg: seg.start_at)
+            open_segments = [seg for seg in segments if seg.end_at is None]
+            self.assertEqual(len(open_segments), 1 if session.status == 'active' else 0)
+            if session.status == 'active':
+                self.assertEqual(session.current_segment_id, open_segments[0].id)
+            for previous, following in zip(segments, segments[1:]):
+                self.assertLessEqual(previous.end_at, following.start_at)
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+
+class SyntheticHistoryTests(APITestCase):
+    def test_generated_history_is_consistent(self):
+        rows = generate_history(self.user, 21, seed=3)
+        self.assertEqual(rows, generate_history(User.objects.create_user('bob'), 21, seed=3))
+        self.assertEqual(Session.objects.filter(user=self.user).count(), rows['sessions'])
+        self.assertEqual(Segment.objects.filter(session__user=self.user).count(), rows['segments'])
+
+        # Backdated across the whole range rather than stamped with the insert time
+        first = Session.objects.filter(user=self.user).earliest('created_at').created_at
+        self.assertGreaterEqual(timezone.now() - first, timedelta(days=19))
+        for session in Session.objects.filter(user=self.user).prefetch_related('segments')[:20]:
+            segments = sorted(session.segments.all(), key=lambda seg: seg.start_at)
+            self.assertEqual(session.created_at, segments[0].start_at)
+            self.assertEqual(session.focus_time, sum(
+                (seg.end_at - seg.start_at for seg in segments if seg.mode == 'focus'), timedelta(0)
+            ))
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+
+class RequestProfilingTests(APITestCase):
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_requests_get_server_timing(self):
+        create_history(self.user, 2)
+        with self.assertLogs('api.requests', 'INFO') as logs:
+            response = self.client.get('/api/todos/')
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'total'})
+        record = json.loads(logs.records[0].getMessage())
+        self.assertIn(f'desc="{record["queries"]} queries"', timing['db'])
+        self.assertEqual(record['bytes'], len(response.content))
+        self.assertGreater(record['serialize_ms'], 0)
+        self.assertFalse(record['slow'])
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SAMPLE_RATE=1.0)
+    async def test_asgi_requests_count_their_queries(self):
+        await sync_to_async(create_history)(self.user, 2)
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        # A sync DRF view and an async one, both adapted under the async handler
+        for path in ('/api/todos/', '/api/auth/profile/'):
+            with self.assertLogs('api.requests', 'INFO') as logs:
+                response = await self.async_client.get(path, headers=headers)
+            record = json.loads(logs.records[0].getMessage())
+            self.assertGreater(record['queries'], 0, path)
+            self.assertGreater(record['db_ms'], 0, path)
+            self.assertGreater(record['serialize_ms'], 0, path)
+            self.assertIn(f'desc="{record["queries"]} queries"', response['Server-Timing'])
+
+    def test_slow_requests_are_logged_and_profiles_captured(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            REQUEST_PROFILING=True, REQUEST_PROFILING_SAMPLE_RATE=0.0, REQUEST_PROFILING_SLOW_MS=0,
+            REQUEST_PROFILING_CAPTURE=[r'^/api/todos/$'], REQUEST_PROFILING_DIR=directory,
+        ):
+            with self.assertLogs('api.requests', 'WARNING'):
+                self.assertIn('Server-Timing', self.client.get('/api/todos/'))
+            # Capture follows sampling, so nothing is written at a zero rate
+            self.assertEqual(os.listdir(directory), [])
+            with override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0), self.assertLogs('api.requests'):
+                APIClient().get('/api/todos/')
+                APIClient().get('/api/auth/profile/')
+            self.assertEqual([os.path.splitext(name)[1] for name in os.listdir(directory)], ['.prof'])
+
+
+class ExportTests(APITestCase):
+    def test_export_streams_every_segment(self):
+        create_history(self.user, 3)
+        response = self.client.get('/api/history/export/')
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 18)
+        self.assertEqual(records[0]['mode'], 'focus')
+        self.assertEqual(records[0]['duration_seconds'], 25 * 60)
+        self.assertEqual(records[0]['todo_title'], Todo.objects.get(id=records[0]['todo_id']).title)
+
+        response = self.client.get('/api/history/export/', {'type': 'csv'})
+        body = b''.join(response.streaming_content).decode()
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['segment_id', 'session_id'])
+        self.assertEqual(len(lines), 19)
+        output = StringIO()
+        call_command('export_history', user=self.user.id, format='csv', stdout=output)
+        self.assertEqual(output.getvalue(), body)
+
+        self.assertEqual(self.client.get('/api/history/export/', {'type': 'xml'}).status_code, 400)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        response = self.client.get('/api/history/export/', {'start': str(tomorrow)})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+
+class ImportTests(APITestCase):
+    def upload(self, name, body):
+        return self.client.post('/api/history/import/', {'file': SimpleUploadedFile(name, body.encode())})
+
+    def test_export_round_trips_through_import(self):
+        create_history(self.user, 3)
+        for fmt in ('ndjson', 'csv'):
+            exported = b''.join(self.client.get('/api/history/export/', {'type': fmt}).streaming_content).decode()
+            bob = User.objects.create_user(f'bob-{fmt}')
+            Profile.objects.create(user=bob)
+            self.client.force_authenticate(bob)
+            response = self.upload(f'history.{fmt}', exported)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json(), {'todos': 3, 'sessions': 6, 'segments': 18})
+            session = Session.objects.filter(user=bob).first()
+            self.assertEqual(session.status, 'ended')
+            self.assertEqual((session.focus_time, session.pause_time), (timedelta(minutes=45), timedelta(minutes=5)))
+            self.assertEqual(DailyRollup.objects.get(user=bob).focus_time, timedelta(hours=6 * 45 / 60))
+            self.assertEqual(self.client.get('/api/auth/profile/').json()['current_streak'], 1)
+            call_command('rebuild_rollups', user=bob.id, check=True, stdout=StringIO())
+            self.client.force_authenticate(self.user)
+
+    def test_invalid_rows_fail_the_whole_file(self):
+        start = timezone.now() - timedelta(hours=2)
+        rows = [
+            {'todo_title': "Plan"},
+            {'todo_title': "Write", 'session_id': 's1', 'mode': 'focus',
+             'start_at': start.isoformat(), 'end_at': (start + timedelta(minutes=30)).isoformat()},
+            {'todo_title': "Write", 'session_id': 's1', 'mode': 'pause',
+             'start_at': (start + timedelta(minutes=20)).isoformat(), 'end_at': (start + timedelta(minutes=40)).isoformat()},
+            {'todo_title': "Write", 'mode': 'nap', 'start_at': start.isoformat(), 'end_at': start.isoformat()},
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        response = self.upload('history.ndjson', body)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [4, 5])
+        self.assertFalse(Todo.objects.filter(user=self.user).exists())
+
+        # Only the overlap remains once the bad rows are gone
+        response = self.upload('history.ndjson', '\n'.join(json.dumps(row) for row in rows[:3]))
+        self.assertEqual([error['line'] for error in response.json()['errors']], [3])
+
+        path = os.path.join(tempfile.mkdtemp(), 'history.ndjson')
+        with open(path, 'w') as output:
+            output.write('\n'.join(json.dumps(row) for row in rows[:2]))
+        call_command('import_history', path, user=self.user.id, stdout=StringIO())
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Session.objects.get(user=self.user).focus_time, timedelta(minutes=30))
+
+
+    def test_import_adds_to_existing_rollups(self):
+        create_history(self.user, 2)
+        call_command('rebuild_rollups', user=self.user.id, stdout=StringIO())
+        start_session(self.user, Todo.objects.filter(user=self.user).first())
+        before = total_focus_seconds(self.user)
+        start = timezone.now() - timedelta(days=3)
+        rows = [
+            {'todo_title': "Write", 'session_id': 's1', 'mode': 'focus',
+             'start_at': start.isoformat(), 'end_at': (start + timedelta(minutes=30)).isoformat()},
+            {'todo_title': "Write", 'session_id': 's1', 'mode': 'pause', 'reason': 'idle',
+             'start_at': (start + timedelta(minutes=30)).isoformat(),
+             'end_at': (start + timedelta(minutes=35)).isoformat()},
+        ]
+        response = self.upload('history.ndjson', '\n'.join(json.dumps(row) for row in rows))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(total_focus_seconds(self.user), before + 30 * 60)
+        self.assertEqual(stored_active_days(self.user), compute_active_days(self.user))
+        call_command('rebuild_rollups', user=self.user.id, check=True, stdout=StringIO())
+
+
+class TagTests(APITestCase):
+    def test_tags_are_indexed_filtered_and_totalled(self):
+        todos = {}
+        for title, tags in (("Report", ['work', 'writing', 'work ']), ("Gym", ['health']), ("Notes", [])):
+            todos[title] = self.client.post('/api/todos/', {'title': title, 'tags': tags}, format='json').json()
+        self.assertEqual(todos['Report']['tags'], ['work', 'writing'])
+        self.assertEqual(
+            set(TodoTag.objects.values_list('todo__title', 'name')),
+            {("Report", 'work'), ("Report", 'writing'), ("Gym", 'health')},
+        )
+        self.client.patch(f"/api/todos/{todos['Gym']['id']}/", {'tags': ['health', 'work']}, format='json')
+        self.assertEqual(self.client.post('/api/todos/', {'title': "Bad", 'tags': [1]}, format='json').status_code, 400)
+
+        titles = lambda **params: [todo['title'] for todo in self.client.get('/api/todos/', params).json()]
+        self.assertEqual(titles(tag='work'), ["Gym", "Report"])
+        self.assertEqual(titles(tag=['work', 'writing']), ["Report"])
+        self.assertEqual(titles(tag='work', view='summary'), ["Gym", "Report"])
+
+        session = self.client.post('/api/sessions/start/', {'todo_id': todos['Report']['id']}, format='json').json()
+        Segment.objects.filter(session_id=session['id']).update(start_at=timezone.now() - timedelta(minutes=10))
+        self.client.post(f"/api/sessions/{session['id']}/stop/")
+        totals = {row['name']: row for row in self.client.get('/api/todos/tags/').json()}
+        self.assertEqual((totals['work']['todo_count'], totals['work']['focus_seconds']), (2, 600))
+        self.assertEqual(totals['health']['focus_seconds'], 0)
+
+        stats = self.client.get('/api/history/stats/', {'tag': 'writing', 'by': 'tag'}).json()
+        self.assertEqual(stats['totals']['focus_seconds'], 600)
+        self.assertEqual({entry['key'] for entry in stats['buckets'][0]['breakdown']}, {'work', 'writing'})
+        self.assertEqual(self.client.get('/api/history/stats/', {'tag': 'health'}).json()['buckets'], [])
+        self.assertEqual(len(self.client.get('/api/history/range/', {'tag': 'writing'}).json()), 1)
+
+
+class TodoSearchTests(APITestCase):
+    def test_search_is_ranked_prefix_matched_and_kept_in_sync(self):
+        Todo.objects.bulk_create(Todo(user=self.user, title=f"Filler {n}", description="chores") for n in range(20))
+        post = lambda title, description='': self.client.post(
+            '/api/todos/', {'title': title, 'description': description}, format='json',
+        ).json()
+        strong = post("Quarterly report", "Draft the report for the board")
+        weak = post("Email Sam", "mention the report")
+        post("Report")
+        other = Todo.objects.create(user=User.objects.create_user('other', password='pw'), title="Report")
+        # The user is part of the MATCH, so other users' entries are never read
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT todo_id FROM api_todo_fts WHERE api_todo_fts MATCH %s', [fts_query('report', other.user_id)]
+            )
+            self.assertEqual(cursor.fetchall(), [(str(other.id).replace('-', ''),)])
+
+        search = lambda q, **params: self.client.get('/api/todos/', {'q': q, **params}).json()
+        page = search('report', page_size=2)
+        self.assertEqual(len(page['results']), 2)
+        rest = self.client.get(page['next']).json()
+        self.assertIsNone(rest['next'])
+        ids = [todo['id'] for todo in page['results'] + rest['results']]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(ids[-1], weak['id'])
+
+        self.assertEqual([todo['id'] for todo in search('quart')['results']], [strong['id']])
+        self.assertEqual([todo['id'] for todo in search('board report')['results']], [strong['id']])
+        self.assertEqual(search('"report" OR title:*')['results'], [])
+        self.assertEqual(search('***')['results'], [])
+
+        self.client.patch(f"/api/todos/{strong['id']}/", {'title': "Annual summary", 'description': ""}, format='json')
+        self.assertEqual(search('quarterly')['results'], [])
+        self.assertEqual([todo['id'] for todo in search('annual')['results']], [strong['id']])
+        self.client.delete(f"/api/todos/{weak['id']}/")
+        self.assertNotIn(weak['id'], [todo['id'] for todo in search('report')['results']])
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def queries(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        return response.status_code, len(ctx.captured_queries)
+
+    def test_user_lookup_is_cached_until_the_user_changes(self):
+        status_code, first = self.queries('/api/sessions/active/')
+        self.assertEqual(status_code, 204)
+        self.assertEqual(self.queries('/api/sessions/active/'), (204, first - 1))
+
+        # The entry is dropped on commit, so a request racing the write cannot re-cache the old row
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-secret-pass')
+            self.user.save()
+            self.assertEqual(self.queries('/api/sessions/active/'), (204, first - 1))
+        self.assertEqual(self.queries('/api/sessions/active/'), (204, first))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/sessions/active/').status_code, 401)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        self.assertEqual(self.client.get('/api/sessions/active/').status_code, 204)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get('/api/sessions/active/').status_code, 401)
+
+    def test_cached_user_leaves_out_the_password_hash(self):
+        self.assertEqual(self.client.get('/api/todos/').status_code, 200)
+        self.assertNotIn(self.user.password, repr(cache.get(f'api:auth-user:{self.user.id}')))
+        self.assertEqual(self.client.get('/api/auth/profile/').data['username'], 'alice')
+
+        # Deferred fields load on access, and saving the cached user keeps the hash
+        user = self.client.get('/api/todos/').wsgi_request.user
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertEqual(user.password, self.user.password)
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('secret-pass'))
+
+
+class AccountDeletionTests(APITestCase):
+    def test_deletion_is_queued_then_drained_in_batches(self):
+        generate_history(self.user, 10, seed=3)
+        other = User.objects.create_user('bob', password='secret-pass')
+        create_history(other, 2)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete('/api/auth/delete/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get('/api/todos/').status_code, 401)
+        self.assertTrue(Todo.objects.filter(user=self.user).exists())
+
+        segments = Segment.objects.filter(session__user=self.user).count()
+        deletion = AccountDeletion.objects.get(user_id=self.user.id)
+        # An interrupted run keeps its committed batches and the next one carries on
+        def interrupt(deletion, model_name, deleted):
+            raise RuntimeError
+        with self.assertRaises(RuntimeError):
+            process_deletion(deletion, batch_size=7, progress=interrupt)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.deleted_rows, {'segment': 7})
+
+        batches = []
+        process_deletion(deletion, batch_size=7, progress=lambda *args: batches.append(args[1:]))
+        self.assertIn(('segment', 7), batches)
+        deletion.refresh_from_db()
+        self.assertIsNotNone(deletion.finished_at)
+        self.assertEqual(deletion.deleted_rows['segment'], segments)
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        for model in (Todo, Session, SegmentRollup, DailyRollup, TodoTag, Profile, TodoSearchEntry):
+            self.assertFalse(model.objects.filter(user_id=self.user.id).exists(), model)
+        self.assertEqual(Todo.objects.filter(user=other).count(), 2)
+
+    def test_command_drains_the_queue(self):
+        create_history(self.user, 3)
+        self.client.delete('/api/auth/delete/')
+        out = StringIO()
+        call_command('process_account_deletions', batch_size=4, verbosity=2, stdout=out)
+        self.assertIn('segment -4 (4 so far)', out.getvalue())
+        self.assertIn('Processed 1 account deletion(s)', out.getvalue())
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        out = StringIO()
+        call_command('process_account_deletions', stdout=out)
+        self.assertIn('Processed 0 account deletion(s)', out.getvalue())
+
+    def test_worker_keeps_draining_the_queue(self):
+        other = User.objects.create_user('bob', password='secret-pass')
+        passes = []
+
+        def sleep(seconds):
+            # A deletion requested while the worker waits is picked up on the next pass
+            passes.append(seconds)
+            if len(passes) == 1:
+                request_deletion(other)
+            else:
+                raise KeyboardInterrupt
+
+        self.client.delete('/api/auth/delete/')
+        out = StringIO()
+        with mock.patch('api.management.commands.process_account_deletions.time.sleep', side_effect=sleep):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('process_account_deletions', interval=60, stdout=out)
+        self.assertEqual(passes, [60, 60])
+        self.assertEqual(out.getvalue().count('Processed 1 account deletion(s)'), 2)
+        self.assertFalse(User.objects.filter(id__in=[self.user.id, other.id]).exists())
+
+
+class AsyncReadViewTests(APITestCase):
+    async def test_read_endpoints_under_asgi(self):
+        todo = await Todo.objects.acreate(user=self.user, title="Focus")
+        session = await sync_to_async(start_session)(self.user, todo)
+        await sync_to_async(transition_session)(self.user, session, 'pause')
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        get = lambda path, **params: self.async_client.get(path, params, headers=headers)
+
+        active = (await get('/api/sessions/active/')).json()
+        self.assertEqual((active['id'], len(active['segments'])), (str(session.id), 2))
+        self.assertEqual(active['segments'][0]['session_todo_id'], str(todo.id))
+
+        profile = (await get('/api/auth/profile/')).json()
+        self.assertEqual((profile['username'], profile['current_streak']), ('alice', 1))
+        self.assertEqual(profile['profile']['timezone'], 'UTC')
+
+        today = str(timezone.localdate())
+        daily = (await get('/api/history/daily/', date=today)).json()
+        self.assertEqual(len(daily['results'][0]['segments']), 2)
+        grouped = (await get('/api/history/daily/', date=today, group='todo')).json()
+        self.assertEqual(grouped['todos'][0]['segment_count'], 2)
+
+        page = (await get('/api/history/range/', start=today, page_size=1)).json()
+        self.assertEqual((len(page['results']), page['results'][0]['mode']), (1, 'pause'))
+        self.assertIsNotNone(page['next'])
+        self.assertEqual(len((await get('/api/history/range/', start=today)).json()), 2)
+        self.assertEqual((await get('/api/history/range/', start='bad')).status_code, 400)
+        self.assertEqual((await self.async_client.get('/api/auth/profile/')).status_code, 401)
+
+
+
+class ArchiveTests(APITestCase):
+    def history(self):
+        day = str(timezone.localdate(Session.objects.filter(user=self.user).earliest('created_at').created_at))
+        pages, url = [], '/api/history/range/?page_size=25'
+        while url:
+            page = self.client.get(url).json()
+            pages += page['results']
+            url = page['next']
+        return {
+            'export': b''.join(self.client.get('/api/history/export/').streaming_content),
+            'range': self.client.get('/api/history/range/').json(),
+            'pages': pages,
+            'daily': self.client.get('/api/history/daily/', {'date': day}).json(),
+            'grouped': self.client.get('/api/history/daily/', {'date': day, 'group': 'todo'}).json(),
+            'todos': self.client.get('/api/todos/', {'view': 'summary'}).json(),
+        }
+
+    def test_archive_and_restore_keep_history_identical(self):
+        generate_history(self.user, 75, seed=3)
+        before, segments = self.history(), Segment.objects.count()
+
+        out = StringIO()
+        call_command('archive_segments', months=1, stdout=out)
+        self.assertIn('Archived', out.getvalue())
+        archived = Session.objects.filter(user=self.user, archived=True)
+        self.assertTrue(archived.exists())
+        self.assertFalse(Segment.objects.filter(session__in=archived).exists())
+        self.assertFalse(archived.filter(created_at__gte=archive_cutoff(1)).exists())
+        self.assertEqual(self.history(), before)
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+        call_command('archive_segments', restore=True, stdout=StringIO())
+        self.assertFalse(SegmentArchive.objects.exists())
+        self.assertEqual(Segment.objects.count(), segments)
+        self.assertEqual(self.history(), before)
+
+    def test_day_mixing_archived_and_live_sessions(self):
+        day = timezone.localdate() - timedelta(days=90)
+        todo = Todo.objects.create(user=self.user, title="Report")
+
+        def run(start):
+            session = start_session(self.user, todo, now=start)
+            transition_session(self.user, session, 'pause', 'manual', now=start + timedelta(minutes=25))
+            stop_session(self.user, session, now=start + timedelta(minutes=30))
+            Session.objects.filter(pk=session.pk).update(created_at=start)
+
+        noon = datetime(day.year, day.month, day.day, 12, tzinfo=dt_timezone.utc)
+        run(noon)
+        call_command('archive_segments', months=1, stdout=StringIO())
+        # A later import, say, adds a live session to the archived day
+        run(noon + timedelta(hours=2))
+        self.assertEqual(Session.objects.filter(user=self.user, archived=True).count(), 1)
+
+        grouped = self.client.get('/api/history/daily/', {'date': str(day), 'group': 'todo'}).json()
+        self.assertEqual(grouped['totals'], {'focus_seconds': 3000, 'pause_seconds': 600, 'break_seconds': 0})
+        self.assertEqual((grouped['todos'][0]['session_count'], grouped['todos'][0]['segment_count']), (2, 4))
+        self.assertEqual([row['mode'] for row in grouped['timeline']], ['focus', 'pause', 'focus', 'pause'])
+        flat = self.client.get('/api/history/daily/', {'date': str(day)}).json()['results']
+        self.assertEqual([len(session['segments']) for session in flat], [2, 2])
+
+    def test_archived_rows_go_with_their_todo_and_account(self):
+        generate_history(self.user, 75, seed=3)
+        call_command('archive_segments', months=1, stdout=StringIO())
+        todo = Session.objects.filter(user=self.user, archived=True).first().todo
+        self.assertEqual(self.client.delete(f'/api/todos/{todo.id}/').status_code, 204)
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+        self.assertNotIn(str(todo.id), b''.join(self.client.get('/api/history/export/').streaming_content).decode())
+
+        self.client.delete('/api/auth/delete/')
+        call_command('process_account_deletions', stdout=StringIO())
+        self.assertFalse(SegmentArchive.objects.filter(user_id=self.user.id).exists())
+
+
+class CompactionTests(APITestCase):
+    def run_session(self, title, start, compact=True):
+        todo = Todo.objects.create(user=self.user, title=title)
+        session = start_session(self.user, todo, now=start)
+        at = start
+        # focus 10m, two idle blips, a hidden one, focus 5m, manual pause 2m, break blip, idle pause 30s, focus
+        for seconds, mode, reason in (
+            (600, 'pause', 'idle'), (0.4, 'pause', 'idle'), (0.3, 'pause', 'hidden'), (0.2, 'focus', 'hidden'),
+            (300, 'pause', 'manual'), (120, 'break', 'manual'), (0.2, 'pause', 'idle'), (30, 'focus', 'manual'),
+        ):
+            at += timedelta(seconds=seconds)
+            transition_session(self.user, session, mode, reason, now=at)
+        with mock.patch('api.services.compact_sessions') if not compact else nullcontext():
+            stop_session(self.user, session, now=at + timedelta(seconds=100))
+        session.refresh_from_db()
+        return session
+
+    def totals(self, session):
+        exact = defaultdict(timedelta)
+        for seg in Segment.objects.filter(session=session):
+            exact[(seg.mode, seg.reason)] += seg.end_at - seg.start_at
+        rollups = SegmentRollup.objects.filter(todo=session.todo).values_list('mode', 'reason').annotate(
+            duration=Sum('duration')
+        )
+        return dict(exact), (session.focus_time, session.pause_time), sorted(rollups)
+
+    def test_stop_merges_without_changing_totals(self):
+        start = timezone.now() - timedelta(hours=3)
+        plain = self.run_session("Plain", start, compact=False)
+        compacted = self.run_session("Compacted", start + timedelta(hours=1))
+
+        # Only the back-to-back idle pauses merge; everything users see stays put
+        self.assertEqual(plain.segments.count(), 9)
+        self.assertEqual(compacted.segments.count(), 8)
+        self.assertEqual(self.totals(compacted), self.totals(plain))
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+    def test_merges_across_second_boundaries(self):
+        todo = Todo.objects.create(user=self.user, title="Blips")
+        start = timezone.now() - timedelta(hours=1)
+        session = start_session(self.user, todo, now=start)
+        transition_session(self.user, session, 'pause', 'idle', now=start + timedelta(seconds=10))
+        transition_session(self.user, session, 'pause', 'idle', now=start + timedelta(seconds=10.6))
+        stop_session(self.user, session, now=start + timedelta(seconds=11.2))
+        session.refresh_from_db()
+
+        self.assertEqual([seg.mode for seg in session.segments.order_by('start_at')], ['focus', 'pause'])
+        self.assertEqual(session.pause_time, timedelta(seconds=1.2))
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+    @override_settings(SEGMENT_COMPACTION_GAP_SECONDS=1)
+    def test_gap_absorbs_short_segments_when_enabled(self):
+        start = timezone.now() - timedelta(hours=1)
+        session = self.run_session("Flaky tab", start)
+
+        segments = list(session.segments.order_by('start_at'))
+        self.assertEqual([seg.mode for seg in segments], ['focus', 'pause', 'pause', 'focus', 'pause', 'focus'])
+        self.assertEqual((segments[0].start_at, segments[-1].end_at), (start, session.ended_at))
+        # The break blip now counts as pause
+        self.assertEqual(segments[4].end_at - segments[4].start_at, timedelta(seconds=150.2))
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+    def test_command_reports_removed_rows(self):
+        todo = Todo.objects.create(user=self.user, title="Imported")
+        start = timezone.now() - timedelta(days=1)
+        session = Session.objects.create(user=self.user, todo=todo, status='ended', ended_at=start)
+        rows, at = [], start
+        for mode, reason, seconds in (
+            ('focus', None, 600), ('pause', 'idle', 0.5), ('focus', None, 300), ('focus', None, 300),
+            ('pause', 'hidden', 3), ('focus', None, 60),
+        ):
+            rows.append(Segment(session=session, mode=mode, reason=reason, start_at=at, end_at=at + timedelta(seconds=seconds)))
+            at += timedelta(seconds=seconds)
+        Segment.objects.bulk_create(rows)
+        # The running totals imports keep
+        session.focus_time, session.pause_time = timedelta(seconds=1260), timedelta(seconds=3.5)
+        session.save()
+        call_command('rebuild_rollups', stdout=StringIO())
+        before = self.totals(session)
+
+        out = StringIO()
+        call_command('compact_segments', stdout=out)
+        self.assertIn('Removed 1 segment row(s)', out.getvalue())
+        session.refresh_from_db()
+        self.assertEqual(self.totals(session), before)
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+        out = StringIO()
+        call_command('compact_segments', gap=5, stdout=out)
+        self.assertIn('Removed 4 segment row(s)', out.getvalue())
+        self.assertEqual(session.segments.count(), 1)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.todos = create_history(self.user, 1)
+
+    def test_profile_etag_and_invalidation(self):
+        first = self.client.get('/api/auth/profile/')
+        etag = first['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # At most the profile lookup for the user's timezone
+        self.assertLessEqual(len(ctx.captured_queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session = self.client.post('/api/sessions/start/', {'todo_id': str(self.todos[0].id)}, format='json').json()
+            self.client.post(f"/api/sessions/{session['id']}/stop/")
+        response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_past_days_are_cached_until_a_write(self):
+        yesterday = str(timezone.localdate() - timedelta(days=1))
+        first = self.client.get('/api/history/daily/', {'date': yesterday})
+        self.assertIn('ETag', first)
+        cached = self.client.get('/api/history/daily/', {'date': yesterday})
+        self.assertEqual(cached.json(), first.json())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Todo.objects.create(user=self.user, title="New")
+        response = self.client.get('/api/history/daily/', {'date': yesterday}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        today = self.client.get('/api/history/daily/', {'date': str(timezone.localdate())})
+        self.assertNotIn('ETag', today)
+
+    def test_reads_during_a_write_are_fresh_after_commit(self):
+        first = self.client.get('/api/auth/profile/')
+        self.assertEqual(first.json()['profile']['timezone'], 'UTC')
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.filter(user=self.user).update(timezone='Europe/Paris')
+            self.user.profile.refresh_from_db()
+            self.user.profile.save()
+            # A read racing the write still gets the old version and may cache
+            # what it saw before the commit
+            during = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(during.status_code, 304)
+        response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['profile']['timezone'], 'Europe/Paris')
+
+
+class ActiveStateTests(APITestCase):
+    def test_state_is_one_query_and_tracks_totals(self):
+        todo = Todo.objects.create(user=self.user, title="Deep work")
+        self.assertEqual(self.client.get('/api/sessions/active/state/').status_code, 204)
+
+        session = self.client.post('/api/sessions/start/', {'todo_id': str(todo.id)}, format='json').json()
+        # Pretend the first focus segment started ten minutes ago
+        Segment.objects.filter(session_id=session['id']).update(start_at=timezone.now() - timedelta(minutes=10))
+        segment = self.client.post(
+            f"/api/sessions/{session['id']}/transition/", {'mode': 'pause', 'reason': 'idle'}, format='json'
+        ).json()
+
+        with CaptureQueriesContext(connection) as ctx:
+            state = self.client.get('/api/sessions/active/state/').json()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(state['id'], session['id'])
+        self.assertEqual(state['segment_id'], segment['id'])
+        self.assertEqual((state['mode'], state['reason']), ('pause', 'idle'))
+        self.assertEqual(state['focus_seconds'], 600)
+
+        self.client.post(f"/api/sessions/{session['id']}/stop/")
+        stored = Session.objects.get(id=session['id'])
+        self.assertIsNone(stored.current_segment_id)
+        self.assertEqual(stored.focus_time // timedelta(seconds=1), 600)
+        self.assertEqual(self.client.get('/api/sessions/active/state/').status_code, 204)
+
+
+    def test_start_and_stop_read_segments_once(self):
+        todo = Todo.objects.create(user=self.user, title="Deep work")
+
+        def segment_selects(path):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(path, {'todo_id': str(todo.id)}, format='json')
+            selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+            return response.json(), len([sql for sql in selects if 'FROM "api_segment"' in sql])
+
+        session, start_selects = segment_selects('/api/sessions/start/')
+        self.assertEqual(start_selects, 1)
+        self.assertEqual(len(session['segments']), 1)
+        Segment.objects.filter(session_id=session['id']).update(start_at=timezone.now() - timedelta(minutes=10))
+        session, stop_selects = segment_selects(f"/api/sessions/{session['id']}/stop/")
+        self.assertEqual(session['session_total_focus_seconds'], 600)
+        # Closing the open segment and compaction read them too; the response adds one
+        self.assertEqual(stop_selects, 3)
+
+
+class TransitionBatchTests(APITestCase):
+    def test_batch_is_applied_once_and_validated(self):
+        todo = Todo.objects.create(user=self.user, title="Offline work")
+        session = self.client.post('/api/sessions/start/', {'todo_id': str(todo.id)}, format='json').json()
+        start = timezone.now() - timedelta(minutes=30)
+        Segment.objects.filter(session_id=session['id']).update(start_at=start)
+        url = f"/api/sessions/{session['id']}/transitions/"
+        batch = {'transitions': [
+            {'mode': 'pause', 'reason': 'idle', 'at': (start + timedelta(minutes=10)).isoformat(), 'key': 'a'},
+            {'mode': 'focus', 'at': (start + timedelta(minutes=15)).isoformat(), 'key': 'b'},
+        ]}
+
+        response = self.client.post(url, batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['applied'], 2)
+        stored = Session.objects.get(id=session['id'])
+        self.assertEqual((stored.focus_time, stored.pause_time), (timedelta(minutes=10), timedelta(minutes=5)))
+        self.assertEqual(stored.current_segment.client_key, 'b')
+        self.assertEqual(DailyRollup.objects.get(user=self.user).pause_time, timedelta(minutes=5))
+
+        # A retried batch changes nothing
+        retry = self.client.post(url, batch, format='json').json()
+        self.assertEqual((retry['applied'], retry['duplicates']), (0, ['a', 'b']))
+        self.assertEqual(Segment.objects.filter(session_id=session['id']).count(), 3)
+
+        late = {'transitions': [{'mode': 'pause', 'at': (start + timedelta(minutes=5)).isoformat(), 'key': 'c'}]}
+        response = self.client.post(url, late, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['index'], 0)
+        self.assertFalse(Segment.objects.filter(client_key='c').exists())
+
+
+class SessionEventTests(APITestCase):
+    async def test_stream_delivers_published_events(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual((await self.async_client.get('/api/sessions/events/')).status_code, 401)
+
+        response = await self.async_client.get('/api/sessions/events/', {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+
+        get_broker().publish(self.user.id, {'type': 'session.started', 'session_id': 'abc'})
+        get_broker().publish(self.user.id + 1, {'type': 'session.started', 'session_id': 'other'})
+        chunk = (await asyncio.wait_for(anext(stream), 1)).decode()
+        self.assertTrue(chunk.startswith('event: session.started\n'))
+        self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['session_id'], 'abc')
+        # A client disconnect cancels the pending read, which must unsubscribe
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertNotIn(self.user.id, get_broker().subscribers)
+
+    def test_state_changes_publish_after_commit(self):
+        todo = Todo.objects.create(user=self.user, title="Focus")
+        with mock.patch.object(get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                session = self.client.post('/api/sessions/start/', {'todo_id': str(todo.id)}, format='json').json()
+                self.client.post(f"/api/sessions/{session['id']}/transition/", {'mode': 'break'}, format='json')
+                self.client.post(f"/api/sessions/{session['id']}/stop/")
+                publish.assert_not_called()
+        self.assertEqual(
+            [call.args[1]['type'] for call in publish.call_args_list],
+            ['session.started', 'session.transition', 'session.stopped'],
+        )
+
+
+class _StubProvider(BaseHTTPRequestHandler):
+    """Answers Ollama /api/chat and Groq /chat/completions like the real APIs."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.calls.append((self.path, self.headers.get('Authorization'), body))
+        self.server.hosts.append(self.headers['Host'])
+        time.sleep(self.server.delay)
+        if 'steps' in body['messages'][0]['content']:
+            content = json.dumps({'steps': [' Outline ', "Write", '', 3]})
+        else:
+            content = json.dumps({'estimated_minutes': 5000})
+        if self.path == '/chat/completions':
+            answer = {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+        else:
+            answer = {'message': {'role': 'assistant', 'content': content}, 'done': True}
+        payload = json.dumps(answer).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and hung up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+# The stub provider listens on loopback
+@override_settings(AI_ALLOW_PRIVATE_OLLAMA=True)
+class AIClientTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubProvider)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        ai.cache.clear()
+        self.server.calls, self.server.hosts, self.server.delay = [], [], 0
+        Profile.objects.filter(user=self.user).update(ai_enabled=True, ollama_url=self.url)
+        self.todo = Todo.objects.create(user=self.user, title="Write report", description="For the board")
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    async def post(self, todo, task):
+        response = await self.async_client.post(f'/api/todos/{todo.id}/ai/{task}/', headers=self.headers)
+        return response.status_code, response.json()
+
+    async def test_ollama_answers_are_parsed_and_cached(self):
+        self.assertEqual(await self.post(self.todo, 'breakdown'), (200, {'steps': ["Outline", "Write"], 'cached': False}))
+        self.assertEqual(await self.post(self.todo, 'breakdown'), (200, {'steps': ["Outline", "Write"], 'cached': True}))
+        self.assertEqual(await self.post(self.todo, 'estimate'), (200, {'estimated_minutes': 1440, 'cached': False}))
+        self.assertEqual(len(self.server.calls), 2)
+        path, _, body = self.server.calls[0]
+        self.assertEqual((path, body['model'], body['stream']), ('/api/chat', 'qwen2.5-coder:1.5b', False))
+        self.assertIn("Write report", body['messages'][1]['content'])
+
+        # Another user's Ollama at the same URL is asked again
+        bob = await User.objects.acreate(username='bob')
+        await Profile.objects.acreate(user=bob, ai_enabled=True, ollama_url=self.url)
+        theirs = await Todo.objects.acreate(user=bob, title="Write report", description="For the board")
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(bob).access_token}'}
+        self.assertEqual((await self.post(theirs, 'estimate'))[1]['cached'], False)
+        self.assertEqual(len(self.server.calls), 3)
+
+    @override_settings(AI_ALLOW_PRIVATE_OLLAMA=False)
+    async def test_requests_connect_to_the_checked_address(self):
+        host = f'ollama.example.com:{self.server.server_port}'
+        await Profile.objects.filter(user=self.user).aupdate(ollama_url=f'http://{host}')
+        checked = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', self.server.server_port))]
+        # Treat the loopback stub as public; a second lookup of the name could rebind it
+        with (
+            mock.patch('api.ai.socket.getaddrinfo', return_value=checked) as lookup,
+            mock.patch.object(ipaddress.IPv4Address, 'is_global', True),
+        ):
+            self.assertEqual((await self.post(self.todo, 'estimate'))[0], 200)
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(self.server.hosts, [host])
+
+    @override_settings(AI_GROQ_URL='http://127.0.0.1:1/unused')
+    async def test_groq_needs_a_key_and_sends_it(self):
+        await Profile.objects.filter(user=self.user).aupdate(ai_provider='groq')
+        self.assertEqual((await self.post(self.todo, 'estimate'))[0], 400)
+        await Profile.objects.filter(user=self.user).aupdate(groq_api_key='gsk_test')
+        with override_settings(AI_GROQ_URL=self.url):
+            self.assertEqual(await self.post(self.todo, 'estimate'), (200, {'estimated_minutes': 1440, 'cached': False}))
+        self.assertEqual(self.server.calls[0][:2], ('/chat/completions', 'Bearer gsk_test'))
+
+    async def test_access_errors(self):
+        other = await Todo.objects.acreate(user=await User.objects.acreate(username='bob'), title="Theirs")
+        self.assertEqual((await self.post(other, 'breakdown'))[0], 404)
+        response = await self.async_client.post(f'/api/todos/{self.todo.id}/ai/breakdown/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual((await self.async_client.get(
+            f'/api/todos/{self.todo.id}/ai/breakdown/', headers=self.headers)).status_code, 405)
+        await Profile.objects.filter(user=self.user).aupdate(ai_enabled=False)
+        self.assertEqual((await self.post(self.todo, 'breakdown'))[0], 403)
+        self.assertEqual(self.server.calls, [])
+
+    @override_settings(AI_ALLOW_PRIVATE_OLLAMA=False)
+    async def test_private_ollama_urls_are_rejected(self):
+        error = {'error': "The Ollama URL must point to a public address"}
+        self.assertEqual(await self.post(self.todo, 'breakdown'), (400, error))
+        self.assertEqual(self.server.calls, [])
+
+        for url in ('file:///etc/passwd', 'http://localhost:11434', 'http://169.254.169.254', 'http://[::ffff:10.0.0.1]'):
+            response = await self.async_client.patch(
+                '/api/auth/profile/settings/', {'ollama_url': url}, content_type='application/json', headers=self.headers
+            )
+            self.assertEqual(response.status_code, 400, url)
+        public = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', 80))]
+        with mock.patch('api.ai.socket.getaddrinfo', return_value=public):
+            response = await self.async_client.patch(
+                '/api/auth/profile/settings/', {'ollama_url': 'http://ollama.example.com'},
+                content_type='application/json', headers=self.headers,
+            )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(AI_USER_CONCURRENCY=2)
+    async def test_requests_in_flight_are_capped_per_user(self):
+        self.server.delay = 0.5
+        todos = [await Todo.objects.acreate(user=self.user, title=f"Task {n}") for n in range(3)]
+        results = await asyncio.gather(*(self.post(todo, 'estimate') for todo in todos))
+        self.assertEqual(sorted(code for code, _ in results), [200, 200, 429])
+        # The slots are released once the answers arrive
+        self.assertEqual((await self.post(todos[0], 'breakdown'))[0], 200)
+
+    @override_settings(AI_TIMEOUT_SECONDS=0.2)
+    async def test_slow_or_missing_provider(self):
+        await ai.close_client()
+        self.server.delay = 1
+        self.assertEqual((await self.post(self.todo, 'estimate'))[0], 504)
+        await Profile.objects.filter(user=self.user).aupdate(ollama_url='http://127.0.0.1:1')
+        self.assertEqual(await self.post(self.todo, 'estimate'), (502, {'error': "The AI provider could not be reached"}))
+        await ai.close_client()
@@ -16,15 +16,25 @@ urlpatterns = [
 
     # Todos
     path('todos/', views.TodoListCreateView.as_view(), name='todo-list'),
+    path('todos/tags/', views.TodoTagListView.as_view(), name='todo-tags'),
     path('todos/<uuid:pk>/', views.TodoDetailView.as_view(), name='todo-detail'),
+    path('todos/<uuid:pk>/sessions/', views.TodoSessionListView.as_view(), name='todo-sessions'),
+    path('todos/<uuid:pk>/ai/breakdown/', views.todo_breakdown, name='todo-ai-breakdown'),
+    path('todos/<uuid:pk>/ai/estimate/', views.todo_estimate, name='todo-ai-estimate'),
 
     # Sessions
     path('sessions/active/', views.SessionActiveView.as_view(), name='session-active'),
+    path('sessions/active/state/', views.SessionActiveStateView.as_view(), name='session-active-state'),
     path('sessions/start/', views.SessionStartView.as_view(), name='session-start'),
     path('sessions/<uuid:pk>/transition/', views.SessionTransitionView.as_view(), name='session-transition'),
+    path('sessions/<uuid:pk>/transitions/', views.SessionTransitionBatchView.as_view(), name='session-transition-batch'),
     path('sessions/<uuid:pk>/stop/', views.SessionStopView.as_view(), name='session-stop'),
+    path('sessions/events/', views.session_events, name='session-events'),
 
     # History
     path('history/daily/', views.DailyHistoryView.as_view(), name='history-daily'),
     path('history/range/', views.RangeHistoryView.as_view(), name='history-range'),
+    path('history/export/', views.HistoryExportView.as_view(), name='history-export'),
+    path('history/import/', views.HistoryImportView.as_view(), name='history-import'),
+    path('history/stats/', views.StatsHistoryView.as_view(), name='history-stats'),
 ]
@@ -0,0 +1,76 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import Profile
+
+
+def get_zone(name):
+    """Return the ZoneInfo for ``name``, or None if it is not a known IANA zone."""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def user_timezone(user):
+    profile = getattr(user, 'profile', None)
+    zone = get_zone(profile.timezone) if profile else None
+    return zone or timezone.get_default_timezone()
+
+
+async def auser_timezone(user):
+    """user_timezone for async views, which cannot load ``user.profile`` lazily."""
+    if type(user).profile.is_cached(user):
+        return user_timezone(user)
+    name = await Profile.objects.filter(user=user).values_list('timezone', flat=True).afirst()
+    return get_zone(name) or timezone.get_default_timezone()
+
+
+def request_timezone(request):
+    """The ``tz`` query parameter if given, otherwise the user's profile timezone."""
+    name = request.query_params.get('tz')
+    if not name:
+        return user_timezone(request.user)
+    zone = get_zone(name)
+    if zone is None:
+        raise ValidationError({'tz': "Unknown timezone"})
+    return zone
+
+
+async def arequest_timezone(request):
+    """request_timezone for async views."""
+    if not request.query_params.get('tz'):
+        return await auser_timezone(request.user)
+    return request_timezone(request)
+
+
+def parse_date(value, param):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValidationError({param: "Invalid date format"})
+
+
+def day_bounds(start_date, end_date, tz):
+    """
+    Half-open [start, end) datetimes covering ``start_date`` through
+    ``end_date`` in ``tz``, so range filters can use a plain column index.
+    """
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def backdate(model, field, stamps):
+    """Set ``field`` from a ``{pk: datetime}`` map; auto_now_add overwrites it on insert."""
+    stamps = list(stamps.items())
+    for offset in range(0, len(stamps), 500):
+        chunk = stamps[offset:offset + 500]
+        model.objects.filter(pk__in=[pk for pk, _ in chunk]).update(**{field: Case(
+            *[When(pk=pk, then=Value(stamp)) for pk, stamp in chunk],
+            output_field=DateTimeField(),
+        )})
@@ -1,12 +1,74 @@
-from datetime import datetime
+import asyncio
+import io
+import itertools
+import json
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q, Sum, prefetch_related_objects
+from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.contrib.auth.models import User
 from rest_framework import generics, status, permissions
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Todo, Session, Segment, Profile
-from .serializers import TodoSerializer, SessionSerializer, SegmentSerializer, UserSerializer, ProfileSerializer
+from .models import Todo, Session, Segment, Profile, segment_duration
+from .serializers import (
+    TodoSerializer, TodoSummarySerializer, SessionSerializer, SegmentSerializer, UserSerializer, ProfileSerializer,
+    TransitionBatchSerializer,
+)
+from .pagination import CreatedKeysetPagination, RankKeysetPagination, StartKeysetPagination
+from .utils import arequest_timezone, day_bounds, parse_date, request_timezone, user_timezone
+from .stats import BREAKDOWNS, BUCKETS, rollup_stats
+from .cache import acached_response
+from .events import get_broker
+from .export import EXPORT_FORMATS, aiter_chunks, export_chunks, export_rows
+from .imports import IMPORT_FORMATS, HistoryImportError, import_history, read_rows
+from .authentication import authenticate_async
+from .ai import AIError, breakdown_todo, estimate_todo
+from .archive import archive_cutoff, attach_archived_segments, iter_archived_segments
+from .rollups import apply_segments, archived_segment_rows, atotal_focus_seconds, closed_segment_rows, rebuild_rollups
+from .streaks import astreaks, rebuild_active_days, refresh_active_days
+from .tags import filter_by_tags, tag_totals
+from .search import search_todos
+from .deletion import request_deletion
+from .services import SessionError, apply_transitions, start_session, stop_session, transition_session
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, so an ASGI worker serves them
+    without holding a thread while they wait on the database. Authentication,
+    permissions and throttling may query, so they run on the request's sync
+    thread first; handlers must then use the async ORM.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch, awaiting the handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
 
 # Auth Views
 class RegisterView(generics.CreateAPIView):
@@ -24,18 +86,35 @@ class RegisterView(generics.CreateAPIView):
         Profile.objects.create(user=user)
         serializer.instance = user
 
-class ProfileView(generics.RetrieveAPIView):
-    serializer_class = UserSerializer
-    def get_object(self):
-        return self.request.user
+class ProfileView(AsyncAPIView):
+    async def get(self, request):
+        user = request.user
+        user.profile = (await Profile.objects.aget_or_create(user=user))[0]
+        tz = user_timezone(user)
+
+        async def build():
+            current, longest = await astreaks(user, tz)
+            user.profile_stats = {
+                'current_streak': current,
+                'longest_streak': longest,
+                'total_focus_seconds': await atotal_focus_seconds(user),
+            }
+            return dict(UserSerializer(user).data)
+
+        # The streak depends on the local date as well as on stored data
+        today = timezone.localdate(timezone=tz)
+        return await acached_response(request, 'profile', {'today': today}, build)
 
 class DeleteAccountView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request):
-        user = request.user
-        user.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        # Deactivated now; process_account_deletions removes the data in batches
+        deletion = request_deletion(request.user)
+        return Response(
+            {"status": "pending", "requested_at": deletion.requested_at},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
 class ProfileUpdateView(generics.RetrieveUpdateAPIView):
     serializer_class = ProfileSerializer
@@ -44,19 +123,104 @@ class ProfileUpdateView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return Profile.objects.get_or_create(user=self.request.user)[0]
 
+    def perform_update(self, serializer):
+        previous_timezone = serializer.instance.timezone
+        profile = serializer.save()
+        if profile.timezone != previous_timezone:
+            # Rollups and streak days are keyed by the user's local day
+            user = self.request.user
+            user.profile = profile
+            rebuild_rollups(user)
+            rebuild_active_days(user)
+
 # Todo Views
+def session_queryset():
+    return Session.objects.with_totals().prefetch_related(
+        Prefetch('segments', queryset=Segment.objects.order_by('start_at'))
+    )
+
+def todo_queryset(user):
+    # Fixed query plan: todos with focus totals, then one query each for
+    # the sessions (with their totals) and the segments
+    return Todo.objects.filter(user=user).with_focus_totals().prefetch_related(
+        Prefetch('sessions', queryset=session_queryset().order_by('created_at'))
+    )
+
 class TodoListCreateView(generics.ListCreateAPIView):
     serializer_class = TodoSerializer
+    pagination_class = CreatedKeysetPagination
+
+    def is_summary(self):
+        return self.request.method == 'GET' and self.request.query_params.get('view') == 'summary'
+
+    def search_text(self):
+        return self.request.query_params.get('q', '').strip() if self.request.method == 'GET' else ''
+
+    @property
+    def paginator(self):
+        # Search results page by rank rather than by creation time
+        if not hasattr(self, '_paginator'):
+            self._paginator = RankKeysetPagination() if self.search_text() else self.pagination_class()
+        return self._paginator
+
+    def get_serializer_class(self):
+        return TodoSummarySerializer if self.is_summary() else TodoSerializer
+
     def get_queryset(self):
-        return Todo.objects.filter(user=self.request.user).order_by('-created_at')
+        if self.is_summary():
+            queryset = Todo.objects.filter(user=self.request.user).with_focus_totals().annotate(
+                session_count=Count('sessions', distinct=True),
+                last_session_at=Max('sessions__created_at'),
+            )
+        else:
+            queryset = todo_queryset(self.request.user)
+        queryset = filter_by_tags(queryset, self.request.user, self.request.query_params.getlist('tag'))
+        if self.search_text():
+            return search_todos(queryset, self.search_text(), self.request.user).order_by('-search_rank', 'id')
+        return queryset.order_by('-created_at', 'id')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class TodoTagListView(APIView):
+    """Each of the user's tags with its todo count and focus time, optionally on local days ``start``..``end``."""
+
+    def get(self, request):
+        start = parse_date(request.query_params['start'], 'start') if 'start' in request.query_params else None
+        end = parse_date(request.query_params['end'], 'end') if 'end' in request.query_params else None
+        return Response(tag_totals(request.user, start, end))
+
 class TodoDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = TodoSerializer
     def get_queryset(self):
-        return Todo.objects.filter(user=self.request.user)
+        return todo_queryset(self.request.user)
+
+    def perform_destroy(self, instance):
+        # The todo's segments go with it, so take them out of the user's totals and streak days
+        user = self.request.user
+        segments = Segment.objects.filter(session__todo=instance)
+        archived = list(archived_segment_rows(user, Session.objects.filter(todo=instance)))
+        focus_days = list(segments.filter(mode='focus').values_list('start_at', flat=True))
+        focus_days += [start_at for _, mode, _, start_at, _ in archived if mode == 'focus']
+        with transaction.atomic():
+            apply_segments(user, [*closed_segment_rows(segments), *archived], sign=-1)
+            instance.delete()
+        refresh_active_days(user, focus_days)
+
+class TodoSessionListView(generics.ListAPIView):
+    serializer_class = SessionSerializer
+    pagination_class = CreatedKeysetPagination
+
+    def get_queryset(self):
+        todo = get_object_or_404(Todo, id=self.kwargs['pk'], user=self.request.user)
+        return session_queryset().filter(todo=todo).order_by('-created_at', 'id')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        sessions = attach_archived_segments(request.user, page if page is not None else list(queryset))
+        data = self.get_serializer(sessions, many=True).data
+        return self.get_paginated_response(data) if page is not None else Response(data)
 
 # Session Views
 class SessionStartView(APIView):
@@ -70,27 +234,59 @@ class SessionStartView(APIView):
         except Todo.DoesNotExist:
             return Response({"error": "Todo not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Constraint: Only 1 active session per user
-        active_sessions = Session.objects.filter(user=request.user, status='active')
-        if active_sessions.exists():
-            return Response({"error": "Another session is already active"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = start_session(request.user, todo)
+        except SessionError as e:
+            return Response({"error": e.message}, status=e.status_code)
 
-        now = timezone.now()
-        session = Session.objects.create(user=request.user, todo=todo, created_at=now, status='active')
-        
-        # Create first focus segment
-        Segment.objects.create(session=session, mode='focus', start_at=now)
-        
+        # One segment query for the list and both totals
+        prefetch_related_objects([session], 'segments')
         return Response(SessionSerializer(session).data, status=status.HTTP_201_CREATED)
 
-class SessionActiveView(APIView):
+class SessionActiveView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            session = await Session.objects.prefetch_related('segments').aget(user=request.user, status='active')
+        except Session.DoesNotExist:
+            return Response(None, status=status.HTTP_204_NO_CONTENT)
+        return Response(SessionSerializer(session).data)
+
+class SessionActiveStateView(APIView):
+    """Compact live-timer state for polling: one indexed read, no segment scans."""
+
     def get(self, request):
         try:
-            session = Session.objects.get(user=request.user, status='active')
-            return Response(SessionSerializer(session).data)
+            state = Session.objects.filter(user=request.user, status='active').values(
+                'id', 'todo_id', 'created_at', 'focus_time', 'pause_time', 'current_segment_id',
+                'current_segment__mode', 'current_segment__reason', 'current_segment__start_at'
+            ).get()
         except Session.DoesNotExist:
             return Response(None, status=status.HTTP_204_NO_CONTENT)
 
+        now = timezone.now()
+        mode = state['current_segment__mode']
+        start_at = state['current_segment__start_at']
+        focus_time, pause_time = state['focus_time'], state['pause_time']
+        if start_at:
+            live = max(timedelta(0), now - start_at)
+            if mode == 'focus':
+                focus_time += live
+            else:
+                pause_time += live
+
+        return Response({
+            "id": state['id'],
+            "todo_id": state['todo_id'],
+            "created_at": state['created_at'],
+            "segment_id": state['current_segment_id'],
+            "mode": mode,
+            "reason": state['current_segment__reason'],
+            "start_at": start_at,
+            "focus_seconds": int(focus_time.total_seconds()),
+            "pause_seconds": int(pause_time.total_seconds()),
+            "server_time": now,
+        })
+
 class SessionTransitionView(APIView):
     def post(self, request, pk):
         try:
@@ -101,23 +297,36 @@ class SessionTransitionView(APIView):
         mode = request.data.get('mode')
         reason = request.data.get('reason', 'manual')
 
-        if mode not in ['focus', 'pause', 'break']:
-            return Response({"error": "Invalid mode"}, status=status.HTTP_400_BAD_REQUEST)
-
-        now = timezone.now()
-        
-        # Close open segments
-        open_segments = Segment.objects.filter(session=session, end_at__isnull=True)
-        if not open_segments.exists():
-             return Response({"error": "No open segment found to transition from"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        open_segments.update(end_at=now)
-
-        # Create new segment
-        new_segment = Segment.objects.create(session=session, mode=mode, start_at=now, reason=reason)
+        try:
+            new_segment = transition_session(request.user, session, mode, reason)
+        except SessionError as e:
+            return Response({"error": e.message}, status=e.status_code)
         
         return Response(SegmentSerializer(new_segment).data, status=status.HTTP_201_CREATED)
 
+class SessionTransitionBatchView(APIView):
+    """Apply an ordered, timestamped batch of transitions queued by an offline or bursty client."""
+
+    def post(self, request, pk):
+        try:
+            session = Session.objects.get(id=pk, user=request.user, status='active')
+        except Session.DoesNotExist:
+            return Response({"error": "Active session not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = TransitionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            segments, duplicates = apply_transitions(request.user, session, serializer.validated_data['transitions'])
+        except SessionError as e:
+            return Response({"error": e.message, "errors": e.errors}, status=e.status_code)
+
+        return Response({
+            "applied": len(segments),
+            "duplicates": duplicates,
+            "segments": SegmentSerializer(segments, many=True).data,
+        }, status=status.HTTP_201_CREATED if segments else status.HTTP_200_OK)
+
 class SessionStopView(APIView):
     def post(self, request, pk):
         try:
@@ -125,21 +334,17 @@ class SessionStopView(APIView):
         except Session.DoesNotExist:
             return Response({"error": "Active session not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        now = timezone.now()
-        
-        # Close open segments
-        Segment.objects.filter(session=session, end_at__isnull=True).update(end_at=now)
-        
-        # End session
-        session.status = 'ended'
-        session.ended_at = now
-        session.save()
-        
+        try:
+            session = stop_session(request.user, session)
+        except SessionError as e:
+            return Response({"error": e.message}, status=e.status_code)
+
+        prefetch_related_objects([session], 'segments')
         return Response(SessionSerializer(session).data)
 
 # History Views
-class DailyHistoryView(APIView):
-    def get(self, request):
+class DailyHistoryView(AsyncAPIView):
+    async def get(self, request):
         date_str = request.query_params.get('date')
         if not date_str:
             return Response({"error": "date param is required (YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
@@ -149,43 +354,339 @@ class DailyHistoryView(APIView):
         except ValueError:
             return Response({"error": "Invalid date format"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # The user's local day, as bounds on the raw column rather than a __date lookup
+        tz = await arequest_timezone(request)
+        day_start, day_end = day_bounds(target_date, target_date, tz)
         sessions = Session.objects.filter(
             user=request.user, 
-            created_at__date=target_date
-        ).prefetch_related('segments', 'todo')
-        
-        # Group by todo
-        # Standard approach: return list of sessions which already have nested segments and todo info.
-        # Requirements ask for: "returns sessions + segments grouped by todo with computed durations"
-        
-        serializer = SessionSerializer(sessions, many=True)
+            created_at__gte=day_start,
+            created_at__lt=day_end
+        )
+
+        group = request.query_params.get('group')
+
+        async def build():
+            if group == 'todo':
+                return {
+                    "date": date_str,
+                    "timezone": str(tz),
+                    **await self.grouped_by_todo(sessions, day_start)
+                }
+
+            # Flat mode: sessions with nested segments, grouped by the client
+            rows = [session async for session in sessions.with_totals().prefetch_related('segments')]
+            if any(session.archived for session in rows):
+                await sync_to_async(attach_archived_segments)(request.user, rows)
+            return {
+                "date": date_str,
+                "timezone": str(tz),
+                "results": SessionSerializer(rows, many=True).data
+            }
+
+        # A past day only changes through writes, which invalidate the cache; while
+        # a session that started by then is still running its durations keep growing
+        settled = day_end <= timezone.now() and not await Session.objects.filter(
+            user=request.user, status='active', created_at__lt=day_end
+        ).aexists()
+        if not settled:
+            return Response(await build())
+        return await acached_response(request, 'daily', {'date': date_str, 'tz': str(tz), 'group': group or ''}, build)
+
+    async def grouped_by_todo(self, sessions, day_start):
+        # Per-todo, per-mode totals in one aggregate query; open segments count up to now
+        now = timezone.now()
+        duration = segment_duration(now=now)
+        segments = Segment.objects.filter(session__in=sessions.values('id'))
+        rows = segments.values('session__todo', 'session__todo__title').annotate(
+            focus_seconds=Sum(duration, filter=Q(mode='focus')),
+            pause_seconds=Sum(duration, filter=Q(mode='pause')),
+            break_seconds=Sum(duration, filter=Q(mode='break')),
+            session_count=Count('session', distinct=True),
+            segment_count=Count('id'),
+        ).order_by('session__todo__title')
+
+        totals = {'focus_seconds': 0, 'pause_seconds': 0, 'break_seconds': 0}
+        todos = {}
+        async for row in rows:
+            todos[row['session__todo']] = {
+                'todo_id': row['session__todo'],
+                'title': row['session__todo__title'],
+                'session_count': row['session_count'],
+                'segment_count': row['segment_count'],
+                **{field: row[field] or timedelta(0) for field in totals},
+            }
+
+        # Archived sessions have no segment rows; add theirs from the archive.
+        # Only past months are ever archived.
+        archived = []
+        if day_start < archive_cutoff(0):
+            archived = [session async for session in sessions.filter(archived=True).select_related('todo')]
+        if archived:
+            await sync_to_async(attach_archived_segments)(self.request.user, archived)
+        archived_timeline = []
+        for session in archived:
+            archived_segments = session.segments.all()
+            if not archived_segments:
+                continue
+            todo = todos.setdefault(session.todo_id, {
+                'todo_id': session.todo_id,
+                'title': session.todo.title,
+                'session_count': 0,
+                'segment_count': 0,
+                **dict.fromkeys(totals, timedelta(0)),
+            })
+            todo['session_count'] += 1
+            for seg in archived_segments:
+                todo['segment_count'] += 1
+                todo[f'{seg.mode}_seconds'] += seg.end_at - seg.start_at
+                archived_timeline.append((session.todo_id, seg))
+
+        todos = sorted(todos.values(), key=lambda todo: todo['title'])
+        for todo in todos:
+            for field in totals:
+                todo[field] = int(todo[field].total_seconds())
+                totals[field] += todo[field]
+
+        # Compact timeline: one row per segment, no nested serializers
+        timeline = [
+            {
+                'todo_id': todo_id,
+                'session_id': session_id,
+                'mode': mode,
+                'reason': reason,
+                'start_at': start_at,
+                'end_at': end_at,
+            }
+            async for session_id, todo_id, mode, reason, start_at, end_at in segments.order_by('start_at').values_list(
+                'session_id', 'session__todo_id', 'mode', 'reason', 'start_at', 'end_at'
+            )
+        ]
+        if archived_timeline:
+            timeline += [
+                {
+                    'todo_id': todo_id,
+                    'session_id': seg.session_id,
+                    'mode': seg.mode,
+                    'reason': seg.reason,
+                    'start_at': seg.start_at,
+                    'end_at': seg.end_at,
+                }
+                for todo_id, seg in archived_timeline
+            ]
+            timeline.sort(key=lambda row: row['start_at'])
+        return {"totals": totals, "todos": todos, "timeline": timeline}
+
+class StatsHistoryView(APIView):
+    def get(self, request):
+        # Rollups are keyed by the profile's local day, so there is no ?tz= override here
+        tz = user_timezone(request.user)
+        today = timezone.localdate(timezone=tz)
+        end = parse_date(request.query_params['end'], 'end') if 'end' in request.query_params else today
+        start = (
+            parse_date(request.query_params['start'], 'start') if 'start' in request.query_params
+            else end - timedelta(days=29)
+        )
+        bucket = request.query_params.get('bucket', 'day')
+        by = request.query_params.get('by') or None
+
+        if bucket not in BUCKETS:
+            return Response({"error": f"bucket must be one of {', '.join(BUCKETS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if by is not None and by not in BREAKDOWNS:
+            return Response({"error": f"by must be one of {', '.join(BREAKDOWNS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({"error": "start must not be after end"}, status=status.HTTP_400_BAD_REQUEST)
+
         return Response({
-            "date": date_str,
-            "timezone": timezone.get_current_timezone_name(),
-            "results": serializer.data
+            "start": start,
+            "end": end,
+            "bucket": bucket,
+            "by": by,
+            "timezone": str(tz),
+            **rollup_stats(request.user, start, end, bucket, by, request.query_params.getlist('tag'))
         })
 
-class RangeHistoryView(generics.ListAPIView):
-    serializer_class = SegmentSerializer
+class RangeHistoryView(AsyncAPIView):
+    pagination_class = StartKeysetPagination
 
-    def get_queryset(self):
+    def get_queryset(self, tz):
         start_str = self.request.query_params.get('start')
         end_str = self.request.query_params.get('end')
         mode = self.request.query_params.get('mode')
         reason = self.request.query_params.get('reason')
         todo_id = self.request.query_params.get('todo_id')
 
-        queryset = Segment.objects.filter(session__user=self.request.user)
+        queryset = Segment.objects.filter(session__user=self.request.user).select_related('session')
 
+        # Dates are inclusive local days in the requested timezone
+        self.start_at = self.end_at = None
         if start_str:
-            queryset = queryset.filter(start_at__date__gte=start_str)
+            start_date = parse_date(start_str, 'start')
+            self.start_at = day_bounds(start_date, start_date, tz)[0]
+            queryset = queryset.filter(start_at__gte=self.start_at)
         if end_str:
-            queryset = queryset.filter(start_at__date__lte=end_str)
+            end_date = parse_date(end_str, 'end')
+            self.end_at = day_bounds(end_date, end_date, tz)[1]
+            queryset = queryset.filter(start_at__lt=self.end_at)
         if mode:
             queryset = queryset.filter(mode=mode)
         if reason:
             queryset = queryset.filter(reason=reason)
         if todo_id:
             queryset = queryset.filter(session__todo_id=todo_id)
+        queryset = filter_by_tags(queryset, self.request.user, self.request.query_params.getlist('tag'), 'session__todo__')
+
+        return queryset.order_by('-start_at', 'id')
+
+    def archived_segments(self, paginator=None):
+        """
+        The archived segments the queryset's filters would match, newest
+        first; with a ``paginator``, just those that can be on its page.
+        """
+        user, params = self.request.user, self.request.query_params
+        sessions = Session.objects.filter(user=user)
+        if params.get('todo_id'):
+            sessions = sessions.filter(todo_id=params['todo_id'])
+        sessions = filter_by_tags(sessions, user, params.getlist('tag'), 'todo__')
+
+        end_at = self.end_at
+        if paginator is not None and paginator.cursor:
+            # Nothing past the cursor starts later than its row
+            after_cursor = paginator.cursor[0] + timedelta(microseconds=1)
+            end_at = min(end_at, after_cursor) if end_at else after_cursor
+        segments = (
+            seg for seg in iter_archived_segments(user, sessions, self.start_at, end_at, newest_first=True)
+            if params.get('mode') in (None, '', seg.mode) and params.get('reason') in (None, '', seg.reason)
+        )
+        if paginator is None:
+            return list(segments)
+        return list(itertools.islice(filter(paginator.follows, segments), paginator.page_size + 1))
+
+    async def get(self, request):
+        queryset = self.get_queryset(await arequest_timezone(request))
+        paginator = self.pagination_class()
+        page = paginator.page_queryset(queryset, request)
+        if page is not None:
+            # Merge the page's worth of live and archived rows, then cut the page
+            rows = [segment async for segment in page] + await sync_to_async(self.archived_segments)(paginator)
+            page = paginator.set_page(paginator.sort(rows))
+            return paginator.get_paginated_response(SegmentSerializer(page, many=True).data)
+        rows = [segment async for segment in queryset.aiterator(chunk_size=2000)]
+        rows = paginator.sort(rows + await sync_to_async(self.archived_segments)())
+        return Response(SegmentSerializer(rows, many=True).data)
+
+class HistoryExportView(APIView):
+    """
+    Stream the user's full segment history as NDJSON (default) or CSV with
+    ``?type=csv``, optionally limited to local days ``start``..``end``.
+    """
+
+    def get(self, request):
+        fmt = request.query_params.get('type', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": f"type must be one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        tz = request_timezone(request)
+        start_at = end_at = None
+        if 'start' in request.query_params:
+            start_date = parse_date(request.query_params['start'], 'start')
+            start_at = day_bounds(start_date, start_date, tz)[0]
+        if 'end' in request.query_params:
+            end_date = parse_date(request.query_params['end'], 'end')
+            end_at = day_bounds(end_date, end_date, tz)[1]
+
+        chunks = export_chunks(export_rows(request.user, start_at, end_at), fmt)
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="primetime-history.{fmt}"'
+        return response
+
+class HistoryImportView(APIView):
+    """
+    Create todos and past sessions from an uploaded NDJSON or CSV ``file`` in
+    the history/export/ layout. The type comes from ``?type=`` or the file
+    extension. All-or-nothing: any invalid row fails the whole upload.
+    """
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('type') or upload.name.rsplit('.', 1)[-1].lower()
+        if fmt not in IMPORT_FORMATS:
+            return Response({"error": f"type must be one of: {', '.join(IMPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            created = import_history(request.user, read_rows(stream, fmt))
+        except HistoryImportError as e:
+            return Response({"error": "Import failed", "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"error": "file must be UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(created, status=status.HTTP_201_CREATED)
+
+# Live Events
+SSE_KEEPALIVE_SECONDS = 15
+
+async def session_events(request):
+    """
+    Server-sent events for the user's session start/transition/stop, so other
+    devices need not poll sessions/active/. Needs an ASGI worker: each open
+    stream is an idle coroutine rather than a blocked worker.
+    """
+    user = await authenticate_async(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    async def stream():
+        async with get_broker().subscribe(user.id) as queue:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line so proxies keep the connection open
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# AI Views
+async def _todo_ai_response(request, pk, task):
+    user = await authenticate_async(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
+    profile = (await Profile.objects.aget_or_create(user=user))[0]
+    if not profile.ai_enabled:
+        return JsonResponse({"error": "AI features are turned off in your settings"}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        todo = await Todo.objects.aget(pk=pk, user=user)
+    except Todo.DoesNotExist:
+        return JsonResponse({"error": "Todo not found"}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        return JsonResponse(await task(profile, todo))
+    except AIError as exc:
+        return JsonResponse({"error": exc.message}, status=exc.status_code)
+
+
+@csrf_exempt
+@require_POST
+async def todo_breakdown(request, pk):
+    """
+    Ask the user's AI provider to split a todo into steps. Async so a slow
+    provider holds a coroutine rather than a whole worker.
+    """
+    return await _todo_ai_response(request, pk, breakdown_todo)
+
 
-        return queryset.order_by('-start_at')
+@csrf_exempt
+@require_POST
+async def todo_estimate(request, pk):
+    """Ask the user's AI provider how many focus minutes a todo needs."""
+    return await _todo_ai_response(request, pk, estimate_todo)
@@ -41,9 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestProfilingMiddleware',  # No-op unless REQUEST_PROFILING
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', # Add Whitenoise here
+    'api.middleware.StaticFilesMiddleware',  # WhiteNoise, async-capable
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,6 +72,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -83,6 +85,14 @@ DATABASES = {
     )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # SQLite has no row locks: take the write lock when a transaction begins so
+    # concurrent session changes queue up (for up to ``timeout`` seconds)
+    # instead of interleaving. Threaded tests need a file-backed test database,
+    # since the shared in-memory one fails fast on locks rather than waiting.
+    DATABASES['default'].setdefault('OPTIONS', {}).update({'transaction_mode': 'IMMEDIATE', 'timeout': 20})
+    DATABASES['default']['TEST'] = {'NAME': str(BASE_DIR / 'test_db.sqlite3')}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,6 +137,63 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared store
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'primetime'),
+    }
+}
+
+# Seconds a cached profile/history response is kept; writes invalidate it sooner
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', '300'))
+
+# Seconds an authenticated user is cached between requests; saving or deleting
+# the user drops the entry sooner
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '60'))
+
+# Ended sessions created before the start of the UTC month this many months
+# back have their segments packed into per-month archives by archive_segments
+SEGMENT_ARCHIVE_MONTHS = int(os.getenv('SEGMENT_ARCHIVE_MONTHS', '6'))
+
+# Stopped sessions are compacted: back-to-back segments of one mode and reason
+# merge, leaving every total as it was. With the default of 0, idle/hidden
+# flapping (a short pause between two focus segments) is NOT absorbed: that
+# would move its time into focus, and per-mode totals must stay exact. Opt-in:
+# a positive value absorbs segments shorter than this many seconds between two
+# of one mode, trading exact per-mode totals for fewer rows
+SEGMENT_COMPACTION_GAP_SECONDS = float(os.getenv('SEGMENT_COMPACTION_GAP_SECONDS', '0'))
+
+# Session event fanout for the SSE stream; the in-process broker only reaches
+# clients connected to the same worker process
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'api.events.InProcessBroker')
+
+# AI providers: one pooled HTTP client per worker, a per-user cap on requests
+# in flight, and an in-process LRU of answers keyed on provider, model and prompt
+AI_GROQ_URL = os.getenv('AI_GROQ_URL', 'https://api.groq.com/openai/v1')
+AI_TIMEOUT_SECONDS = float(os.getenv('AI_TIMEOUT_SECONDS', '30'))
+AI_CONNECT_TIMEOUT_SECONDS = float(os.getenv('AI_CONNECT_TIMEOUT_SECONDS', '5'))
+AI_MAX_CONNECTIONS = int(os.getenv('AI_MAX_CONNECTIONS', '50'))
+AI_USER_CONCURRENCY = int(os.getenv('AI_USER_CONCURRENCY', '2'))
+AI_CACHE_SIZE = int(os.getenv('AI_CACHE_SIZE', '512'))
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', '3600'))
+# Ollama URLs are user settings, so by default they must resolve to public
+# addresses; set this for a self-hosted Ollama on localhost or a private network
+AI_ALLOW_PRIVATE_OLLAMA = os.getenv('AI_ALLOW_PRIVATE_OLLAMA', 'False') == 'True'
+
+# Request profiling: Server-Timing headers and JSON log lines on api.requests
+# for a sample of requests and for every slow one. REQUEST_PROFILING_CAPTURE
+# takes comma-separated path regexes whose sampled requests are also profiled
+# (cprofile, or pyinstrument if installed) into REQUEST_PROFILING_DIR
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False') == 'True'
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', '0.1'))
+REQUEST_PROFILING_SLOW_MS = float(os.getenv('REQUEST_PROFILING_SLOW_MS', '500'))
+REQUEST_PROFILING_CAPTURE = [p for p in os.getenv('REQUEST_PROFILING_CAPTURE', '').split(',') if p]
+REQUEST_PROFILING_ENGINE = os.getenv('REQUEST_PROFILING_ENGINE', 'cprofile')
+REQUEST_PROFILING_DIR = os.getenv('REQUEST_PROFILING_DIR', str(BASE_DIR / 'profiles'))
+
 # Logging — print errors to console so Railway/Render logs show them
 LOGGING = {
     'version': 1,
@@ -142,6 +209,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'api.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -149,7 +221,7 @@ LOGGING = {
 # DRF Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',